@@ -29,9 +29,11 @@ def render_about():
     with st.expander("Privacy", expanded=False):
         st.markdown(
             """
-- Your text is processed **locally** on your device to detect bias, so nothing is uploaded or stored.
+- Bias detection runs **locally**; your text leaves the app only when it is sent to Gemini for explanations.
 - Explanations are generated by **Google Gemini** using an API key set by the host or app environment.
-- No personal data is collected or saved.
+- Gemini's answers are cached by the host under a hash of the text they explain, and are only shown again for that same text.
+- If the host turns on near-duplicate matching, only fingerprints of ads and per-paragraph results are kept, never the ad itself, and a paragraph's results are only shown for a paragraph with exactly the same wording.
+- No personal data is collected.
             """
         )
 
@@ -0,0 +1,5 @@
+"""
+Benchmarks for the Bias Detector detection hot path.
+
+Run with ``python -m benchmarks`` from the project root.
+"""
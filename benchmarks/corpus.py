@@ -0,0 +1,125 @@
+"""
+Seeded generator of synthetic job ads for benchmarking the detectors.
+
+Ads are built from neutral filler sentences plus bias terms taken from the
+DEFAULT_LEXICON phrases and from strings sampled out of the RULES regexes,
+with optional negations ("not young") and EOE statements mixed in. The same
+seed always produces the same text.
+"""
+import random
+
+try:
+    from re import _constants as _sre, _parser as _re_parser  # Python 3.11+
+except ImportError:  # pragma: no cover - older Pythons
+    import sre_constants as _sre
+    import sre_parse as _re_parser
+
+from biasdetector.detection import DEFAULT_LEXICON, RULES
+
+FILLER = [
+    "You will own the quarterly sales pipeline and report to the regional manager.",
+    "Responsibilities include preparing proposals, negotiating contracts and closing deals.",
+    "We offer flexible working, a learning budget and an employee share scheme.",
+    "The role is based in our city office with two remote days per week.",
+    "You will collaborate closely with marketing, product and customer success.",
+    "Experience with CRM tools such as Salesforce or HubSpot is an advantage.",
+    "Our team supports more than 400 clients across the hospitality sector.",
+    "Strong written and spoken communication skills are essential.",
+    "Applications close at the end of the month; interviews run on a rolling basis.",
+    "Salary is competitive and reviewed every year alongside performance bonuses.",
+    "You will mentor junior colleagues and contribute to team initiatives.",
+    "The position involves occasional travel to client sites within the state.",
+]
+OPENERS = ["We are looking for a", "The ideal candidate is a", "Join us as a", "We want someone who is a"]
+NEGATIONS = ["not", "no", "without"]
+EOE_STATEMENTS = [
+    "We are an equal opportunity employer and welcome applications from all backgrounds.",
+    "Reasonable accommodation is available throughout the recruitment process.",
+]
+# Unicode dashes exercise _normalize_hyphens.
+DASHES = ["‐", "‑", "–", "—"]
+
+_CATEGORY_CHARS = {
+    _sre.CATEGORY_SPACE: " ", _sre.CATEGORY_NOT_SPACE: "a",
+    _sre.CATEGORY_DIGIT: "1", _sre.CATEGORY_NOT_DIGIT: "a",
+    _sre.CATEGORY_WORD: "a", _sre.CATEGORY_NOT_WORD: " ",
+}
+
+
+def _sample(items, rng: random.Random, out: list):
+    # Walks a parsed regex and appends one matching string to `out`.
+    for op, av in items:
+        if op is _sre.LITERAL:
+            out.append(chr(av))
+        elif op is _sre.NOT_LITERAL:
+            out.append("x" if chr(av) != "x" else "y")
+        elif op is _sre.ANY:
+            out.append("a")
+        elif op is _sre.IN:
+            choices = []
+            for iop, iav in av:
+                if iop is _sre.LITERAL:
+                    choices.append(chr(iav))
+                elif iop is _sre.RANGE:
+                    choices.append(chr(iav[0]))
+                elif iop is _sre.CATEGORY:
+                    choices.append(_CATEGORY_CHARS.get(iav, "a"))
+            out.append(rng.choice(choices or ["a"]))
+        elif op is _sre.BRANCH:
+            _sample(rng.choice(av[1]), rng, out)
+        elif op is _sre.SUBPATTERN:
+            _sample(av[-1], rng, out)
+        elif op in (_sre.MAX_REPEAT, _sre.MIN_REPEAT):
+            lo, hi, sub = av
+            for _ in range(rng.randint(lo, min(hi, lo + 1))):
+                _sample(sub, rng, out)
+        # AT (anchors/boundaries), lookarounds and group references add no text.
+
+
+def sample_pattern(pattern: str, rng: random.Random) -> str:
+    """Returns one string that matches `pattern` (enough for the simple RULES regexes)."""
+    out = []
+    _sample(_re_parser.parse(pattern), rng, out)
+    return "".join(out)
+
+
+def bias_terms(rng: random.Random, variants: int = 3) -> list:
+    """All lexicon phrases plus a few sampled strings per RULES/lexicon pattern."""
+    terms = []
+    for cfg in DEFAULT_LEXICON.values():
+        terms.extend(cfg.get("phrases", []))
+        for pat in cfg.get("patterns", []):
+            terms.extend(sample_pattern(pat, rng) for _ in range(variants))
+    for rule in RULES:
+        terms.extend(sample_pattern(rule["regex"], rng) for _ in range(variants))
+    return terms
+
+
+def generate_ad(size_bytes: int, density: float = 0.2, negation_rate: float = 0.1,
+                eoe: bool = False, seed: int = 0) -> str:
+    """
+    This function builds one synthetic ad of roughly `size_bytes` UTF-8 bytes.
+    - `density` is the share of sentences that carry a bias term.
+    - `negation_rate` is the share of those terms preceded by a negation.
+    - `eoe` appends an equal-opportunity statement (rule hits in its own sentence are skipped).
+    """
+    rng = random.Random(seed)
+    terms = bias_terms(rng)
+    parts = []
+    size = 0
+    sentences = 0
+    while size < size_bytes:
+        if rng.random() < density:
+            term = rng.choice(terms)
+            if rng.random() < negation_rate:
+                term = f"{rng.choice(NEGATIONS)} {term}"
+            sentence = f"{rng.choice(OPENERS)} {term} {rng.choice(DASHES)} {rng.choice(FILLER)}"
+        else:
+            sentence = rng.choice(FILLER)
+        sentences += 1
+        sep = "\n\n" if sentences % 5 == 0 else " "
+        parts.append(sentence + sep)
+        size += len(sentence.encode("utf-8")) + len(sep)
+    if eoe:
+        parts.append(rng.choice(EOE_STATEMENTS))
+    return "".join(parts)
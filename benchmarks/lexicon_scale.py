@@ -0,0 +1,72 @@
+"""
+Lexicon-size scaling check.
+
+Builds synthetic lexicons of growing size and reports, for each one, the
+time to compile the engine from scratch, the time to load it back from a
+saved index, and the lexicon matching throughput on a fixed ad. Matching
+should stay roughly flat as the term count grows.
+
+    python -m benchmarks.lexicon_scale --terms 10,1000,10000,30000
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from biasdetector.detection import _MatchEngine, _normalize_hyphens, find_bias_lexicon, register_engine
+
+from .corpus import generate_ad
+from .run import parse_size
+
+_SYLLABLES = ["ba", "ko", "ri", "tan", "mel", "zu", "dor", "fi", "gra", "lop", "en", "st", "qu", "vy"]
+
+
+def synthetic_lexicon(n_terms: int, seed: int = 0, categories: int = 10) -> dict:
+    """Returns a lexicon with about `n_terms` made-up one- and two-word phrases."""
+    rng = random.Random(seed)
+
+    def word():
+        return "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+    per_cat = max(1, n_terms // categories)
+    return {
+        f"category {c}": {
+            "phrases": [word() + (" " + word() if rng.random() < 0.5 else "") for _ in range(per_cat)],
+            "patterns": [],
+        }
+        for c in range(categories)
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.lexicon_scale", description="Time matching as the lexicon grows.")
+    parser.add_argument("--terms", default="10,1000,10000,30000", help="Comma-separated term counts.")
+    parser.add_argument("--size", default="1MB", help="Ad size to match against (default: 1MB).")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    text = _normalize_hyphens(generate_ad(parse_size(args.size), seed=args.seed))
+    nbytes = len(text.encode("utf-8"))
+    print(f"{'terms':>8} {'build s':>9} {'load s':>9} {'match MB/s':>11}")
+    for n in [int(t) for t in args.terms.split(",") if t.strip()]:
+        lexicon = synthetic_lexicon(n, seed=args.seed)
+        t0 = time.perf_counter()
+        engine = _MatchEngine([], lexicon)
+        build = time.perf_counter() - t0
+
+        blob = json.dumps(engine.to_index())
+        t0 = time.perf_counter()
+        engine = _MatchEngine.from_index(json.loads(blob))
+        load = time.perf_counter() - t0
+
+        register_engine(lexicon, engine)
+        t0 = time.perf_counter()
+        find_bias_lexicon(text, lexicon)
+        match = time.perf_counter() - t0
+        print(f"{n:>8} {build:>9.3f} {load:>9.3f} {nbytes / (1024 ** 2) / match:>11.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""
+Benchmark runner for the detection hot path.
+
+Each stage (_normalize_hyphens, find_bias_lexicon, find_bias_rules,
+build_highlighted_html, group_hits_by_label) is timed on its own for every
+corpus size and reported as MB/s of input plus peak traced memory. With a
+baseline file, the run fails when a stage's throughput drops by more than
+the allowed tolerance.
+
+A stage is run at least --repeat times and until --min-time seconds have
+passed, keeping the best time. Stages whose baseline takes under
+--gate-min-ms (1 ms) are still reported but never fail the run: at that
+scale one scheduler hiccup is larger than any tolerance.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from biasdetector import detection
+from biasdetector.detection import (
+    DEFAULT_LEXICON,
+    _normalize_hyphens,
+    build_highlighted_html,
+    find_bias_lexicon,
+    find_bias_rules,
+    group_hits_by_label,
+)
+
+from .corpus import generate_ad
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_SIZES = "1KB,100KB,1MB,10MB"
+STAGES = ["normalize", "lexicon", "rules", "highlight_html", "group"]
+MIN_TIME = 0.5
+GATE_MIN_MS = 1.0
+
+_UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+
+
+def parse_size(label: str) -> int:
+    label = label.strip().upper()
+    for unit in ("GB", "MB", "KB", "B"):
+        if label.endswith(unit):
+            return int(float(label[: -len(unit)]) * _UNITS[unit])
+    return int(label)
+
+
+def _fresh():
+    # The engine remembers its last scan and sentence split; clear them so every stage pays its own cost.
+    detection.clear_memos()
+
+
+def _stage_calls(raw: str):
+    # Inputs for later stages are prepared once, outside the timed call.
+    text = _normalize_hyphens(raw)
+    _fresh()
+    lex_hits = find_bias_lexicon(text, DEFAULT_LEXICON)
+    _fresh()
+    rule_hits, _ = find_bias_rules(text)
+    return {
+        "normalize": lambda: _normalize_hyphens(raw),
+        "lexicon": lambda: find_bias_lexicon(text, DEFAULT_LEXICON),
+        "rules": lambda: find_bias_rules(text),
+        "highlight_html": lambda: build_highlighted_html(text, lex_hits, rule_hits),
+        "group": lambda: group_hits_by_label(lex_hits, rule_hits),
+    }, len(lex_hits) + len(rule_hits)
+
+
+def _time_best(fn, repeat: int, min_time: float = MIN_TIME) -> float:
+    # Fast stages get many more runs than `repeat`, so their best time is not a lucky or unlucky single shot.
+    best = float("inf")
+    runs = 0
+    until = time.perf_counter() + min_time
+    while runs < repeat or time.perf_counter() < until:
+        _fresh()
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+        runs += 1
+    return best
+
+
+def _peak_bytes(fn) -> int:
+    _fresh()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmarks(sizes: list, density: float = 0.2, negation_rate: float = 0.1, eoe: bool = False,
+                   seed: int = 0, repeat: int = 3, min_time: float = MIN_TIME) -> dict:
+    """
+    This function times every stage for every size.
+    Returns {size_label: {"bytes", "hits", "stages": {stage: {"seconds", "mb_per_s", "peak_mb"}}}}.
+    """
+    results = {}
+    for label in sizes:
+        raw = generate_ad(parse_size(label), density=density, negation_rate=negation_rate, eoe=eoe, seed=seed)
+        nbytes = len(raw.encode("utf-8"))
+        calls, nhits = _stage_calls(raw)
+        stages = {}
+        for stage in STAGES:
+            seconds = _time_best(calls[stage], repeat, min_time)
+            stages[stage] = {
+                "seconds": seconds,
+                "mb_per_s": (nbytes / (1024 ** 2)) / seconds if seconds > 0 else float("inf"),
+                "peak_mb": _peak_bytes(calls[stage]) / (1024 ** 2),
+            }
+        results[label] = {"bytes": nbytes, "hits": nhits, "stages": stages}
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float, gate_min_ms: float = GATE_MIN_MS) -> list:
+    """
+    Returns one message per stage whose MB/s fell more than `tolerance` below the baseline.
+    Stages that took under `gate_min_ms` in the baseline are not checked.
+    """
+    failures = []
+    for label, res in results.items():
+        base_stages = baseline.get("results", {}).get(label, {}).get("stages", {})
+        for stage, cur in res["stages"].items():
+            base = base_stages.get(stage)
+            if not base or base["seconds"] * 1000 < gate_min_ms:
+                continue
+            floor = base["mb_per_s"] * (1.0 - tolerance)
+            if cur["mb_per_s"] < floor:
+                failures.append(
+                    f"{label} {stage}: {cur['mb_per_s']:.2f} MB/s < {floor:.2f} MB/s "
+                    f"(baseline {base['mb_per_s']:.2f} MB/s, tolerance {tolerance:.0%})"
+                )
+    return failures
+
+
+def format_table(results: dict) -> str:
+    lines = [f"{'size':>8} {'stage':<15} {'MB/s':>10} {'ms':>10} {'peak MB':>9}"]
+    for label, res in results.items():
+        for stage, cur in res["stages"].items():
+            lines.append(
+                f"{label:>8} {stage:<15} {cur['mb_per_s']:>10.2f} {cur['seconds'] * 1000:>10.2f} {cur['peak_mb']:>9.2f}"
+            )
+        lines.append(f"{'':>8} ({res['bytes']:,} bytes, {res['hits']:,} hits)")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmark the detection hot path.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"Comma-separated ad sizes (default: {DEFAULT_SIZES}).")
+    parser.add_argument("--density", type=float, default=0.2, help="Share of sentences with a bias term (default: 0.2).")
+    parser.add_argument("--negation-rate", type=float, default=0.1, help="Share of terms preceded by a negation (default: 0.1).")
+    parser.add_argument("--eoe", action="store_true", help="Append an EOE statement to every ad.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="Fewest timed runs per stage; the best is kept (default: 3).")
+    parser.add_argument("--min-time", type=float, default=MIN_TIME,
+                        help=f"Keep repeating a stage until this many seconds have passed (default: {MIN_TIME}).")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline JSON to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.30, help="Allowed MB/s drop before failing (default: 0.30).")
+    parser.add_argument("--gate-min-ms", type=float, default=GATE_MIN_MS,
+                        help=f"Do not gate stages faster than this in the baseline (default: {GATE_MIN_MS}).")
+    parser.add_argument("--update-baseline", action="store_true", help="Write this run as the new baseline.")
+    parser.add_argument("--json", dest="json_out", help="Also write the results to this JSON file.")
+    args = parser.parse_args(argv)
+
+    sizes = [s.strip() for s in args.sizes.split(",") if s.strip()]
+    results = run_benchmarks(sizes, density=args.density, negation_rate=args.negation_rate,
+                             eoe=args.eoe, seed=args.seed, repeat=args.repeat, min_time=args.min_time)
+    print(format_table(results))
+
+    report = {
+        "settings": {"density": args.density, "negation_rate": args.negation_rate, "eoe": args.eoe, "seed": args.seed},
+        "results": results,
+    }
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("no baseline found; run with --update-baseline to create one", file=sys.stderr)
+        return 0
+    with open(args.baseline, "r", encoding="utf-8") as fh:
+        baseline = json.load(fh)
+    if baseline.get("settings") != report["settings"]:
+        print("baseline was recorded with different settings; skipping the regression check", file=sys.stderr)
+        return 0
+    failures = compare(results, baseline, args.tolerance, args.gate_min_ms)
+    for msg in failures:
+        print(f"REGRESSION {msg}", file=sys.stderr)
+    return 1 if failures else 0
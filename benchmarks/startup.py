@@ -0,0 +1,76 @@
+"""
+Cold-start measurement for the app's imports.
+
+Each measurement runs in a fresh interpreter, so nothing is cached in
+sys.modules. "lazy" is what a new Streamlit process now pays before the
+first paint; "eager" adds the google.generativeai import that used to run
+at module import time (and now runs on first use or in the background).
+
+    python -m benchmarks.startup --repeat 5
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def app_imports(path: str = os.path.join(ROOT, "app.py")) -> str:
+    """Returns app.py's module-level import statements, i.e. what it imports before drawing anything."""
+    with open(path, "r", encoding="utf-8") as fh:
+        source = fh.read()
+    statements = [ast.get_source_segment(source, node) for node in ast.parse(source).body
+                  if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return "\n".join(statements)
+
+
+def scenarios() -> dict:
+    imports = app_imports()
+    return {
+        "lazy": imports,
+        "eager": imports + "\nimport biasdetector.gemini\nbiasdetector.gemini._load_genai()",
+    }
+
+
+def _time_once(code: str) -> float:
+    # The child prints its own import time, which leaves out interpreter start-up.
+    script = (
+        "import time, warnings; warnings.simplefilter('ignore'); t0 = time.perf_counter()\n"
+        f"{code}\nprint(time.perf_counter() - t0)"
+    )
+    out = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def measure(repeat: int = 5) -> dict:
+    """Returns {scenario: {"median_s", "min_s"}} over `repeat` fresh interpreters each."""
+    results = {}
+    for name, code in scenarios().items():
+        times = [_time_once(code) for _ in range(repeat)]
+        results[name] = {"median_s": statistics.median(times), "min_s": min(times)}
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup", description="Measure app import time.")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per scenario (default: 5).")
+    parser.add_argument("--json", dest="json_out", help="Also write the results to this JSON file.")
+    args = parser.parse_args(argv)
+
+    results = measure(args.repeat)
+    for name, r in results.items():
+        print(f"{name:<6} median {r['median_s'] * 1000:8.1f} ms   min {r['min_s'] * 1000:8.1f} ms")
+    saved = results["eager"]["median_s"] - results["lazy"]["median_s"]
+    print(f"lazy Gemini import saves {saved * 1000:.1f} ms before the first paint")
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
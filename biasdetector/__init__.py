@@ -0,0 +1,37 @@
+"""
+Bias Detector core package.
+
+Everything here runs without Streamlit, so it can be used from the web app,
+from the command line (``python -m biasdetector``) or from other services.
+"""
+from .detection import (
+    DEFAULT_LEXICON,
+    HIGHLIGHT_COLORS,
+    LABEL_EXPLANATIONS,
+    RULES,
+    Hit,
+    build_highlighted_html,
+    category_color,
+    category_explanation,
+    find_bias_lexicon,
+    find_bias_rules,
+    found_labels,
+    group_hits_by_label,
+    render_legend,
+)
+
+__all__ = [
+    "DEFAULT_LEXICON",
+    "HIGHLIGHT_COLORS",
+    "LABEL_EXPLANATIONS",
+    "RULES",
+    "Hit",
+    "build_highlighted_html",
+    "category_color",
+    "category_explanation",
+    "find_bias_lexicon",
+    "find_bias_rules",
+    "found_labels",
+    "group_hits_by_label",
+    "render_legend",
+]
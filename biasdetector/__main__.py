@@ -0,0 +1,240 @@
+"""
+Command-line entry point: ``python -m biasdetector <command>``.
+"""
+import argparse
+import json
+import os
+import sys
+
+
+def _cmd_scan(args) -> int:
+    from .lexicon import active_lexicon
+    from .localmodel import get_local_model
+    from .scan import run_scan
+
+    if args.lexicon:
+        # Workers inherit the environment and load the index the parent compiles here.
+        os.environ["BIASDETECTOR_LEXICON"] = os.pathsep.join(args.lexicon)
+    try:
+        active_lexicon()
+        if not args.no_local or args.explain:
+            get_local_model()  # Trains and caches the model once, before the workers load it.
+        n = run_scan(
+            args.input,
+            args.output,
+            fmt=args.format,
+            text_field=args.text_field,
+            id_field=args.id_field,
+            keep=tuple(args.keep or ()),
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            resume=args.resume,
+            checkpoint_path=args.checkpoint,
+            progress=not args.quiet,
+            near_dup=args.near_dup,
+            local=not args.no_local,
+            explain=args.explain,
+            profile=args.profile,
+            profile_dir=args.profile_dir,
+        )
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    if not args.quiet:
+        print(f"wrote {n} results to {args.output}", file=sys.stderr)
+    if args.columnar:
+        return _build_columnar(args.output, args.columnar, args)
+    return 0
+
+
+def _cmd_stream(args) -> int:
+    from .lexicon import active_lexicon
+    from .stream import scan_file
+
+    if args.lexicon:
+        os.environ["BIASDETECTOR_LEXICON"] = os.pathsep.join(args.lexicon)
+    try:
+        lexicon = active_lexicon()[0]
+        out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    n = 0
+    try:
+        for ad, hit in scan_file(args.input, lexicon, separator=args.separator,
+                                 whitelist=not args.no_whitelist,
+                                 window_chars=args.window_chars, encoding=args.encoding):
+            out.write(json.dumps({"ad": ad, **hit.to_dict()}, ensure_ascii=False) + "\n")
+            n += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if not args.quiet:
+        print(f"wrote {n} hits", file=sys.stderr)
+    return 0
+
+
+def _cmd_serve(args) -> int:
+    from .lexicon import active_lexicon
+    from .server import make_server, serve
+
+    if args.lexicon:
+        os.environ["BIASDETECTOR_LEXICON"] = os.pathsep.join(args.lexicon)
+    try:
+        active_lexicon()
+        server = make_server(args.host, args.port)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    workers = args.workers or os.cpu_count() or 1
+    if not args.quiet:
+        host, port = server.server_address[:2]
+        print(f"serving on http://{host}:{port} with {workers} worker(s)", file=sys.stderr)
+    serve(server, workers=workers, local=not args.no_local)
+    return 0
+
+
+def _build_columnar(results: str, store: str, args) -> int:
+    from .columnar import build_store
+
+    try:
+        n = build_store(results, store, employer_field=args.employer_field, date_field=args.date_field)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    if not getattr(args, "quiet", False):
+        print(f"stored {n} results in {store}", file=sys.stderr)
+    return 0
+
+
+def _cmd_columnar(args) -> int:
+    return _build_columnar(args.results, args.output, args)
+
+
+def _cmd_train_local(args) -> int:
+    from .localmodel import load_examples, train
+
+    try:
+        examples = load_examples(args.examples)
+        model = train(examples, epochs=args.epochs)
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(model.to_dict(), fh)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    print(f"trained on {len(examples)} sentences, {len(model.categories)} categories -> {args.output}", file=sys.stderr)
+    return 0
+
+
+def _cmd_report(args) -> int:
+    from .columnar import ColumnarStore
+
+    try:
+        store = ColumnarStore(args.store)
+        if args.top_terms:
+            rows = store.top_terms(args.top_terms, category=args.category, employer=args.employer, month=args.month)
+            if args.json:
+                print(json.dumps([{"category": c, "term": t, "ads": n} for c, t, n in rows], ensure_ascii=False))
+            else:
+                for category, term, n in rows:
+                    print(f"{n:>9}  {category}: {term}")
+            return 0
+        report = store.category_rates(by=args.by)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    rows = [r for r in report.rows(min_docs=args.min_docs) if args.category is None or r[1] == args.category]
+    if args.json:
+        keys = (args.by or "group", "category", "flagged", "ads", "rate")
+        print(json.dumps([dict(zip(keys, r)) for r in rows], ensure_ascii=False))
+    else:
+        for group, category, flagged, docs, rate in rows:
+            print(f"{group}\t{category}\t{flagged}/{docs}\t{rate:.1%}")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m biasdetector", description="Bias Detector for Job Ads (headless tools).")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    scan = sub.add_parser("scan", help="Scan a JSONL/CSV corpus of job ads and write JSONL results.")
+    scan.add_argument("input", help="Input file (.jsonl or .csv), or - for stdin.")
+    scan.add_argument("-o", "--output", required=True, help="Output JSONL file.")
+    scan.add_argument("--format", choices=["jsonl", "csv"], help="Input format (default: from the file extension).")
+    scan.add_argument("--text-field", default="text", help="Field holding the ad text (default: text).")
+    scan.add_argument("--id-field", default="id", help="Field holding the document id (default: id).")
+    scan.add_argument("--keep", action="append", metavar="FIELD", help="Copy this input field into each result (repeatable).")
+    scan.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count).")
+    scan.add_argument("--chunk-size", type=int, default=200, help="Ads per work unit (default: 200).")
+    scan.add_argument("--resume", action="store_true", help="Continue from the checkpoint of an interrupted run.")
+    scan.add_argument("--checkpoint", default=None, help="Checkpoint file (default: <output>.ckpt).")
+    scan.add_argument("--lexicon", action="append", metavar="PACK", help="JSON/YAML lexicon pack to use (repeatable).")
+    scan.add_argument("--near-dup", action="store_true",
+                      help="Reuse hits of paragraphs seen before (this or earlier runs) and name near-identical ads. "
+                           "Keeps signatures and paragraph hits, never ad text, in the cache folder.")
+    scan.add_argument("--no-local", action="store_true", help="Skip the offline model's per-sentence scores.")
+    scan.add_argument("--explain", action="store_true", help="Add an offline Markdown explanation to each result.")
+    scan.add_argument("--profile", type=float, default=0.0, metavar="FRACTION",
+                      help="Profile this share of ads (0-1) with cProfile and tracemalloc (default: 0).")
+    scan.add_argument("--profile-dir", metavar="DIR", help="Where profiles go (default: <output>.profile/).")
+    scan.add_argument("--columnar", metavar="DIR", help="Also store the results in a columnar store for `report`.")
+    scan.add_argument("-q", "--quiet", action="store_true", help="Hide the progress readout.")
+    scan.set_defaults(func=_cmd_scan)
+
+    stream = sub.add_parser("stream", help="Stream hits from a huge plain-text file with flat memory use.")
+    stream.add_argument("input", help="Text file (read through mmap), or - for stdin.")
+    stream.add_argument("-o", "--output", default="-", help="Hits as JSONL (default: stdout).")
+    stream.add_argument("--separator", metavar="REGEX", help=r"Regex between ads, e.g. '\f' or '\n-{3,}\n' (default: one ad).")
+    stream.add_argument("--no-whitelist", action="store_true", help="Keep rule hits in sentences with an EOE statement.")
+    stream.add_argument("--window-chars", type=int, default=1 << 20, help="Characters scanned per window (default: 1M).")
+    stream.add_argument("--encoding", default="utf-8", help="Input encoding (default: utf-8).")
+    stream.add_argument("--lexicon", action="append", metavar="PACK", help="JSON/YAML lexicon pack to use (repeatable).")
+    stream.add_argument("-q", "--quiet", action="store_true", help="Hide the summary line.")
+    stream.set_defaults(func=_cmd_stream)
+
+    server = sub.add_parser("serve", help="Serve POST /analyze and /analyze/batch over HTTP (JSON, keep-alive).")
+    server.add_argument("--host", default="127.0.0.1", help="Address to bind (default: 127.0.0.1).")
+    server.add_argument("--port", type=int, default=8080, help="Port to listen on (default: 8080).")
+    server.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count).")
+    server.add_argument("--lexicon", action="append", metavar="PACK", help="JSON/YAML lexicon pack to use (repeatable).")
+    server.add_argument("--no-local", action="store_true",
+                        help="Do not preload the offline model (requests asking for it load it on first use).")
+    server.add_argument("-q", "--quiet", action="store_true", help="Hide the startup line.")
+    server.set_defaults(func=_cmd_serve)
+
+    columnar = sub.add_parser("columnar", help="Convert scan results JSONL into a columnar store for `report`.")
+    columnar.add_argument("results", help="Results JSONL written by `scan`.")
+    columnar.add_argument("-o", "--output", required=True, help="Store folder to create.")
+    columnar.set_defaults(func=_cmd_columnar)
+
+    for p in (scan, columnar):
+        p.add_argument("--employer-field", default="employer",
+                       help="Result field naming the employer (default: employer; keep it with --keep).")
+        p.add_argument("--date-field", default="date", help="Result field with the posting date (default: date).")
+
+    train = sub.add_parser("train-local", help="Train the offline model on labelled sentences (JSONL).")
+    train.add_argument("examples", help='JSONL lines like {"text": "...", "labels": ["age bias"]}.')
+    train.add_argument("-o", "--output", required=True, help="Model file to write (use it via BIASDETECTOR_LOCAL_MODEL).")
+    train.add_argument("--epochs", type=int, default=40, help="Passes over the examples (default: 40).")
+    train.set_defaults(func=_cmd_train_local)
+
+    report = sub.add_parser("report", help="Category rates and top terms from a columnar store.")
+    report.add_argument("store", help="Store folder written by `scan --columnar` or `columnar`.")
+    report.add_argument("--by", choices=["employer", "month"], help="Rates per employer or per month (default: overall).")
+    report.add_argument("--top-terms", type=int, metavar="N", help="List the N terms flagged in the most ads instead.")
+    report.add_argument("--category", help="Only this category.")
+    report.add_argument("--employer", help="With --top-terms: only this employer's ads.")
+    report.add_argument("--month", metavar="YYYY-MM", help="With --top-terms: only ads from this month.")
+    report.add_argument("--min-docs", type=int, default=1, help="Skip groups with fewer ads (default: 1).")
+    report.add_argument("--json", action="store_true", help="Print JSON instead of text.")
+    report.set_defaults(func=_cmd_report)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+"""
+Request coalescing and a global, fair queue for Gemini calls.
+
+Many Streamlit sessions share one process and one API quota. Two things
+sit in front of every generate_content call:
+
+- SingleFlight: callers asking for the same answer (same cache key) while
+  a request for it is already running attach to that request instead of
+  starting their own. They see the same chunks as the caller that started
+  it, as it streams.
+- FairQueue: at most GEMINI_MAX_CONCURRENT calls run at once. Callers
+  beyond that wait in line, served round-robin across sessions so one busy
+  session (or a batch) cannot starve the others. Waiting callers are told
+  their place in line and an estimated wait; when the line is full
+  (GEMINI_MAX_QUEUE) or the wait passes GEMINI_QUEUE_TIMEOUT seconds, the
+  call fails fast with GeminiBusy instead of spinning forever.
+"""
+import contextlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from . import metrics
+
+
+class GeminiBusy(RuntimeError):
+    """Raised when a Gemini call cannot get a slot (line full or waited too long)."""
+
+
+class _Ticket:
+    __slots__ = ("session", "granted", "enqueued")
+
+    def __init__(self, session):
+        self.session = session
+        self.granted = False
+        self.enqueued = time.monotonic()
+
+
+class FairQueue:
+    """
+    This class caps concurrent calls and serves waiting callers round-robin by session.
+    - acquire() blocks until a slot is free and returns the seconds spent waiting.
+    - on_wait(position, eta_seconds) is called from the waiting thread whenever the caller's
+      place in line changes, and once with (0, 0.0) when the call starts.
+    - release() frees the slot; `seconds` (how long it was held) feeds the wait estimate.
+    """
+
+    def __init__(self, max_active: int = 4, max_waiting: int = 100, timeout: float = 120.0):
+        self.max_active = max(1, int(max_active))
+        self.max_waiting = max(0, int(max_waiting))
+        self.timeout = float(timeout)
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = OrderedDict()  # session -> deque of tickets; first session is served next
+        self._avg_seconds = 10.0  # Moving average of how long a call holds its slot.
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        with self._cond:
+            return sum(len(q) for q in self._waiting.values())
+
+    def _position(self, ticket) -> int:
+        # Round-robin order: every session's first ticket, then every session's second, and so on.
+        q = self._waiting.get(ticket.session)
+        if q is None or ticket not in q:
+            return 0
+        j = q.index(ticket)
+        ahead, before = 0, True
+        for session, other in self._waiting.items():
+            if session == ticket.session:
+                before = False
+                continue
+            ahead += min(len(other), j + 1 if before else j)
+        return ahead + j + 1
+
+    def estimated_wait(self, position: int) -> float:
+        """Rough seconds until the caller at `position` starts."""
+        return math.ceil(position / self.max_active) * self._avg_seconds if position else 0.0
+
+    def _grant(self):
+        while self._active < self.max_active and self._waiting:
+            session, q = next(iter(self._waiting.items()))
+            q.popleft().granted = True
+            self._active += 1
+            if q:
+                self._waiting.move_to_end(session)
+            else:
+                del self._waiting[session]
+        self._cond.notify_all()
+
+    def _drop(self, ticket):
+        q = self._waiting.get(ticket.session)
+        if q is not None and ticket in q:
+            q.remove(ticket)
+            if not q:
+                del self._waiting[ticket.session]
+
+    def acquire(self, session=None, on_wait=None) -> float:
+        ticket = _Ticket(session)
+        with self._cond:
+            if self._active < self.max_active and not self._waiting:
+                self._active += 1
+                return 0.0
+            queued = sum(len(q) for q in self._waiting.values())
+            if queued >= self.max_waiting:
+                metrics.inc("biasdetector_gemini_requests_total", outcome="busy")
+                raise GeminiBusy(f"Gemini is busy: the queue is full ({queued} waiting). Please try again in a minute.")
+            self._waiting.setdefault(session, deque()).append(ticket)
+        deadline = ticket.enqueued + self.timeout
+        shown = None
+        try:
+            while True:
+                with self._cond:
+                    if not ticket.granted:
+                        self._cond.wait(min(0.5, max(0.0, deadline - time.monotonic())))
+                    if ticket.granted:
+                        break
+                    if time.monotonic() >= deadline:
+                        self._drop(ticket)
+                        metrics.inc("biasdetector_gemini_requests_total", outcome="busy")
+                        raise GeminiBusy(f"Gemini is busy (waited {self.timeout:.0f} s for a free slot). "
+                                         "Please try again in a minute.")
+                    position = self._position(ticket)
+                # The callback may draw UI, so it runs outside the lock.
+                if on_wait is not None and position != shown:
+                    shown = position
+                    on_wait(position, self.estimated_wait(position))
+        except BaseException:
+            with self._cond:
+                if ticket.granted:
+                    self._active -= 1
+                    self._grant()
+                else:
+                    self._drop(ticket)
+            raise
+        waited = time.monotonic() - ticket.enqueued
+        metrics.observe("biasdetector_stage_seconds", waited, stage="gemini_queue")
+        if on_wait is not None:
+            on_wait(0, 0.0)
+        return waited
+
+    def try_acquire(self) -> bool:
+        """Takes a slot only if one is free and nobody is waiting; never blocks."""
+        with self._cond:
+            if self._active < self.max_active and not self._waiting:
+                self._active += 1
+                return True
+            return False
+
+    def release(self, seconds: float | None = None):
+        with self._cond:
+            if seconds is not None:
+                self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * seconds
+            self._active -= 1
+            self._grant()
+
+    @contextlib.contextmanager
+    def slot(self, session=None, on_wait=None):
+        """Holds one slot for the duration of the with-block."""
+        self.acquire(session, on_wait)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+
+_QUEUE = None
+_QUEUE_LOCK = threading.Lock()
+
+
+def get_gemini_queue() -> FairQueue:
+    """
+    Returns the process-wide Gemini queue.
+    GEMINI_MAX_CONCURRENT (default 4) calls run at once, GEMINI_MAX_QUEUE (default 100) may wait,
+    and a caller gives up after GEMINI_QUEUE_TIMEOUT seconds (default 120) in line.
+    """
+    global _QUEUE
+    with _QUEUE_LOCK:
+        if _QUEUE is None:
+            _QUEUE = FairQueue(
+                max_active=int(os.getenv("GEMINI_MAX_CONCURRENT", 4)),
+                max_waiting=int(os.getenv("GEMINI_MAX_QUEUE", 100)),
+                timeout=float(os.getenv("GEMINI_QUEUE_TIMEOUT", 120)),
+            )
+        return _QUEUE
+
+
+class _Flight:
+    __slots__ = ("cond", "chunks", "done", "abandoned", "status")
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.chunks = []
+        self.done = False
+        self.abandoned = False
+        self.status = None  # Latest (position, eta) of the leader in the queue.
+
+
+class SingleFlight:
+    """
+    This class shares one in-flight request among callers asking for the same key.
+    - stream(key, produce, on_wait) yields the chunks of produce(on_wait) for the first caller
+      (the leader); later callers with the same key get the same chunks as they arrive.
+    - The leader's queue updates are passed on to the callers waiting on it.
+    - If the leader stops before its first chunk (error, closed page), a waiting caller
+      starts the request itself; after that, waiting callers get a short warning instead.
+    - The key is forgotten when the request ends, so later callers go to the cache instead.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+    def stream(self, key: str, produce, on_wait=None):
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+            if leader:
+                yield from self._lead(key, flight, produce, on_wait)
+                return
+            metrics.inc("biasdetector_gemini_coalesced_total")
+            seen, shown = 0, None
+            while True:
+                with flight.cond:
+                    while len(flight.chunks) == seen and not flight.done and flight.status == shown:
+                        flight.cond.wait(0.5)
+                    new, done, status = flight.chunks[seen:], flight.done, flight.status
+                if on_wait is not None and status != shown:
+                    on_wait(*status)
+                shown = status
+                seen += len(new)
+                yield from new
+                if done:
+                    break
+            if not flight.abandoned:
+                return
+            if seen:
+                yield "\n\n⚠️ Gemini call failed: the request this answer was shared from was cancelled."
+                return
+            # Nothing was shown yet: try again, most likely as the new leader.
+
+    def _lead(self, key, flight, produce, on_wait):
+        def _waiting(position, eta):
+            with flight.cond:
+                flight.status = (position, eta)
+                flight.cond.notify_all()
+            if on_wait is not None:
+                on_wait(position, eta)
+
+        finished = False
+        try:
+            for chunk in produce(_waiting):
+                with flight.cond:
+                    flight.chunks.append(chunk)
+                    flight.cond.notify_all()
+                yield chunk
+            finished = True
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            with flight.cond:
+                flight.done, flight.abandoned = True, not finished
+                flight.cond.notify_all()
+
+    def call(self, key: str, fn, on_wait=None):
+        """Like stream() for a single value: returns fn(on_wait), shared with concurrent callers."""
+        out = list(self.stream(key, lambda waiting: iter([fn(waiting)]), on_wait))
+        return out[-1] if out else None
+
+
+# One flight table for the whole process, shared by every Streamlit session.
+FLIGHTS = SingleFlight()
@@ -0,0 +1,144 @@
+"""
+Circuit breaker for Gemini calls.
+
+During an API brownout every session would otherwise keep sending requests
+that hang or fail. The breaker counts consecutive failed or slow calls;
+after GEMINI_BREAKER_FAILURES of them it opens, and calls fail at once with
+CircuitOpen (the app then shows its offline explanation). After
+GEMINI_BREAKER_RESET_SECONDS it half-opens: a few probe calls are let
+through, and the first probe that answers quickly closes it again while a
+failed probe opens it for another period.
+
+States: "closed" (normal), "open" (rejecting), "half_open" (probing).
+"""
+import math
+import os
+import threading
+import time
+
+from . import metrics
+
+
+class CircuitOpen(RuntimeError):
+    """Raised instead of calling Gemini while the breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    This class decides whether a Gemini call may go out.
+    - allow() returns True when a call may start; every allowed call must end with
+      record_success(), record_failure() or release() (an ending that says nothing about Gemini).
+    - A success taking at least `slow_seconds` counts as a failure for opening the breaker.
+    - check() raises CircuitOpen without taking a probe, so callers can fail before queueing.
+    """
+
+    def __init__(self, failures: int = 5, slow_seconds: float = 20.0, reset_seconds: float = 30.0,
+                 probes: int = 1):
+        self.failures = max(1, int(failures))
+        self.slow_seconds = float(slow_seconds)
+        self.reset_seconds = float(reset_seconds)
+        self.probes = max(1, int(probes))
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._streak = 0
+        self._opened = 0.0
+        self._probing = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._tick()
+            return self._state
+
+    def retry_in(self) -> float:
+        """Seconds until the next probe may go out (0 unless open)."""
+        with self._lock:
+            self._tick()
+            return max(0.0, self._opened + self.reset_seconds - time.monotonic()) if self._state == "open" else 0.0
+
+    def _tick(self):
+        if self._state == "open" and time.monotonic() - self._opened >= self.reset_seconds:
+            self._state, self._probing = "half_open", 0
+
+    def _open(self):
+        self._state, self._opened, self._probing = "open", time.monotonic(), 0
+        metrics.inc("biasdetector_gemini_breaker_opened_total")
+        metrics.log_event("gemini_breaker_open", streak=self._streak)
+
+    def _error(self) -> CircuitOpen:
+        wait = math.ceil(max(0.0, self._opened + self.reset_seconds - time.monotonic()))
+        return CircuitOpen(f"Gemini is not responding right now, so requests are paused for {max(1, wait)} s "
+                           "after repeated failures or slow answers.")
+
+    def check(self):
+        with self._lock:
+            self._tick()
+            if self._state == "open" or (self._state == "half_open" and self._probing >= self.probes):
+                metrics.inc("biasdetector_gemini_requests_total", outcome="circuit_open")
+                raise self._error()
+
+    def allow(self) -> bool:
+        with self._lock:
+            self._tick()
+            if self._state == "closed":
+                return True
+            if self._state == "half_open" and self._probing < self.probes:
+                self._probing += 1
+                return True
+            return False
+
+    def guard(self):
+        """Like allow(), but raises CircuitOpen when the call may not go out."""
+        if not self.allow():
+            metrics.inc("biasdetector_gemini_requests_total", outcome="circuit_open")
+            with self._lock:
+                error = self._error()
+            raise error
+
+    def record_success(self, seconds: float = 0.0):
+        with self._lock:
+            if self._state == "half_open":
+                self._probing = max(0, self._probing - 1)
+            if seconds >= self.slow_seconds:
+                self._failed()
+            else:
+                self._state, self._streak = "closed", 0
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == "half_open":
+                self._probing = max(0, self._probing - 1)
+            self._failed()
+
+    def _failed(self):
+        self._streak += 1
+        if self._state == "half_open" or (self._state == "closed" and self._streak >= self.failures):
+            self._open()
+
+    def release(self):
+        with self._lock:
+            if self._state == "half_open":
+                self._probing = max(0, self._probing - 1)
+
+
+_BREAKER = None
+_BREAKER_LOCK = threading.Lock()
+
+
+def get_breaker() -> CircuitBreaker:
+    """
+    Returns the process-wide Gemini circuit breaker.
+    GEMINI_BREAKER_FAILURES (default 5) failed or slow calls in a row open it; a call is slow after
+    GEMINI_BREAKER_SLOW_SECONDS (default 20) without its first words; it half-opens after
+    GEMINI_BREAKER_RESET_SECONDS (default 30). GEMINI_BREAKER=0 never opens it.
+    """
+    global _BREAKER
+    with _BREAKER_LOCK:
+        if _BREAKER is None:
+            never = os.getenv("GEMINI_BREAKER", "1") == "0"
+            _BREAKER = CircuitBreaker(
+                failures=10 ** 9 if never else int(os.getenv("GEMINI_BREAKER_FAILURES", 5)),
+                slow_seconds=float(os.getenv("GEMINI_BREAKER_SLOW_SECONDS", 20)),
+                reset_seconds=float(os.getenv("GEMINI_BREAKER_RESET_SECONDS", 30)),
+            )
+        return _BREAKER
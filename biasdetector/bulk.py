@@ -0,0 +1,236 @@
+"""
+Async bulk explanations with Gemini.
+
+explain_many() runs many (text, grouped_hits) items concurrently under a
+semaphore and a token-bucket rate limit, retries rate-limit and transient
+errors with exponential backoff plus jitter, and gives every item its own
+deadline. Each item gets an ExplainResult instead of an error string.
+
+The client is injectable: anything with an async
+``generate(system_prompt, user_prompt, temperature)`` method and a
+``model_name`` attribute works, so runs can be tested against a fake
+client with no network (see ScriptedClient in tests/test_bulk.py).
+"""
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+
+from .admission import get_gemini_queue
+from .breaker import get_breaker
+from .gemini import (
+    _RESOLVER,
+    NOT_CONFIGURED_MSG,
+    build_user_prompt,
+    get_response_cache,
+    is_model_not_found,
+    response_cache_key,
+)
+from .prompts import GEMINI_SYSTEM_PROMPT
+
+# Exception class names and HTTP status codes that are worth retrying.
+_RETRYABLE_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "DeadlineExceeded", "GatewayTimeout", "Aborted", "TimeoutError", "ConnectionError",
+}
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+def status_code(exc: BaseException) -> int | None:
+    """
+    Returns the HTTP status an API error carries, or None.
+    google.api_core errors set `code`; HTTP client errors set `status_code` or `status`.
+    """
+    for attr in ("code", "status_code", "status"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int) and not isinstance(value, bool):
+            return int(value)
+    return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    True for rate limits, timeouts and transient server errors.
+    Decided by the exception type or its status code, never by the message text
+    (which may mention e.g. "5000 tokens").
+    """
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    if type(exc).__name__ in _RETRYABLE_NAMES:
+        return True
+    return status_code(exc) in _RETRYABLE_STATUS
+
+
+@dataclass
+class ExplainResult:
+    """Outcome for one item, in the same position as its input."""
+    index: int
+    ok: bool
+    text: str | None = None
+    error: str | None = None
+    error_type: str | None = None
+    attempts: int = 0
+    latency: float = 0.0
+    cached: bool = False
+
+
+class TokenBucket:
+    """
+    Simple async token bucket: `rate` requests per second, bursts up to `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+
+class GeminiAsyncClient:
+    """
+    Default client: uses the process-wide resolved model and generate_content_async.
+    A model-not-found error switches to the next candidate before giving up.
+    Calls go through the process-wide circuit breaker, so an open breaker fails them at once.
+    With a `session`, every call also waits for a slot in the process-wide Gemini queue,
+    so the app's own concurrent requests count against the same limit.
+    """
+
+    def __init__(self, session=None):
+        self.model_name, self._model = _RESOLVER.get_model()
+        self.session = session
+
+    @property
+    def configured(self) -> bool:
+        return self._model is not None
+
+    async def generate(self, system_prompt: str, user_prompt: str, temperature: float) -> str:
+        if self.session is None:
+            return await self._generate(system_prompt, user_prompt, temperature)
+        queue = get_gemini_queue()
+        waiting = asyncio.ensure_future(asyncio.to_thread(queue.acquire, self.session))
+        try:
+            await asyncio.shield(waiting)
+        except asyncio.CancelledError:
+            # The thread keeps waiting; hand the slot back as soon as it gets one.
+            waiting.add_done_callback(lambda f: f.cancelled() or f.exception() or queue.release())
+            raise
+        started = time.monotonic()
+        try:
+            return await self._generate(system_prompt, user_prompt, temperature)
+        finally:
+            queue.release(time.monotonic() - started)
+
+    async def _generate(self, system_prompt: str, user_prompt: str, temperature: float) -> str:
+        breaker = get_breaker()
+        while True:
+            breaker.guard()
+            started = time.monotonic()
+            try:
+                resp = await self._model.generate_content_async(
+                    [{"role": "user", "parts": [{"text": system_prompt}, {"text": user_prompt}]}],
+                    generation_config={"temperature": float(temperature)},
+                )
+                answer = resp.text
+                breaker.record_success(time.monotonic() - started)
+                _RESOLVER.mark_success(self.model_name)
+                return answer
+            except asyncio.CancelledError:
+                breaker.record_failure()  # Cut off by the item's deadline.
+                raise
+            except Exception as e:
+                if not is_model_not_found(e):
+                    breaker.record_failure()
+                    raise
+                breaker.release()
+                name, model = _RESOLVER.mark_not_found(self.model_name)
+                if model is None or name == self.model_name:
+                    raise
+                self.model_name, self._model = name, model
+
+
+async def explain_many(items, client=None, concurrency: int = 8, rate_per_sec: float | None = None,
+                       max_retries: int = 4, base_delay: float = 0.5, max_delay: float = 20.0,
+                       deadline: float = 60.0, temperature: float = 0.3, use_cache: bool = True,
+                       neardup=None, session=None) -> list:
+    """
+    This function explains many (text, grouped_hits) items concurrently.
+    - `concurrency` caps requests in flight; `rate_per_sec` caps request starts (token bucket).
+    - Retryable errors back off exponentially (base_delay * 2**attempt, capped, with full jitter).
+    - Each item has `deadline` seconds in total, covering all of its attempts.
+    - With a `neardup` index, an item whose paragraphs were all explained before (in paragraph mode)
+      gets those explanations joined, instead of calling Gemini (see NearDupIndex.explanation()).
+    - With a `session`, the default client also takes its turn in the process-wide Gemini queue.
+    Returns one ExplainResult per item, in input order.
+    """
+    items = list(items)
+    if client is None:
+        client = GeminiAsyncClient(session)
+        if not client.configured:
+            return [ExplainResult(i, False, error=NOT_CONFIGURED_MSG, error_type="NotConfigured") for i in range(len(items))]
+
+    sem = asyncio.Semaphore(max(1, concurrency))
+    bucket = TokenBucket(rate_per_sec) if rate_per_sec else None
+    cache = get_response_cache() if use_cache else None
+    model_name = getattr(client, "model_name", "")
+
+    async def _one(i: int, text: str, grouped: dict) -> ExplainResult:
+        started = time.monotonic()
+        key = response_cache_key(text, grouped, temperature, model_name)
+        if cache is not None:
+            hit = cache.get(key)
+            if hit is not None:
+                return ExplainResult(i, True, text=hit, cached=True)
+        if use_cache and neardup is not None:
+            joined = neardup.explanation(text, temperature)
+            if joined is not None:
+                return ExplainResult(i, True, text=joined, cached=True)
+
+        user_prompt = build_user_prompt(text, grouped)
+        attempts = 0
+        while True:
+            remaining = deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                return ExplainResult(i, False, error="deadline exceeded", error_type="DeadlineExceeded",
+                                     attempts=attempts, latency=time.monotonic() - started)
+            attempts += 1
+            try:
+                if bucket is not None:
+                    await asyncio.wait_for(bucket.acquire(), timeout=remaining)
+                async with sem:
+                    remaining = deadline - (time.monotonic() - started)
+                    answer = await asyncio.wait_for(
+                        client.generate(GEMINI_SYSTEM_PROMPT, user_prompt, temperature), timeout=max(remaining, 0.001)
+                    )
+                if cache is not None and answer:
+                    cache.put(key, answer)
+                return ExplainResult(i, True, text=answer or "Gemini returned no text.",
+                                     attempts=attempts, latency=time.monotonic() - started)
+            except Exception as e:
+                elapsed = time.monotonic() - started
+                if isinstance(e, asyncio.TimeoutError) and elapsed >= deadline:
+                    return ExplainResult(i, False, error="deadline exceeded", error_type="DeadlineExceeded",
+                                         attempts=attempts, latency=elapsed)
+                if attempts > max_retries or not is_retryable(e) or elapsed >= deadline:
+                    return ExplainResult(i, False, error=str(e) or type(e).__name__, error_type=type(e).__name__,
+                                         attempts=attempts, latency=elapsed)
+                delay = random.uniform(0, min(max_delay, base_delay * (2 ** (attempts - 1))))
+                await asyncio.sleep(min(delay, max(0.0, deadline - elapsed)))
+
+    return await asyncio.gather(*(_one(i, text, grouped) for i, (text, grouped) in enumerate(items)))
+
+
+def explain_many_sync(items, **kwargs) -> list:
+    """Blocking wrapper around explain_many() for scripts and the batch path."""
+    return asyncio.run(explain_many(items, **kwargs))
@@ -0,0 +1,431 @@
+"""
+Columnar store for scan results.
+
+`python -m biasdetector scan` writes one JSON line per ad, which is easy to
+read but slow to aggregate: every report would parse millions of dicts. A
+columnar store keeps the same facts as flat binary arrays in one folder:
+
+    meta.json                     counts, field names and array dtypes
+    docs.employer.i32             employer code of each ad (-1 = missing)
+    docs.month.i32                month code of each ad (-1 = missing)
+    docs.hit_end.i64              end offset of each ad's rows in the hits arrays
+    hits.category.u16             category code of each flagged (category, term) pair
+    hits.term.u32                 term code of each pair
+    docs.span_end.i64             end offset of each ad's rows in the spans arrays
+    spans.category.u16            category code of each hit occurrence
+    spans.term.u32                term code of each occurrence
+    spans.start.i64 / .end.i64    character offsets of each occurrence in the ad text
+    terms.category.u16            category of each term code
+    <table>.strings / .offsets    string tables: categories, employers, months, terms
+
+A hit row is one entry of the "grouped" dict from group_hits_by_label, so a
+term counts once per ad and category. A span row is one entry of the
+"hits" list, so every occurrence keeps its offsets. Reports open the arrays with
+np.memmap and aggregate them with NumPy in chunks, so memory stays flat
+however large the corpus is.
+"""
+import array
+import json
+import os
+import re as _re
+import sys
+
+try:
+    import numpy as np
+    _HAS_NUMPY = True
+except Exception:
+    _HAS_NUMPY = False
+
+# Version 2 added the spans arrays.
+STORE_VERSION = 2
+# Hit rows aggregated per step; bounds the memory a report needs.
+CHUNK_HITS = 1 << 22
+
+_COLUMNS = {
+    "docs.employer": "i",
+    "docs.month": "i",
+    "docs.hit_end": "q",
+    "hits.category": "H",
+    "hits.term": "I",
+    "docs.span_end": "q",
+    "spans.category": "H",
+    "spans.term": "I",
+    "spans.start": "q",
+    "spans.end": "q",
+}
+_DTYPES = {"i": "int32", "q": "int64", "H": "uint16", "I": "uint32"}
+_SUFFIX = {"i": "i32", "q": "i64", "H": "u16", "I": "u32"}
+_STRING_TABLES = ("categories", "employers", "months", "terms")
+_MONTH_RE = _re.compile(r"(\d{4})-(\d{1,2})")
+
+
+def _month(value) -> str | None:
+    """Returns "YYYY-MM" for an ISO-like date string, or None."""
+    if value is None:
+        return None
+    m = _MONTH_RE.search(str(value))
+    if not m or not 1 <= int(m.group(2)) <= 12:
+        return None
+    return f"{m.group(1)}-{int(m.group(2)):02d}"
+
+
+def _column_path(path: str, name: str, code: str) -> str:
+    return os.path.join(path, f"{name}.{_SUFFIX[code]}")
+
+
+class _Interner:
+    """Gives each distinct string a small int code, in first-seen order."""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def write(self, path: str, name: str):
+        blobs = [v.encode("utf-8", "surrogatepass") for v in self.values]
+        ends = array.array("q")
+        total = 0
+        for b in blobs:
+            total += len(b)
+            ends.append(total)
+        with open(os.path.join(path, f"{name}.strings"), "wb") as fh:
+            fh.write(b"".join(blobs))
+        with open(os.path.join(path, f"{name}.offsets"), "wb") as fh:
+            ends.tofile(fh)
+
+
+class ColumnarWriter:
+    """
+    This class appends scan results to a columnar store folder.
+    - add() takes one result dict as written by the scanner ("grouped", "hits" plus any kept fields).
+    - Columns are buffered and flushed every `batch` ads; close() writes the string tables and meta.json.
+    - Used as a context manager, an exception aborts the store: nothing more is written and
+      meta.json is left out, so the folder never reads as a finished store.
+    """
+
+    def __init__(self, path: str, employer_field: str = "employer", date_field: str = "date", batch: int = 65536):
+        self.path = path
+        self.employer_field = employer_field
+        self.date_field = date_field
+        self.batch = batch
+        os.makedirs(path, exist_ok=True)
+        # The columns below are truncated, so an older store's meta.json no longer describes them.
+        for name in ("meta.json", "meta.json.tmp"):
+            if os.path.exists(os.path.join(path, name)):
+                os.remove(os.path.join(path, name))
+        self._files = {name: open(_column_path(path, name, code), "wb") for name, code in _COLUMNS.items()}
+        self._buffers = {name: array.array(code) for name, code in _COLUMNS.items()}
+        self._categories = _Interner()
+        self._employers = _Interner()
+        self._months = _Interner()
+        self._terms = _Interner()
+        self._term_category = array.array("H")
+        self.n_docs = 0
+        self.n_hits = 0
+        self.n_spans = 0
+
+    def _term(self, cat: int, term: str) -> int:
+        term_code = self._terms.code((cat, term))
+        if term_code == len(self._term_category):
+            self._term_category.append(cat)
+        return term_code
+
+    def add(self, record: dict):
+        buf = self._buffers
+        employer = record.get(self.employer_field)
+        buf["docs.employer"].append(-1 if employer in (None, "") else self._employers.code(str(employer)))
+        month = _month(record.get(self.date_field))
+        buf["docs.month"].append(-1 if month is None else self._months.code(month))
+        # Rows of one ad stay grouped by category; the reports rely on that order.
+        for category, terms in (record.get("grouped") or {}).items():
+            cat = self._categories.code(category)
+            for term in dict.fromkeys(terms):
+                buf["hits.category"].append(cat)
+                buf["hits.term"].append(self._term(cat, term))
+                self.n_hits += 1
+        buf["docs.hit_end"].append(self.n_hits)
+        for hit in record.get("hits") or []:
+            cat = self._categories.code(hit["category"])
+            start, end = hit["span"]
+            buf["spans.category"].append(cat)
+            buf["spans.term"].append(self._term(cat, hit["term"]))
+            buf["spans.start"].append(start)
+            buf["spans.end"].append(end)
+            self.n_spans += 1
+        buf["docs.span_end"].append(self.n_spans)
+        self.n_docs += 1
+        if self.n_docs % self.batch == 0:
+            self._flush()
+
+    def _flush(self):
+        for name, buf in self._buffers.items():
+            buf.tofile(self._files[name])
+            del buf[:]
+
+    def abort(self):
+        """Closes the column files without flushing or writing meta.json; the folder stays unfinished."""
+        if self._files is None:
+            return
+        for fh in self._files.values():
+            fh.close()
+        self._files = None
+
+    def close(self):
+        if self._files is None:
+            return
+        self._flush()
+        for fh in self._files.values():
+            fh.close()
+        self._files = None
+        self._categories.write(self.path, "categories")
+        self._employers.write(self.path, "employers")
+        self._months.write(self.path, "months")
+        terms = _Interner()
+        terms.values = [term for _, term in self._terms.values]
+        terms.write(self.path, "terms")
+        with open(os.path.join(self.path, "terms.category.u16"), "wb") as fh:
+            self._term_category.tofile(fh)
+        meta = {
+            "version": STORE_VERSION,
+            "byteorder": sys.byteorder,
+            "n_docs": self.n_docs,
+            "n_hits": self.n_hits,
+            "n_spans": self.n_spans,
+            "employer_field": self.employer_field,
+            "date_field": self.date_field,
+        }
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(meta, fh, indent=2)
+        # meta.json is written last, so a store without it was never finished.
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+def build_store(results_path: str, store_path: str, employer_field: str = "employer",
+                date_field: str = "date") -> int:
+    """
+    This function converts a scan results JSONL file into a columnar store.
+    Lines are streamed one at a time, so the input can be larger than memory.
+    Returns the number of ads stored.
+    """
+    with ColumnarWriter(store_path, employer_field, date_field) as writer, \
+            open(results_path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                writer.add(json.loads(line))
+    return writer.n_docs
+
+
+class StringTable:
+    """Read-only string table; strings are decoded only when asked for."""
+
+    def __init__(self, path: str, name: str):
+        with open(os.path.join(path, f"{name}.strings"), "rb") as fh:
+            self._blob = fh.read()
+        self._ends = _load(os.path.join(path, f"{name}.offsets"), "int64")
+
+    def __len__(self) -> int:
+        return len(self._ends)
+
+    def __getitem__(self, i: int) -> str:
+        start = int(self._ends[i - 1]) if i > 0 else 0
+        return self._blob[start:int(self._ends[i])].decode("utf-8", "surrogatepass")
+
+    def index(self, value: str) -> int:
+        """Returns the code of `value`; raises KeyError when it is not in the table."""
+        for i in range(len(self)):
+            if self[i] == value:
+                return i
+        raise KeyError(value)
+
+    def tolist(self) -> list:
+        return [self[i] for i in range(len(self))]
+
+
+def _load(path: str, dtype: str):
+    # np.memmap refuses empty files; an empty store is still a valid store.
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+class Report:
+    """
+    Result of an aggregation: `counts[g, c]` ads of group `groups[g]` flagged for `categories[c]`,
+    out of `docs[g]` ads in that group.
+    """
+
+    def __init__(self, groups: list, categories: list, counts, docs):
+        self.groups = groups
+        self.categories = categories
+        self.counts = counts
+        self.docs = docs
+
+    @property
+    def rates(self):
+        return self.counts / np.maximum(self.docs, 1)[:, None]
+
+    def rows(self, min_docs: int = 1):
+        """Yields (group, category, flagged ads, ads in group, rate) for every non-empty cell."""
+        rates = self.rates
+        for g, c in zip(*np.nonzero(self.counts)):
+            if self.docs[g] >= min_docs:
+                yield self.groups[g], self.categories[c], int(self.counts[g, c]), int(self.docs[g]), float(rates[g, c])
+
+
+class ColumnarStore:
+    """
+    This class opens a columnar store for reporting.
+    - category_rates() gives the share of ads flagged per category, overall or per employer/month.
+    - top_terms() gives the terms flagged in the most ads.
+    - spans() gives the offsets of every hit in one ad.
+    Arrays are memory-mapped; nothing is read until a report needs it.
+    """
+
+    def __init__(self, path: str):
+        if not _HAS_NUMPY:
+            raise ValueError("Columnar reports need NumPy (pip install numpy).")
+        try:
+            with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as fh:
+                self.meta = json.load(fh)
+        except OSError:
+            raise ValueError(f"{path} is not a finished columnar store (no meta.json).") from None
+        if self.meta.get("version") != STORE_VERSION:
+            raise ValueError(f"{path}: unsupported store version {self.meta.get('version')}.")
+        if self.meta.get("byteorder") != sys.byteorder:
+            raise ValueError(f"{path} was written on a {self.meta.get('byteorder')}-endian machine.")
+        self.path = path
+        self.n_docs = int(self.meta["n_docs"])
+        self.n_hits = int(self.meta["n_hits"])
+        self.n_spans = int(self.meta["n_spans"])
+        self.columns = {name: _load(_column_path(path, name, code), _DTYPES[code]) for name, code in _COLUMNS.items()}
+        self.term_category = _load(os.path.join(path, "terms.category.u16"), "uint16")
+        self.categories = StringTable(path, "categories").tolist()
+        self.employers = StringTable(path, "employers")
+        self.months = StringTable(path, "months")
+        self.terms = StringTable(path, "terms")
+
+    def spans(self, doc: int) -> dict:
+        """
+        This function returns every hit of ad `doc` (in scan order) as NumPy arrays:
+        "category" and "term" codes (see .categories and .terms) and "start"/"end" character offsets.
+        """
+        if not 0 <= doc < self.n_docs:
+            raise IndexError(f"ad {doc} is not in this store ({self.n_docs} ads).")
+        ends = self.columns["docs.span_end"]
+        lo, hi = (int(ends[doc - 1]) if doc > 0 else 0), int(ends[doc])
+        return {name: np.asarray(self.columns[f"spans.{name}"][lo:hi])
+                for name in ("category", "term", "start", "end")}
+
+    def _group_codes(self, by: str | None):
+        # Returns (per-ad group codes, group labels); ads without a value go to a last "(none)" group.
+        if by is None:
+            return None, ["all"]
+        if by not in ("employer", "month"):
+            raise ValueError(f"Cannot group by {by!r}; use 'employer' or 'month'.")
+        table = self.employers if by == "employer" else self.months
+        labels = table.tolist() + ["(none)"]
+        return self.columns[f"docs.{by}"], labels
+
+    def _chunks(self):
+        # Yields (first ad, end ad, first hit row, end hit row) spans of about CHUNK_HITS rows.
+        ends = self.columns["docs.hit_end"]
+        doc = 0
+        while doc < self.n_docs:
+            hit_lo = int(ends[doc - 1]) if doc > 0 else 0
+            stop = int(np.searchsorted(ends, hit_lo + CHUNK_HITS, side="right"))
+            stop = min(self.n_docs, max(stop, doc + 1))
+            yield doc, stop, hit_lo, int(ends[stop - 1])
+            doc = stop
+
+    def _hit_docs(self, doc_lo: int, doc_hi: int, hit_lo: int):
+        # Ad index of every hit row in the span, rebuilt from the offsets.
+        ends = np.asarray(self.columns["docs.hit_end"][doc_lo:doc_hi])
+        lengths = np.diff(ends, prepend=hit_lo)
+        return np.repeat(np.arange(doc_lo, doc_hi, dtype=np.int64), lengths)
+
+    def category_rates(self, by: str | None = None) -> Report:
+        """
+        This function counts, per group, how many ads were flagged for each category.
+        `by` is None (whole corpus), "employer" or "month".
+        """
+        codes, groups = self._group_codes(by)
+        n_groups, n_cats = len(groups), max(1, len(self.categories))
+        counts = np.zeros(n_groups * n_cats, dtype=np.int64)
+        cat_col = self.columns["hits.category"]
+        for doc_lo, doc_hi, hit_lo, hit_hi in self._chunks():
+            if hit_hi == hit_lo:
+                continue
+            docs = self._hit_docs(doc_lo, doc_hi, hit_lo)
+            cats = np.asarray(cat_col[hit_lo:hit_hi], dtype=np.int64)
+            # Keep the first row of each (ad, category) run, so an ad counts once per category.
+            first = np.ones(len(docs), dtype=bool)
+            first[1:] = (docs[1:] != docs[:-1]) | (cats[1:] != cats[:-1])
+            docs, cats = docs[first], cats[first]
+            group = np.zeros(len(docs), dtype=np.int64) if codes is None else np.asarray(codes[docs], dtype=np.int64)
+            group[group < 0] = n_groups - 1
+            counts += np.bincount(group * n_cats + cats, minlength=n_groups * n_cats)
+        if codes is None:
+            docs_per_group = np.array([self.n_docs], dtype=np.int64)
+        else:
+            docs_per_group = np.zeros(n_groups, dtype=np.int64)
+            for start in range(0, self.n_docs, CHUNK_HITS):
+                group = np.asarray(codes[start:start + CHUNK_HITS], dtype=np.int64)
+                group[group < 0] = n_groups - 1
+                docs_per_group += np.bincount(group, minlength=n_groups)
+        if codes is not None and docs_per_group[-1] == 0:
+            # No ad lacks the field: drop the empty "(none)" group.
+            groups, docs_per_group = groups[:-1], docs_per_group[:-1]
+            counts = counts[:len(groups) * n_cats]
+        return Report(groups, self.categories, counts.reshape(len(groups), n_cats)[:, :len(self.categories)],
+                      docs_per_group)
+
+    def top_terms(self, n: int = 20, category: str | None = None, employer: str | None = None,
+                  month: str | None = None) -> list:
+        """
+        This function returns the `n` terms flagged in the most ads, as (category, term, ads) tuples.
+        The count can be limited to one category, one employer and/or one month.
+        """
+        term_col = self.columns["hits.term"]
+        counts = np.zeros(len(self.terms), dtype=np.int64)
+        filters = []
+        for by, value in (("employer", employer), ("month", month)):
+            if value is not None:
+                table = self.employers if by == "employer" else self.months
+                try:
+                    filters.append((self.columns[f"docs.{by}"], table.index(value)))
+                except KeyError:
+                    return []
+        for doc_lo, doc_hi, hit_lo, hit_hi in self._chunks():
+            if hit_hi == hit_lo:
+                continue
+            terms = np.asarray(term_col[hit_lo:hit_hi], dtype=np.int64)
+            if filters:
+                docs = self._hit_docs(doc_lo, doc_hi, hit_lo)
+                keep = np.ones(len(terms), dtype=bool)
+                for codes, code in filters:
+                    keep &= np.asarray(codes[docs]) == code
+                terms = terms[keep]
+            counts += np.bincount(terms, minlength=len(counts))
+        if category is not None:
+            if category not in self.categories:
+                return []
+            counts[np.asarray(self.term_category) != self.categories.index(category)] = 0
+        order = np.argsort(-counts, kind="stable")[:n]
+        return [(self.categories[int(self.term_category[i])], self.terms[int(i)], int(counts[i]))
+                for i in order if counts[i] > 0]
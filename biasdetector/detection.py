@@ -0,0 +1,865 @@
+"""
+Detection core for the Bias Detector.
+
+This module holds the lexicon, the regex rules and the detectors, with no
+Streamlit dependency, so both the web app and the batch scanner can import it.
+"""
+import functools
+import html as _html
+import re as _re
+from bisect import bisect_left, bisect_right
+
+try:
+    import numpy as _np
+    _HAS_NUMPY = True
+except Exception:
+    _HAS_NUMPY = False
+
+# --- Normalize Unicode hyphens/dashes to plain ASCII hyphen so regex matches work ---
+_HYPHENS_RE = _re.compile("[\u2010-\u2015]")
+def _normalize_hyphens(s: str) -> str:
+    # A regex sub is far faster than str.translate on large ads and returns s itself when nothing changes.
+    return _HYPHENS_RE.sub("-", s)
+
+ # This section defines the default lexicon for instant bias detection.
+ # Each category has:
+ # - phrases: exact words to match quickly
+ # - patterns: regex patterns for more flexible matches
+ # - rewrite: a suggested tip for more inclusive wording
+ # This list is intentionally small and simple for transparency.
+DEFAULT_LEXICON = {
+    "age bias": {
+        "phrases": ["young", "recent graduate", "new grad", "digital native", "under 30"],
+        "patterns": [r"\bunder\s*30\b"],
+        "rewrite": "Focus on skills or years of experience, not age."
+    },
+    "gender bias": {
+        "phrases": ["salesman"],
+        "patterns": [],
+        "rewrite": "Use gender-neutral language such as ‘salesperson’."
+    },
+    "language/ESL bias": {
+        "phrases": ["native English speaker", "no accent"],
+        "patterns": [r"\bnative\s+english\s+speaker\b", r"\bno\s+accent(s)?\b"],
+        "rewrite": "Specify communication skills (e.g., ‘excellent written and spoken English’)."
+    },
+    "cultural fit exclusion": {
+        "phrases": ["culture fit", "work hard play hard"],
+        "patterns": [r"\bculture\s*fit\b", r"\bwork\s*hard\s*play\s*hard\b"],
+        "rewrite": "Describe values and behaviours (e.g., collaboration), not vague ‘fit’ terms."
+    },
+    "nationality/visa bias": {
+        "phrases": ["visa sponsorship not available", "PR only"],
+        "patterns": [r"\bvisa\s*sponsorship\s*not\s*available\b", r"\bPR\s*only\b"],
+        "rewrite": "Say ‘must have the legal right to work in X’ instead of nationality restrictions."
+    },
+    "appearance bias": {
+        "phrases": ["well-presented", "well-groomed"],
+        "patterns": [],
+        "rewrite": "Focus on professionalism (e.g., ‘client-facing dress code’) rather than appearance."
+    }
+}
+
+ # These are simple regex rules for the "Quick Highlights" feature.
+ # Each rule matches obvious bias phrases and assigns a category label.
+ # Optional keys: "needs_context" (require a role noun nearby) and "window"
+ # (how many characters around the match to check for negations/role nouns).
+RULES = [
+    {"regex": r"\byoung\b", "label": "age bias", "weight": 1.0},
+    {"regex": r"\brecent\s*grad(uate)?\b|\bnew\s*grad\b", "label": "age bias", "weight": 1.0},
+    {"regex": r"\bdigital\s*native\b", "label": "age bias", "weight": 1.0},
+    {"regex": r"\bunder\s*30\b", "label": "age bias", "weight": 1.0},
+    {"regex": r"\bsalesman\b", "label": "gender bias", "weight": 1.0},
+    {"regex": r"\bnative\s+english\s+speaker\b", "label": "language/ESL bias", "weight": 1.0},
+    {"regex": r"\bno\s+accent(s)?\b", "label": "language/ESL bias", "weight": 1.0},
+    {"regex": r"\bculture\s*fit\b", "label": "cultural fit exclusion", "weight": 1.0},
+    {"regex": r"\bwork\s*hard\s*play\s*hard\b", "label": "cultural fit exclusion", "weight": 1.0},
+    {"regex": r"\bvisa\s*sponsorship\s*not\s*available\b", "label": "nationality/visa bias", "weight": 1.0},
+    {"regex": r"\bPR\s*only\b", "label": "nationality/visa bias", "weight": 1.0},
+    {"regex": r"\bwell[-\s]?presented\b|\bwell[-\s]?groomed\b", "label": "appearance bias", "weight": 1.0}
+]
+
+ # These regex patterns help reduce false positives in detection.
+NEGATION_RE = _re.compile(r"\b(no|not|without)\b", _re.IGNORECASE)  # Finds negation words.
+ROLE_NOUNS_RE = _re.compile(r"\b(candidate|applicant|hire|person|team|staff|employee)\b", _re.IGNORECASE)  # Finds job-related nouns.
+EOE_WHITELIST_RE = _re.compile(r"equal\s+opportunit(y|ies)|\beoe\b|reasonable\s+accommodation", _re.IGNORECASE)  # Finds EOE/anti-bias statements.
+# Every EOE statement contains one of these, so a text without them needs no regex pass (the slowest one here).
+_EOE_HINTS = ("equal", "eoe", "commodat")
+# Sentences end at . ! or ? followed by whitespace, or at a line break (bullet points rarely end in a full stop).
+SENTENCE_BREAK_RE = _re.compile(r"[.!?]\s+|\n\s*")
+
+try:
+    from re import _constants as _sre, _parser as _re_parser  # Python 3.11+
+except ImportError:  # pragma: no cover - older Pythons
+    import sre_constants as _sre
+    import sre_parse as _re_parser
+
+ # Characters that re.IGNORECASE matches to an ASCII letter but str.lower() does not map to it.
+_FOLD_EXTRA = {0x130: "i", 0x131: "i", 0x17F: "s"}
+_FOLD_EXTRA_RE = _re.compile("[\u0130\u0131\u017f]")
+
+def _fold(text: str) -> str | None:
+    # Lower-cases the text for prefix search; None if offsets would not line up.
+    if _FOLD_EXTRA_RE.search(text):
+        text = text.translate(_FOLD_EXTRA)
+    low = text.lower()
+    return low if len(low) == len(text) else None
+
+def _literal_prefixes(items) -> set | None:
+    """
+    Returns lower-case literal prefixes, one of which starts every match of a parsed pattern.
+    Returns None when the pattern does not start with plain ASCII literals.
+    """
+    i = 0
+    while i < len(items) and items[i][0] is _sre.AT:
+        i += 1  # \b, ^ etc. consume no text
+    if i == len(items):
+        return None
+    op, av = items[i]
+    if op is _sre.LITERAL:
+        run = []
+        while i < len(items) and items[i][0] is _sre.LITERAL:
+            run.append(chr(items[i][1]))
+            i += 1
+        prefix = "".join(run).lower()
+        return {prefix} if prefix.isascii() else None
+    if op is _sre.BRANCH:
+        out = set()
+        for branch in av[1]:
+            sub = _literal_prefixes(branch)
+            if not sub:
+                return None
+            out |= sub
+        return out
+    if op is _sre.SUBPATTERN:
+        return _literal_prefixes(av[-1])
+    return None
+
+def _trie_regex(words) -> str:
+    """
+    Returns a regex matching any of `words`, nested as a character trie
+    (e.g. "ab|ac" becomes "a(?:b|c)"), so the cost per text position depends on
+    the length of the words rather than how many there are.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def _emit(node) -> str:
+        ends = "" in node
+        alts = []
+        for ch in sorted(k for k in node if k):
+            alts.append(_re.escape(ch) + _emit(node[ch]))
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        if ends:
+            body = (body if len(alts) > 1 else "(?:" + body + ")") + "?"
+        return body
+
+    return _emit(trie)
+
+# --- Variant matching: lexicon phrases also match simple word variants ---
+# Text is split into word tokens and each token is reduced to a light stem, so
+# "salesmen", "grads", "youthful" or "well groomed" meet the lexicon's
+# "salesman", "new grad", "young" and "well-groomed" without extra regexes.
+_TOKEN_RE = _re.compile(r"[^\W_]+")
+# What may sit between two words of a phrase (at most 3 chars): whitespace, a comma, slash or "&",
+# a straight or curly apostrophe, a hyphen or a Unicode dash (U+2010 to U+2015).
+_GAP_RE = _re.compile("[\\s,/&'’‐-―-]{0,3}")
+# Word families the suffix rules cannot reach.
+_DERIVED = {"youth": "young", "youngster": "young", "graduat": "grad"}
+# Words ending in -s that are not plurals ("news" is not "new").
+_NOT_PLURAL = frozenset({"news", "series", "species"})
+# Stems the suffix rules must not produce: "grader" and "grading" are not graduates.
+_NOT_SUFFIXED = frozenset({"grad"})
+_SUFFIXES = ("ing", "est", "ful", "ed", "er")
+# Characters that continue a token; a phrase may only start where the previous character is not one.
+_WORD_CHAR_RE = _re.compile(r"[^\W_]")
+
+@functools.lru_cache(maxsize=65536)
+def _stem(token: str) -> str:
+    """
+    Returns a light stem of a lower-case token: plurals, -ing/-est/-ful/-ed/-er endings
+    and a final -e are dropped, and "-men" becomes "-man".
+    """
+    if len(token) <= 3 or not token.isalpha():
+        return token
+    if token.endswith("men") and len(token) >= 6:
+        token = token[:-3] + "man"
+    elif token.endswith("ies") and len(token) > 4:
+        token = token[:-3] + "y"
+    elif token.endswith("sses"):
+        token = token[:-2]
+    elif token.endswith("s") and not token.endswith(("ss", "us", "is")) and token not in _NOT_PLURAL:
+        token = token[:-1]
+    token = _DERIVED.get(token, token)
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 4 and token[:-len(suffix)] not in _NOT_SUFFIXED:
+            token = token[:-len(suffix)]
+            break
+    if token.endswith("e") and len(token) >= 6:
+        token = token[:-1]
+    return _DERIVED.get(token, token)
+
+def _start_key(stem: str) -> str:
+    """Returns text that every token with this stem starts with (the stem, unless -man or -y was rewritten)."""
+    if stem.endswith("man") and len(stem) >= 6:
+        return stem[:-2]
+    if stem.endswith("y") and len(stem) >= 3:
+        return stem[:-1]
+    return stem
+
+def _start_keys(token_trie: dict) -> dict:
+    # Start keys of every stem a phrase can begin with, including the words _DERIVED maps onto it.
+    # A key maps to True when it must be the whole word: stems of two letters or fewer are never shortened.
+    stems = {st for st in token_trie if st} | {src for src, st in _DERIVED.items() if st in token_trie}
+    keys = {}
+    for st in stems:
+        key = _start_key(st)
+        keys[key] = keys.get(key, True) and len(st) <= 2
+    return keys
+
+def _phrase_stems(phrase: str) -> list:
+    """Returns the token stem sequences a phrase matches: its words, and for two words also both run together."""
+    words = [w.lower() for w in _TOKEN_RE.findall(phrase)]
+    if not words:
+        return []
+    out = [[_stem(w) for w in words]]
+    if len(words) == 2:
+        out.append([_stem("".join(words))])  # "wellgroomed", "culturefit"
+    return out
+
+def _token_trie(lexicon: dict) -> dict:
+    """
+    Builds a trie of stem sequences for every lexicon phrase.
+    Each node maps a stem to the next node; key "" lists the [category, phrase] pairs ending there.
+    """
+    trie = {}
+    for cat, cfg in lexicon.items():
+        for phrase in cfg.get("phrases", []):
+            for stems in _phrase_stems(phrase or ""):
+                node = trie
+                for st in stems:
+                    node = node.setdefault(st, {})
+                ends = node.setdefault("", [])
+                if [cat, phrase] not in ends:
+                    ends.append([cat, phrase])
+    return trie
+
+class _MatchEngine:
+    """
+    This class compiles RULES and a lexicon into one matching engine.
+    - Literal phrases are compared directly against the lower-cased text, with no regex.
+    - The literal prefixes of all patterns (e.g. "young", "recent", "new") are joined
+      into one trie-shaped alternation, which finds every candidate position in a
+      single pass over the lower-cased text, however many terms there are.
+    - Only the patterns whose prefix sits at a candidate are then tried there.
+    - Regex patterns are compiled on first use.
+    The results are identical to running re.finditer (IGNORECASE) per pattern.
+    - Lexicon phrases are also compiled into a trie of token stems; token_matches() walks it
+      from every word that can start a phrase, finding word variants in one pass.
+    The engine can be saved with to_index() and rebuilt with from_index(), which
+    skips parsing every pattern again.
+    """
+
+    def __init__(self, rules: list, lexicon: dict):
+        # Identical pattern strings are compiled once and shared by every rule/category.
+        patterns = []
+        literals = []
+        pattern_ids = {}
+
+        def _pid(pat: str, literal: str | None = None) -> int:
+            if pat not in pattern_ids:
+                pattern_ids[pat] = len(patterns)
+                patterns.append(pat)
+                literals.append(literal)
+            return pattern_ids[pat]
+
+        rule_pids = [_pid(rule["regex"]) for rule in rules]
+        # Per category: (hit type, lexicon term or None for "use the matched text", pattern index).
+        lex_items = {}
+        for cat, cfg in lexicon.items():
+            items = [("phrase", ph, _pid(_re.escape(ph), ph.lower() if ph.isascii() else None))
+                     for ph in cfg.get("phrases", []) if ph]
+            items += [("pattern", None, _pid(p)) for p in cfg.get("patterns", [])]
+            lex_items[cat] = items
+
+        # prefix -> pattern indexes; patterns without a usable prefix keep the plain finditer path.
+        by_prefix = {}
+        separate_ids = []
+        for i, pat in enumerate(patterns):
+            prefixes = {literals[i]} if literals[i] else _literal_prefixes(_re_parser.parse(pat))
+            if not prefixes:
+                separate_ids.append(i)
+                continue
+            for prefix in prefixes:
+                by_prefix.setdefault(prefix, []).append(i)
+        token_trie = _token_trie(lexicon)
+        # Phrase starts for variant matching are found by the same prefix pass as the patterns.
+        scan_prefixes = set(by_prefix) | set(_start_keys(token_trie))
+        self._setup(list(rules), patterns, literals, rule_pids, lex_items, by_prefix, separate_ids,
+                    _trie_regex(scan_prefixes) if by_prefix else None, token_trie)
+
+    def _setup(self, rules, patterns, literals, rule_pids, lex_items, by_prefix, separate_ids, prefix_regex,
+               token_trie):
+        self.rules = rules
+        self.patterns = patterns
+        self.rule_pids = rule_pids
+        self.lex_items = lex_items
+        self._literals = literals
+        self._by_prefix = by_prefix
+        self._separate_ids = separate_ids
+        self._compiled = [None] * len(patterns)
+        self._prefix_lengths = sorted({len(p) for p in by_prefix})
+        self._prefix_source = prefix_regex
+        self._prefix_re = _re.compile(prefix_regex) if prefix_regex else None
+        self.forget()
+        self.token_trie = token_trie
+        # Every word that can start a phrase begins with one of these, so starts are found by prefix.
+        self._token_starts = _start_keys(token_trie)
+        self._token_start_lengths = sorted({len(p) for p in self._token_starts})
+        self._token_start_re = _re.compile(
+            r"(?<![^\W_])(?:" + _trie_regex(self._token_starts) + r")[^\W_]*", _re.IGNORECASE
+        ) if self._token_starts else None
+
+    def forget(self):
+        # One-entry memo so find_bias_lexicon and find_bias_rules share a scan of the same text.
+        self._last = (None, None, None, None)
+
+    def to_index(self) -> dict:
+        """Returns everything needed to rebuild this engine, as JSON-friendly data."""
+        return {
+            "rules": self.rules,
+            "patterns": self.patterns,
+            "literals": self._literals,
+            "rule_pids": self.rule_pids,
+            "lex_items": {cat: [list(item) for item in items] for cat, items in self.lex_items.items()},
+            "by_prefix": self._by_prefix,
+            "separate_ids": self._separate_ids,
+            "prefix_regex": self._prefix_source,
+            "token_trie": self.token_trie,
+        }
+
+    @classmethod
+    def from_index(cls, index: dict) -> "_MatchEngine":
+        engine = cls.__new__(cls)
+        engine._setup(
+            list(index["rules"]),
+            list(index["patterns"]),
+            list(index["literals"]),
+            list(index["rule_pids"]),
+            {cat: [tuple(item) for item in items] for cat, items in index["lex_items"].items()},
+            {prefix: list(ids) for prefix, ids in index["by_prefix"].items()},
+            list(index["separate_ids"]),
+            index["prefix_regex"],
+            index["token_trie"],
+        )
+        return engine
+
+    def _regex(self, i: int):
+        rx = self._compiled[i]
+        if rx is None:
+            rx = self._compiled[i] = _re.compile(self.patterns[i], _re.IGNORECASE)
+        return rx
+
+    def pattern_matches(self, text: str) -> list:
+        """Returns, for every pattern, its non-overlapping matches as (start, end, matched_text)."""
+        return self._scan(text)[0]
+
+    def _scan(self, text: str):
+        # Returns (pattern matches, positions where a variant phrase may start, folded text);
+        # the last two are None when the text could not be folded.
+        last = self._last
+        if last[0] is not None and (last[0] is text or last[0] == text):
+            return last[1:]
+
+        found = [[] for _ in self.patterns]
+        low = _fold(text) if self._prefix_re is not None else None
+        if low is not None:
+            # Each pattern may only match again after its previous match ended (like finditer).
+            next_ok = [0] * len(self.patterns)
+            by_prefix = self._by_prefix
+            lengths = self._prefix_lengths
+            literals = self._literals
+            search = self._prefix_re.search
+            token_starts, start_lengths = self._token_starts, self._token_start_lengths
+            is_word = _WORD_CHAR_RE.match
+            starts = []
+            pos, n = 0, len(low)
+            while pos <= n:
+                m = search(low, pos)
+                if m is None:
+                    break
+                p = m.start()
+                if not (p and is_word(low, p - 1)):
+                    for k in start_lengths:
+                        whole = token_starts.get(low[p:p + k])
+                        if whole is not None and not (whole and is_word(low, p + k)):
+                            starts.append(p)
+                            break
+                # Several prefixes may start here ("no", "not"); try their patterns in order.
+                cands = []
+                for k in lengths:
+                    if p + k > n:
+                        break
+                    ids = by_prefix.get(low[p:p + k])
+                    if ids:
+                        cands.extend(ids)
+                if len(cands) > 1:
+                    cands.sort()
+                for i in cands:
+                    if p < next_ok[i]:
+                        continue
+                    lit = literals[i]
+                    if lit is not None:
+                        # A literal phrase is its own prefix, so finding it here is the match.
+                        e = p + len(lit)
+                        found[i].append((p, e, text[p:e]))
+                        next_ok[i] = e
+                        continue
+                    mi = self._regex(i).match(text, p)
+                    if mi is None:
+                        continue
+                    s, e = mi.span()
+                    found[i].append((s, e, mi.group(0)))
+                    next_ok[i] = e if e > s else e + 1
+                pos = p + 1
+            separate = self._separate_ids
+        else:
+            separate = range(len(self.patterns))
+            starts = None
+        for i in separate:
+            found[i] = [(m.start(), m.end(), m.group(0)) for m in self._regex(i).finditer(text)]
+
+        self._last = (text, found, starts, low)
+        return found, starts, low
+
+    def token_matches(self, text: str) -> list:
+        """
+        Returns (start, end, category, phrase) for every lexicon phrase whose word stems appear
+        in order in the text, separated only by spaces, hyphens or commas.
+        Spans cover whole words of the original text, e.g. "Salesmen" or "well groomed".
+        """
+        if self._token_start_re is None:
+            return []
+        _, starts, low = self._scan(text)
+        if starts is None:
+            low = text  # Words are lower-cased one by one below.
+            starts = [m.start() for m in self._token_start_re.finditer(text)]
+        elif not starts:
+            return []
+        out = []
+        trie, stem = self.token_trie, _stem
+        match, search, gap = _TOKEN_RE.match, _TOKEN_RE.search, _GAP_RE.fullmatch
+        for p in starts:
+            tok = match(low, p)
+            if tok is None:
+                continue
+            word = tok.group().lower()
+            node = trie.get(stem(word))
+            if node is None or (len(node) == 1 and "" in node
+                                    and all(phrase.lower() == word for _, phrase in node[""])):
+                continue  # Not a phrase start, or one-word phrases the exact matches already found.
+            while node is not None:
+                ends = node.get("")
+                if ends:
+                    for cat, phrase in ends:
+                        out.append((p, tok.end(), cat, phrase))
+                    if len(node) == 1:
+                        break
+                nxt = search(low, tok.end())
+                if nxt is None or not gap(low, tok.end(), nxt.start()):
+                    break
+                tok = nxt
+                node = node.get(stem(tok.group().lower()))
+        return out
+
+ # The default engine is built once at import time; other lexicons are compiled on first use.
+_DEFAULT_ENGINE = _MatchEngine(RULES, DEFAULT_LEXICON)
+_LEXICON_ENGINES = {}
+# Engines prebuilt by a lexicon pack (see lexicon.py), looked up by the identity of its dict.
+_REGISTERED_ENGINES = {}
+
+def register_engine(lexicon: dict, engine: _MatchEngine):
+    _REGISTERED_ENGINES[id(lexicon)] = (lexicon, engine)
+
+def unregister_engine(lexicon: dict):
+    _REGISTERED_ENGINES.pop(id(lexicon), None)
+
+def _engine_for(lexicon: dict) -> _MatchEngine:
+    if lexicon is DEFAULT_LEXICON:
+        return _DEFAULT_ENGINE
+    entry = _REGISTERED_ENGINES.get(id(lexicon))
+    if entry is not None and entry[0] is lexicon:
+        return entry[1]
+    key = tuple(
+        (cat, tuple(cfg.get("phrases", [])), tuple(cfg.get("patterns", [])))
+        for cat, cfg in lexicon.items()
+    )
+    engine = _LEXICON_ENGINES.get(key)
+    if engine is None:
+        engine = _LEXICON_ENGINES[key] = _MatchEngine([], lexicon)
+    return engine
+
+def _rules_engine(lexicon: dict | None) -> _MatchEngine:
+    # A pack's engine carries the pack's rules; any other lexicon is checked with RULES.
+    entry = _REGISTERED_ENGINES.get(id(lexicon)) if lexicon is not None else None
+    if entry is not None and entry[0] is lexicon:
+        return entry[1]
+    return _DEFAULT_ENGINE
+
+ # This dictionary sets the highlight color for each bias category.
+HIGHLIGHT_COLORS = {
+    "age bias": "#fde68a",
+    "language/ESL bias": "#bfdbfe",
+    "cultural fit exclusion": "#fecaca",
+    "gender bias": "#fbcfe8",
+    "nationality/visa bias": "#fcd34d",
+    "appearance bias": "#fca5a5",
+}
+
+ # These are short reasons explaining why each bias category is risky.
+ # They appear under "Why these were flagged" in the UI.
+LABEL_EXPLANATIONS = {
+    "language/ESL bias": "ESL = English as a Second Language. Flags wording that excludes non-native speakers.",
+    "age bias": "Wording that implies preference based on age (e.g., 'young', 'recent grad').",
+    "cultural fit exclusion": "Vague 'fit' language that can gatekeep or hide subjective preferences.",
+    "gender bias": "Gendered terms or titles (e.g., 'salesman', 'chairman').",
+}
+
+def category_color(category: str, lexicon: dict | None = None) -> str:
+    """Returns the highlight color of a category: the lexicon's own "color", else HIGHLIGHT_COLORS."""
+    cfg = (lexicon or {}).get(category) or {}
+    return cfg.get("color") or HIGHLIGHT_COLORS.get(category, "#e5e7eb")
+
+def category_explanation(category: str, lexicon: dict | None = None) -> str | None:
+    """Returns why a category is risky: the lexicon's own "explanation", else LABEL_EXPLANATIONS."""
+    cfg = (lexicon or {}).get(category) or {}
+    return cfg.get("explanation") or LABEL_EXPLANATIONS.get(category)
+
+def _escape_html(s: str) -> str:
+    # Escapes HTML so user text can be safely shown with highlights.
+    return _html.escape(s, quote=False)
+
+class Hit:
+    """
+    One detected term with its exact position in the text.
+    Both detectors return these, and the HTML builder and grouping read them directly.
+    Rule hits carry their rule's weight; lexicon hits use 1.0.
+    """
+    __slots__ = ("category", "type", "term", "start", "end", "weight")
+
+    def __init__(self, category: str, type: str, term: str, start: int, end: int, weight: float = 1.0):
+        self.category = category
+        self.type = type
+        self.term = term
+        self.start = start
+        self.end = end
+        self.weight = weight
+
+    @property
+    def span(self) -> tuple:
+        return (self.start, self.end)
+
+    def to_dict(self) -> dict:
+        return {"category": self.category, "type": self.type, "term": self.term, "span": [self.start, self.end]}
+
+    def __eq__(self, other):
+        if not isinstance(other, Hit):
+            return NotImplemented
+        return (self.category, self.type, self.term, self.start, self.end) == \
+            (other.category, other.type, other.term, other.start, other.end)
+
+    def __repr__(self):
+        return f"Hit({self.category!r}, {self.type!r}, {self.term!r}, {self.start}, {self.end})"
+
+    def shifted(self, offset: int) -> "Hit":
+        return Hit(self.category, self.type, self.term, self.start + offset, self.end + offset, self.weight)
+
+def _span_key(h: Hit) -> tuple:
+    return (h.start, h.end)
+
+class _OffsetIndex:
+    """
+    Sorted start/end offsets of every match of a regex in one text.
+    Built with a single finditer pass, then answers window questions with bisect.
+    """
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, regex, text: str):
+        self.starts = []
+        self.ends = []
+        for m in regex.finditer(text):
+            self.starts.append(m.start())
+            self.ends.append(m.end())
+
+    def any_within(self, lo: int, hi: int) -> bool:
+        # Matches never overlap, so the first one starting at/after lo also ends first.
+        i = bisect_left(self.starts, lo)
+        return i < len(self.starts) and self.ends[i] <= hi
+
+class _SentenceIndex:
+    """
+    Start offsets of the sentences of one text, from a single finditer pass.
+    Sentence i runs from starts[i] up to starts[i + 1] (its trailing break included).
+    """
+    __slots__ = ("starts", "length")
+
+    def __init__(self, text: str):
+        self.length = len(text)
+        self.starts = [0]
+        for m in SENTENCE_BREAK_RE.finditer(text):
+            if 0 < m.end() < len(text):
+                self.starts.append(m.end())
+
+    def of(self, pos: int) -> int:
+        """Index of the sentence containing offset `pos`."""
+        return bisect_right(self.starts, pos) - 1
+
+    def span(self, i: int, text: str) -> tuple:
+        """(start, end) of sentence i without its trailing whitespace."""
+        start = self.starts[i]
+        end = self.starts[i + 1] if i + 1 < len(self.starts) else self.length
+        return start, start + len(text[start:end].rstrip())
+
+def sentence_spans(text: str, lo: int = 0, hi: int | None = None) -> list:
+    """
+    Returns (start, end) offsets of the non-empty sentences of text[lo:hi], without surrounding whitespace.
+    Sentences end where SENTENCE_BREAK_RE breaks them, as for the EOE whitelist.
+    """
+    hi = len(text) if hi is None else hi
+    spans = []
+    pos = lo
+    for m in list(SENTENCE_BREAK_RE.finditer(text, lo, hi)) + [None]:
+        end = m.end() if m else hi
+        chunk = text[pos:end]
+        stripped = chunk.strip()
+        if stripped:
+            start = pos + len(chunk) - len(chunk.lstrip())
+            spans.append((start, start + len(stripped)))
+        pos = end
+    return spans
+
+# One-entry memo, so find_bias_rules and sentence_risk split the same text once.
+_LAST_SENTENCES = (None, None)
+
+def _sentences_for(text: str) -> _SentenceIndex:
+    global _LAST_SENTENCES
+    last_text, index = _LAST_SENTENCES
+    if last_text is None or not (last_text is text or last_text == text):
+        index = _SentenceIndex(text)
+        _LAST_SENTENCES = (text, index)
+    return index
+
+def clear_memos():
+    """Forgets the last scan and sentence split, so the next detector call pays its full cost (for benchmarks)."""
+    global _LAST_SENTENCES
+    _LAST_SENTENCES = (None, None)
+    _DEFAULT_ENGINE.forget()
+    for engine in _LEXICON_ENGINES.values():
+        engine.forget()
+    for _, engine in _REGISTERED_ENGINES.values():
+        engine.forget()
+
+def _eoe_matches(text: str, pos: int = 0, endpos: int | None = None):
+    """EOE_WHITELIST_RE.finditer(text, pos, endpos), skipped when no EOE statement can be in `text`."""
+    low = text.lower()
+    if not any(hint in low for hint in _EOE_HINTS):
+        return ()
+    return EOE_WHITELIST_RE.finditer(text, pos, len(text) if endpos is None else endpos)
+
+def find_bias_rules(text: str, window: int = 40, whitelist: bool = True, lexicon: dict | None = None):
+    """
+    This function checks the text for obvious bias phrases using regex rules.
+    - Skips matches in a sentence with an EOE (equal opportunity) statement, unless whitelist=False.
+      The rest of the text is still checked.
+    - Ignores matches with a negation shortly before them in the same sentence (e.g., "not young").
+    - A rule may set its own "window" (in characters); otherwise `window` is used.
+    - With the `lexicon` of a pack that has its own rules (see lexicon.py), those are used instead of RULES.
+    - Returns a list of hits and a simple score per category.
+    """
+    hits = []
+    scores = {}
+
+    # All rule matches come from one pass of the compiled engine.
+    engine = _rules_engine(lexicon)
+    found = engine.pattern_matches(text)
+    # Sentences, EOE sentences, negation and role-noun offsets are indexed once per text, only if needed.
+    sentences = None
+    eoe = ()
+    negations = None
+    role_nouns = None
+    for rule, pid in zip(engine.rules, engine.rule_pids):
+        if not found[pid]:
+            continue
+        label = rule["label"]
+        weight = float(rule.get("weight", 1.0))
+        needs_ctx = bool(rule.get("needs_context", False))
+        rule_window = int(rule.get("window", window))
+        if sentences is None:
+            sentences = _sentences_for(text)
+            negations = _OffsetIndex(NEGATION_RE, text)
+            if whitelist:
+                eoe = {sentences.of(m.start()) for m in _eoe_matches(text)}
+        if needs_ctx and role_nouns is None:
+            role_nouns = _OffsetIndex(ROLE_NOUNS_RE, text)
+
+        # For each regex match, check its sentence, negation and context.
+        for s, e, term in found[pid]:
+            sent = sentences.of(s)
+            # Skip anything inside an anti-bias statement.
+            if sent in eoe:
+                continue
+            # Skip if 'no/not/without' appears shortly before the match, in the same sentence.
+            if negations.any_within(max(sentences.starts[sent], s - rule_window), s):
+                continue
+            # Optionally require a job role noun near the match.
+            if needs_ctx and not role_nouns.any_within(max(0, s - rule_window), min(len(text), e + rule_window)):
+                continue
+
+            hits.append(Hit(label, "pattern", term, s, e, weight))
+            scores[label] = scores.get(label, 0.0) + weight
+
+    return hits, scores
+
+def sentence_risk(text: str, rule_hits: list) -> list:
+    """
+    This function ranks the sentences of `text` by the weights of the rule hits in them.
+    - Scores per sentence and category are summed in one matrix (with NumPy when it is installed).
+    - Returns {"span": [start, end], "risk": total weight, "categories": {label: weight}} for every
+      sentence with a hit, riskiest first (ties in document order).
+    """
+    if not rule_hits:
+        return []
+    sentences = _sentences_for(text)
+    labels = list(dict.fromkeys(h.category for h in rule_hits))
+    column = {label: j for j, label in enumerate(labels)}
+    if _HAS_NUMPY:
+        rows = _np.searchsorted(_np.asarray(sentences.starts), [h.start for h in rule_hits], side="right") - 1
+        matrix = _np.zeros((len(sentences.starts), len(labels)))
+        _np.add.at(matrix, (rows, [column[h.category] for h in rule_hits]), [h.weight for h in rule_hits])
+        risk = matrix.sum(axis=1)
+        flagged = _np.flatnonzero(risk)
+        order = flagged[_np.argsort(-risk[flagged], kind="stable")].tolist()
+        by_sentence = {i: matrix[i].tolist() for i in order}
+    else:
+        by_sentence = {}
+        for h in rule_hits:
+            by_sentence.setdefault(sentences.of(h.start), [0.0] * len(labels))[column[h.category]] += h.weight
+        order = sorted(by_sentence, key=lambda i: (-sum(by_sentence[i]), i))
+    out = []
+    for i in order:
+        row = by_sentence[i]
+        out.append({
+            "span": list(sentences.span(i, text)),
+            "risk": round(float(sum(row)), 6),
+            "categories": {label: round(float(v), 6) for label, v in zip(labels, row) if v},
+        })
+    return out
+
+# This function checks the text for bias using the phrase and pattern lexicon.
+# Every occurrence of a phrase is reported, with its exact span.
+# Word variants of a phrase ("salesmen", "grads") are reported as "variant" hits with the text as written,
+# unless an exact match of the same category already covers them.
+def find_bias_lexicon(text: str, lexicon: dict, variants: bool = True) -> list:
+    hits = []
+    # Phrases and patterns for every category are found in one pass of the compiled engine.
+    engine = _engine_for(lexicon)
+    found = engine.pattern_matches(text)
+    for cat, items in engine.lex_items.items():
+        for kind, phrase, pid in items:
+            for s, e, term in found[pid]:
+                hits.append(Hit(cat, kind, phrase or term, s, e))
+    matches = engine.token_matches(text) if variants else []
+    if matches:
+        # Per category: exact spans sorted by start, with the furthest end reached so far.
+        covered = {}
+        for h in hits:
+            covered.setdefault(h.category, []).append((h.start, h.end))
+        reach = {}
+        for cat, spans in covered.items():
+            spans.sort()
+            furthest, ends = -1, []
+            for _, e in spans:
+                furthest = max(furthest, e)
+                ends.append(furthest)
+            reach[cat] = ([st for st, _ in spans], ends)
+        seen = set()
+        for s, e, cat, _ in matches:
+            starts, ends = reach.get(cat, ((), ()))
+            j = bisect_left(starts, e)
+            if (j and ends[j - 1] > s) or (cat, s, e) in seen:
+                continue
+            seen.add((cat, s, e))
+            hits.append(Hit(cat, "variant", text[s:e], s, e))
+    return hits
+
+# This function creates HTML for the "Quick Highlights" tab.
+# It wraps risky terms in <mark> tags with category colors (a lexicon's own colors first).
+def build_highlighted_html(text: str, lex_hits: list, rule_hits: list, lexicon: dict | None = None) -> str:
+    # Every hit already carries its span, so no re-searching is needed.
+    spans = sorted(list(lex_hits) + list(rule_hits), key=_span_key)
+
+    # Merge overlapping spans (keep the longer one).
+    merged = []
+    for sp in spans:
+        if not merged:
+            merged.append(sp); continue
+        last = merged[-1]
+        if sp.start <= last.end:
+            if (sp.end - sp.start) > (last.end - last.start):
+                merged[-1] = sp
+        else:
+            merged.append(sp)
+
+    # Build the HTML with highlights.
+    out = []; cursor = 0
+    for sp in merged:
+        if cursor < sp.start:
+            out.append(_escape_html(text[cursor:sp.start]))
+        chunk = _escape_html(text[sp.start:sp.end])
+        color = category_color(sp.category, lexicon)
+        out.append(
+            f'<mark style="background:{color}; padding:0 3px; border-radius:3px;">{chunk}</mark>'
+        )
+        cursor = sp.end
+    if cursor < len(text):
+        out.append(_escape_html(text[cursor:]))
+
+    return "<div style='line-height:1.8'>" + "".join(out) + "</div>"
+
+# This function renders colored "pills" for each bias category found.
+def render_legend(labels: list, lexicon: dict | None = None):
+    pills = []
+    for lb in labels:
+        color = category_color(lb, lexicon)
+        pills.append(
+            f"<span style='display:inline-block; padding:4px 8px; margin:2px; "
+            f"border-radius:999px; background:{color}; font-size:12px'>{_escape_html(lb)}</span>"
+        )
+    return "<div style='margin-top:6px'>" + "".join(pills) + "</div>"
+
+# This function lists the categories found, in first-seen order (for the legend).
+def found_labels(lex_hits: list, rule_hits: list) -> list:
+    labels = []
+    for hits in (lex_hits or [], rule_hits or []):
+        for h in hits:
+            if h.category and h.category not in labels:
+                labels.append(h.category)
+    return labels
+
+# This function groups all detected terms by bias category for UI and Gemini.
+def group_hits_by_label(lex_hits: list, rule_hits: list):
+    grouped = {}
+    seen = set()
+    for hits in (lex_hits or [], rule_hits or []):
+        for h in hits:
+            # Remove duplicates while keeping first-seen order.
+            if (h.category, h.term) not in seen:
+                seen.add((h.category, h.term))
+                grouped.setdefault(h.category, []).append(h.term)
+    return grouped
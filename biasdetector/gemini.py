@@ -0,0 +1,569 @@
+"""
+Gemini client for the Bias Detector.
+
+The model resolver is a process-wide singleton, so every Streamlit session
+(and every batch call) shares one resolved model instead of re-probing the
+candidate list on each Analyze click.
+"""
+import hashlib
+import json
+import os
+import queue as _queue
+import threading
+import time
+
+from . import metrics
+from .admission import FLIGHTS, GeminiBusy, get_gemini_queue
+from .breaker import CircuitOpen, get_breaker
+from .cache import ResponseCache, make_key
+from .detection import _normalize_hyphens
+from .paths import cache_dir
+from .prompts import GEMINI_SYSTEM_PROMPT
+
+# The Gemini SDK takes about a second to import, so it is loaded on first use
+# (or by warm_up() in the background) instead of when this module is imported.
+# _HAS_GEMINI stays None until the import has been tried.
+genai = None
+_HAS_GEMINI = None
+_GENAI_LOCK = threading.Lock()
+_WARM_UP_STARTED = False
+
+
+def _load_genai():
+    """
+    This function imports google.generativeai once and returns it (None if it is not installed).
+    If it is not available, AI features are disabled.
+    """
+    global genai, _HAS_GEMINI
+    if _HAS_GEMINI is not None:
+        return genai if _HAS_GEMINI else None
+    with _GENAI_LOCK:
+        if _HAS_GEMINI is None:
+            try:
+                import google.generativeai as _genai
+                genai, _HAS_GEMINI = _genai, True
+            except Exception:
+                _HAS_GEMINI = False
+    return genai if _HAS_GEMINI else None
+
+
+def has_gemini() -> bool:
+    """True when the Gemini SDK can be imported (imports it on first call)."""
+    return _load_genai() is not None
+
+
+def warm_up():
+    """
+    This function imports the Gemini SDK in a daemon thread, once per process.
+    Call it after the page has been drawn so the import overlaps with the user reading it.
+    """
+    global _WARM_UP_STARTED
+    if not _api_key():
+        return  # Nothing will call Gemini, so skip the import entirely.
+    with _GENAI_LOCK:
+        if _WARM_UP_STARTED or _HAS_GEMINI is not None:
+            return
+        _WARM_UP_STARTED = True
+    threading.Thread(target=_load_genai, name="biasdetector-genai-warmup", daemon=True).start()
+
+# Model names tried in order when no working model is known yet.
+FALLBACK_CANDIDATES = [
+    "models/gemini-2.5-flash",
+    "models/gemini-2.5-pro",
+    "models/gemini-2.5-flash-preview-05-20",
+    "models/gemini-2.5-pro-preview-06-05",
+    "models/gemini-2.5-pro-preview-03-25",
+    "models/gemini-2.5-flash-lite-preview-06-17",
+    "models/gemini-1.5-pro-latest",
+    "models/gemini-1.5-flash-latest",
+    "gemini-1.5-pro-latest",
+    "gemini-1.5-flash-latest",
+    "gemini-1.0-pro",
+]
+
+NOT_CONFIGURED_MSG = (
+    "⚠️ Gemini is not configured. Set the GOOGLE_API_KEY environment variable "
+    "(in a .env file or your shell), then reload the app."
+)
+
+
+def _api_key() -> str | None:
+    return os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
+
+
+def _full_name(name: str) -> str:
+    return name if name.startswith("models/") else f"models/{name}"
+
+
+def is_model_not_found(exc: Exception) -> bool:
+    """True when a Gemini error means the model name itself is unknown or unsupported."""
+    if type(exc).__name__ == "NotFound":
+        return True
+    msg = str(exc).lower()
+    return ("404" in msg and "model" in msg) or "is not found" in msg or "not supported for generatecontent" in msg
+
+
+class ModelResolver:
+    """
+    This class finds a working Gemini model once and shares it across the process.
+    - A candidate only counts as working after a real generate_content call succeeds.
+    - The working name is saved to a small local file so restarts skip the probing.
+    - It re-resolves only when a call fails with a model-not-found error.
+    """
+
+    def __init__(self, candidates: list | None = None, state_path: str | None = None):
+        self.candidates = list(candidates or FALLBACK_CANDIDATES)
+        self.state_path = state_path or os.path.join(cache_dir(), "gemini_model.json")
+        self._lock = threading.Lock()
+        self._key = None
+        self._model = None
+        self._name = None
+        self._bad = set()
+        self._listing = None
+        self._saved = None
+
+    def _key_id(self) -> str:
+        # Store a fingerprint of the key, never the key itself.
+        return hashlib.sha256((self._key or "").encode()).hexdigest()[:16]
+
+    def _load_saved(self) -> str | None:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as fh:
+                state = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        return state.get("model") if state.get("key_id") == self._key_id() else None
+
+    def _save(self, name: str):
+        try:
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            tmp = self.state_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump({"model": name, "key_id": self._key_id()}, fh)
+            os.replace(tmp, self.state_path)
+        except OSError:
+            pass
+        self._saved = name
+
+    def _configure(self) -> bool:
+        # (Re)configure only when the API key changes.
+        key = _api_key()
+        if not key or _load_genai() is None:
+            return False
+        if key != self._key:
+            try:
+                genai.configure(api_key=key)
+            except Exception:
+                return False
+            self._key = key
+            self._model, self._name = None, None
+            self._bad, self._listing = set(), None
+            self._saved = self._load_saved()
+        return True
+
+    def _try_make(self, name: str):
+        # Try both plain and 'models/'-prefixed model names.
+        for cand in (name, _full_name(name)):
+            try:
+                return cand, genai.GenerativeModel(cand)
+            except Exception:
+                pass
+        return None, None
+
+    def _resolve(self):
+        order = [self._saved] + self.candidates
+        if self._listing:
+            # After a not-found error, only try names this key can actually use.
+            listed = set(self._listing)
+            order = [c for c in order if c and _full_name(c) in listed] or [c for c in order if c]
+        seen = set()
+        for cand in order:
+            if not cand or _full_name(cand) in self._bad or _full_name(cand) in seen:
+                continue
+            seen.add(_full_name(cand))
+            name, model = self._try_make(cand)
+            if model is not None:
+                self._name, self._model = name, model
+                return
+        self._name, self._model = None, None
+
+    def get_model(self, model_name: str | None = None):
+        """Returns (name, model) for the shared model, or (None, None) if Gemini is not configured."""
+        with self._lock:
+            if not self._configure():
+                return None, None
+            if model_name:
+                name, model = self._try_make(model_name)
+                if model is not None:
+                    return name, model
+            if self._model is None:
+                self._resolve()
+            return self._name, self._model
+
+    def mark_success(self, name: str):
+        """Remembers a model that just answered a real request."""
+        with self._lock:
+            if name and name != self._saved:
+                self._save(name)
+
+    def mark_not_found(self, name: str):
+        """Drops a model that the API rejected and resolves the next candidate."""
+        with self._lock:
+            if name:
+                self._bad.add(_full_name(name))
+            if self._listing is None:
+                self._listing = self._fetch_listing()
+            if self._name == name:
+                self._model, self._name = None, None
+                self._resolve()
+            return self._name, self._model
+
+    def alternate(self, name: str):
+        """Returns (name, model) for another usable candidate than `name`, or (None, None)."""
+        with self._lock:
+            if not self._configure():
+                return None, None
+            listed = set(self._listing or [])
+            for cand in [self._saved] + self.candidates:
+                full = _full_name(cand) if cand else None
+                if not cand or full == _full_name(name or "") or full in self._bad or (listed and full not in listed):
+                    continue
+                alt, model = self._try_make(cand)
+                if model is not None:
+                    return alt, model
+            return None, None
+
+    def _fetch_listing(self) -> list:
+        names = []
+        try:
+            for m in genai.list_models():
+                if "generateContent" in getattr(m, "supported_generation_methods", []):
+                    names.append(getattr(m, "name", ""))
+        except Exception:
+            pass
+        return names
+
+    def available_models(self) -> list:
+        """Returns the model names this key can use for generateContent (fetched once)."""
+        with self._lock:
+            if not self._configure():
+                return []
+            if self._listing is None:
+                self._listing = self._fetch_listing()
+            return list(self._listing)
+
+
+# One resolver for the whole process, shared by every Streamlit session.
+_RESOLVER = ModelResolver()
+
+
+def _init_gemini(model_name: str | None = None):
+    """
+    This function connects to Gemini.
+    - Reads the Gemini API key from environment variables.
+    - Reuses the process-wide resolved model (probing candidates only once).
+    - Returns the Gemini model object, or None if not configured.
+    """
+    return _RESOLVER.get_model(model_name)[1]
+
+
+_RESPONSE_CACHE = None
+_RESPONSE_CACHE_LOCK = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache | None:
+    """
+    Returns the process-wide response cache, or None when disabled (GEMINI_CACHE=0).
+    Size and TTL come from GEMINI_CACHE_MAX_MB (default 64) and GEMINI_CACHE_TTL_HOURS (default 168).
+    """
+    global _RESPONSE_CACHE
+    if os.getenv("GEMINI_CACHE", "1") == "0":
+        return None
+    with _RESPONSE_CACHE_LOCK:
+        if _RESPONSE_CACHE is None:
+            try:
+                _RESPONSE_CACHE = ResponseCache(
+                    os.path.join(cache_dir(), "responses.sqlite3"),
+                    max_bytes=float(os.getenv("GEMINI_CACHE_MAX_MB", 64)) * 1024 * 1024,
+                    ttl=float(os.getenv("GEMINI_CACHE_TTL_HOURS", 168)) * 3600,
+                )
+            except Exception:
+                return None
+        return _RESPONSE_CACHE
+
+
+def response_cache_key(text: str, grouped_hits: dict, temperature: float, model_name: str) -> str:
+    # Everything that changes Gemini's answer is part of the key.
+    grouped = {k: sorted(set(vs)) for k, vs in grouped_hits.items() if vs}
+    return make_key(_normalize_hyphens(text), grouped, round(float(temperature), 3), model_name, GEMINI_SYSTEM_PROMPT)
+
+
+def build_user_prompt(text: str, grouped_hits: dict) -> str:
+    # Build the prompt for Gemini: includes user text, detected categories, and instructions.
+    detected_list = []
+    for k, vs in grouped_hits.items():
+        if vs:
+            detected_list.append(f"- {k}: " + ", ".join(sorted(set(vs))))
+    detected_md = "\n".join(detected_list) if detected_list else "- None from heuristics/lexicon"
+
+    return f"""## Input text
+{text}
+
+## Detected (heuristics/lexicon)
+{detected_md}
+
+## Task
+1) If bias is present, list categories and matched terms.
+2) For each category, explain why it matters (HCAI rationale).
+3) Give specific rewrite options and a one-paragraph neutral rewrite of the full sentence.
+4) Keep it under ~300 words. Markdown headings and bullets are fine.
+"""
+
+
+def is_error_message(md: str) -> bool:
+    """True for the warning strings returned instead of an explanation."""
+    return not md or md.startswith("⚠️") or "\n⚠️ Gemini call failed" in md
+
+
+def _contents(user_prompt: str) -> list:
+    return [{"role": "user", "parts": [{"text": GEMINI_SYSTEM_PROMPT}, {"text": user_prompt}]}]
+
+
+def _failure_message(e: Exception) -> str:
+    if isinstance(e, (GeminiBusy, CircuitOpen)):
+        return f"⚠️ {e}"
+    # Show the cached list of available models (for debugging).
+    avail = _RESOLVER.available_models()
+    hint = f" Available models for this key: {', '.join(avail[:8])}" if avail else ""
+    return f"⚠️ Gemini call failed: {e}.{hint}"
+
+
+class _Attempt(threading.Thread):
+    """One generate_content call running in a daemon thread; its pieces go to a shared queue."""
+
+    def __init__(self, name, model, contents, config, stream, timeout, out, slot=None):
+        super().__init__(name="biasdetector-gemini-call", daemon=True)
+        self.model_name, self.model = name, model
+        self.contents, self.config, self.stream, self.timeout = contents, config, stream, timeout
+        self.out = out
+        self.slot = slot  # Extra queue slot held by a hedged attempt.
+        self.stopped = False
+
+    def run(self):
+        started = time.monotonic()
+        options = {"timeout": self.timeout}
+        try:
+            if self.stream:
+                for chunk in self.model.generate_content(self.contents, generation_config=self.config,
+                                                         stream=True, request_options=options):
+                    if self.stopped:
+                        return
+                    piece = chunk.text
+                    if piece:
+                        self.out.put((self, "chunk", piece))
+            else:
+                resp = self.model.generate_content(self.contents, generation_config=self.config,
+                                                   request_options=options)
+                self.out.put((self, "chunk", resp.text or ""))
+            self.out.put((self, "done", None))
+        except Exception as e:
+            self.out.put((self, "error", e))
+        finally:
+            if self.slot is not None:
+                self.slot.release(time.monotonic() - started)
+
+
+def _hedge(name, contents, config, stream, timeout, out):
+    # A second attempt on another model, only if the queue has a free slot for it.
+    slots = get_gemini_queue()
+    if not slots.try_acquire():
+        return None
+    alt, model = _RESOLVER.alternate(name)
+    if model is None:
+        slots.release()
+        return None
+    attempt = _Attempt(alt, model, contents, config, stream, timeout, out, slot=slots)
+    attempt.start()
+    return attempt
+
+
+def _call_gemini(name, model, contents: list, config: dict, stream: bool = False):
+    """
+    This function runs one Gemini call under a deadline and yields its text pieces.
+    - The answer must be complete within GEMINI_TIMEOUT seconds (default 60), or TimeoutError is raised.
+    - With GEMINI_HEDGE_AFTER set, a call still silent after that many seconds is also sent to another
+      candidate model when a queue slot is free; whichever answers first is used.
+    - The circuit breaker must let the call out (CircuitOpen otherwise) and is told how it went.
+    """
+    breaker = get_breaker()
+    breaker.guard()
+    timeout = float(os.getenv("GEMINI_TIMEOUT", 60))
+    hedge_after = float(os.getenv("GEMINI_HEDGE_AFTER", 0))
+    started = time.monotonic()
+    deadline = started + timeout
+    out = _queue.Queue()
+    primary = _Attempt(name, model, contents, config, stream, timeout, out)
+    primary.start()
+    pending, errors, winner, hedged, judged = {primary}, {}, None, False, False
+    try:
+        while True:
+            hedge_at = started + hedge_after if hedge_after > 0 and not hedged and winner is None else None
+            try:
+                attempt, kind, value = out.get(timeout=max(0.0, min(deadline, hedge_at or deadline) - time.monotonic()))
+            except _queue.Empty:
+                if hedge_at is not None and time.monotonic() < deadline:
+                    hedged = True
+                    hedge = _hedge(name, contents, config, stream, deadline - time.monotonic(), out)
+                    if hedge is not None:
+                        pending.add(hedge)
+                    continue
+                raise TimeoutError(f"no answer within {timeout:g} s") from None
+            if winner is not None and attempt is not winner:
+                continue
+            if kind == "error":
+                pending.discard(attempt)
+                errors[attempt] = value
+                if winner is None and pending:
+                    continue  # The other attempt may still answer.
+                raise errors.get(primary, value)
+            if winner is None:
+                winner, judged = attempt, True
+                breaker.record_success(time.monotonic() - started)
+                for other in pending - {attempt}:
+                    other.stopped = True
+                if len(pending) > 1 or errors:
+                    metrics.inc("biasdetector_gemini_hedges_total", winner="primary" if attempt is primary else "hedge")
+            if kind == "done":
+                return
+            yield value
+    except Exception as e:
+        if not judged:
+            judged = True
+            if is_model_not_found(e):
+                breaker.release()
+            else:
+                breaker.record_failure()
+        raise
+    finally:
+        for attempt in pending:
+            attempt.stopped = True
+        if not judged:
+            breaker.release()  # The caller stopped reading; nothing was learned about Gemini.
+
+
+def _generate(name, model, text: str, grouped_hits: dict, temperature: float, stream: bool,
+              session=None, on_wait=None):
+    # Yields the answer (in chunks when streaming) from one guarded Gemini call, or a warning.
+    contents = _contents(build_user_prompt(text, grouped_hits))
+    config = {"temperature": float(temperature)}
+    parts = []
+    started = time.perf_counter()
+    try:
+        # An open breaker answers at once instead of after a turn in the queue.
+        get_breaker().check()
+        with get_gemini_queue().slot(session, on_wait):
+            while True:
+                try:
+                    if not stream:
+                        with metrics.stage("gemini_generate", model=name):
+                            parts.append("".join(_call_gemini(name, model, contents, config)))
+                        break
+                    for piece in _call_gemini(name, model, contents, config, stream=True):
+                        if not parts:
+                            metrics.observe("biasdetector_stage_seconds", time.perf_counter() - started,
+                                            stage="gemini_first_chunk")
+                        parts.append(piece)
+                        yield piece
+                    break
+                except CircuitOpen:
+                    raise
+                except Exception as e:
+                    metrics.gemini_error(e)
+                    # An unknown model name can still switch candidates if nothing was shown yet.
+                    if not parts and is_model_not_found(e):
+                        name, model = _RESOLVER.mark_not_found(name)
+                        if model is not None:
+                            continue
+                    yield ("\n\n" if parts else "") + _failure_message(e)
+                    return
+    except (GeminiBusy, CircuitOpen) as e:
+        yield _failure_message(e)
+        return
+
+    if stream:
+        # Includes the time the UI spent rendering chunks, i.e. what the user waited.
+        metrics.observe("biasdetector_stage_seconds", time.perf_counter() - started, stage="gemini_stream")
+    metrics.inc("biasdetector_gemini_requests_total", outcome="ok")
+    _RESOLVER.mark_success(name)
+    answer = "".join(parts)
+    if not answer:
+        yield "Gemini returned no text."
+        return
+    if not stream:
+        yield answer
+    cache = get_response_cache()
+    if cache is not None:
+        cache.put(response_cache_key(text, grouped_hits, temperature, name), answer)
+
+
+def analyze_with_gemini(text: str, grouped_hits: dict, temperature: float = 0.3, use_cache: bool = True,
+                        session=None, on_wait=None) -> str:
+    """
+    This function sends the user text and detected bias terms to Gemini.
+    Gemini returns a plain-English explanation and suggested rewrites.
+    If Gemini is not set up, it shows a warning.
+    Answers are cached on disk; use_cache=False forces a fresh answer (which then replaces the cached one).
+    Identical requests already running are shared, and new calls wait their turn in the
+    process-wide queue (see admission.py); `session` and `on_wait` are passed to it.
+    """
+    with metrics.stage("gemini_resolve"):
+        name, model = _RESOLVER.get_model()
+    if model is None:
+        metrics.inc("biasdetector_gemini_requests_total", outcome="not_configured")
+        return NOT_CONFIGURED_MSG
+
+    key = response_cache_key(text, grouped_hits, temperature, name)
+    cache = get_response_cache()
+    if cache is not None and use_cache:
+        cached = cache.get(key)
+        metrics.cache_result("gemini_response", cached is not None)
+        if cached is not None:
+            return cached
+
+    # Ask Gemini to generate the Markdown output. Show a readable error if it fails.
+    return "".join(FLIGHTS.stream(
+        key, lambda waiting: _generate(name, model, text, grouped_hits, temperature, False, session, waiting),
+        on_wait,
+    ))
+
+
+def stream_with_gemini(text: str, grouped_hits: dict, temperature: float = 0.3, use_cache: bool = True,
+                       session=None, on_wait=None):
+    """
+    This function works like analyze_with_gemini, but yields the Markdown in chunks
+    as Gemini writes it, so the first words can be shown straight away.
+    - A cached answer is yielded in one piece.
+    - Errors are yielded as the same readable message (after any partial text).
+    - Only complete answers are stored in the cache.
+    - A caller joining an identical request that is already running gets its chunks too.
+    """
+    with metrics.stage("gemini_resolve"):
+        name, model = _RESOLVER.get_model()
+    if model is None:
+        metrics.inc("biasdetector_gemini_requests_total", outcome="not_configured")
+        yield NOT_CONFIGURED_MSG
+        return
+
+    key = response_cache_key(text, grouped_hits, temperature, name)
+    cache = get_response_cache()
+    if cache is not None and use_cache:
+        cached = cache.get(key)
+        metrics.cache_result("gemini_response", cached is not None)
+        if cached is not None:
+            yield cached
+            return
+
+    yield from FLIGHTS.stream(
+        key, lambda waiting: _generate(name, model, text, grouped_hits, temperature, True, session, waiting),
+        on_wait,
+    )
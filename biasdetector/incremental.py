@@ -0,0 +1,127 @@
+"""
+Incremental re-analysis for edited ads.
+
+The text is split into paragraphs (long paragraphs into sentences) and each
+segment's hits are cached under a hash of the segment plus a little context
+on both sides. When only one sentence changes, only that segment (and any
+neighbour whose context changed) is scanned again; cached hits are shifted
+to their new offsets in the whole document.
+"""
+import hashlib
+import re as _re
+
+from .detection import (
+    DEFAULT_LEXICON,
+    RULES,
+    find_bias_lexicon,
+    find_bias_rules,
+    group_hits_by_label,
+    sentence_spans,
+)
+
+# Paragraphs are separated by blank lines; long ones are cut into sentences with
+# detection.sentence_spans(), as the EOE whitelist and long-ad mode cut them.
+_PARAGRAPH_BREAK_RE = _re.compile(r"\n[ \t]*\n\s*")
+LONG_PARAGRAPH = 600
+
+# Context kept on each side of a segment: enough for every rule's negation/role-noun window.
+CONTEXT_CHARS = max([40] + [int(r.get("window", 40)) for r in RULES])
+
+
+class Segment:
+    """One paragraph or sentence of the document, with its hits in document offsets."""
+    __slots__ = ("start", "end", "key", "lex_hits", "rule_hits", "scores", "reused")
+
+    def __init__(self, start, end, key, lex_hits, rule_hits, scores, reused):
+        self.start = start
+        self.end = end
+        self.key = key
+        self.lex_hits = lex_hits
+        self.rule_hits = rule_hits
+        self.scores = scores
+        self.reused = reused
+
+    @property
+    def grouped(self) -> dict:
+        return group_hits_by_label(self.lex_hits, self.rule_hits)
+
+
+def split_segments(text: str) -> list:
+    """Returns (start, end) offsets of the paragraphs/sentences in `text` (separators excluded)."""
+    spans = []
+    pos = 0
+    for m in list(_PARAGRAPH_BREAK_RE.finditer(text)) + [None]:
+        end = m.start() if m else len(text)
+        if end > pos:
+            if end - pos > LONG_PARAGRAPH:
+                spans.extend(sentence_spans(text, pos, end))
+            else:
+                spans.append((pos, end))
+        if m:
+            pos = m.end()
+    return spans
+
+
+def _segment_key(text: str, start: int, end: int) -> str:
+    lo = max(0, start - CONTEXT_CHARS)
+    hi = min(len(text), end + CONTEXT_CHARS)
+    h = hashlib.sha1()
+    for part in (text[lo:start], "\x00", text[start:end], "\x00", text[end:hi]):
+        h.update(part.encode("utf-8", "surrogatepass"))
+    return h.hexdigest()
+
+
+def segment_keys(text: str) -> list:
+    """Returns the cache key of every segment of `text`, in document order."""
+    return [_segment_key(text, start, end) for start, end in split_segments(text)]
+
+
+def _detect_segment(text: str, start: int, end: int, lexicon: dict):
+    # Scan the segment with its context, keep only hits that start inside it,
+    # and store them relative to the segment start.
+    lo = max(0, start - CONTEXT_CHARS)
+    hi = min(len(text), end + CONTEXT_CHARS)
+    window = text[lo:hi]
+    first, last = start - lo, end - lo
+    lex_hits = [h.shifted(-first) for h in find_bias_lexicon(window, lexicon) if first <= h.start < last]
+    # Segments end at sentence breaks, so each hit's sentence (and its EOE check) lies in the window.
+    rule_hits, _ = find_bias_rules(window, lexicon=lexicon)
+    rule_hits = [h.shifted(-first) for h in rule_hits if first <= h.start < last]
+    scores = {}
+    for h in rule_hits:
+        scores[h.category] = scores.get(h.category, 0.0) + h.weight
+    return lex_hits, rule_hits, scores
+
+
+def detect_incremental(text: str, cache: dict | None, lexicon: dict = DEFAULT_LEXICON):
+    """
+    This function runs the detectors segment by segment, reusing cached segments.
+    - `cache` maps segment keys to hits from the previous run (pass {} or None the first time).
+    - The EOE whitelist applies per sentence, as in find_bias_rules.
+    Returns (segments, lex_hits, rule_hits, scores, new_cache); store new_cache for the next run.
+    """
+    cache = cache or {}
+    new_cache = {}
+    segments = []
+    for start, end in split_segments(text):
+        key = _segment_key(text, start, end)
+        entry = cache.get(key) or new_cache.get(key)
+        reused = entry is not None
+        if entry is None:
+            entry = _detect_segment(text, start, end, lexicon)
+        new_cache[key] = entry
+        lex_local, rule_local, seg_scores = entry
+        segments.append(Segment(
+            start, end, key,
+            [h.shifted(start) for h in lex_local],
+            [h.shifted(start) for h in rule_local],
+            seg_scores, reused,
+        ))
+
+    lex_hits = [h for seg in segments for h in seg.lex_hits]
+    rule_hits = [h for seg in segments for h in seg.rule_hits]
+    scores = {}
+    for seg in segments:
+        for label, value in seg.scores.items():
+            scores[label] = scores.get(label, 0.0) + value
+    return segments, lex_hits, rule_hits, scores, new_cache
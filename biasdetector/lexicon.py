@@ -0,0 +1,283 @@
+"""
+External lexicon packs.
+
+A pack is a JSON or YAML file of bias categories, in the same shape as
+DEFAULT_LEXICON, plus optional highlight colours, explanations and rules
+(in the same shape as RULES):
+
+    name: HR team terms
+    extends_default: true        # merge into DEFAULT_LEXICON (default) or replace it
+    categories:
+      age bias:
+        phrases: ["young", "digital native"]
+        patterns: ['\\bunder\\s*30\\b']
+        rewrite: Focus on skills or years of experience, not age.
+      caregiver bias:
+        phrases: ["no family commitments"]
+        color: "#fde68a"
+        explanation: Excludes parents and carers.
+    rules:
+      - {regex: '\\bchildless\\b', label: caregiver bias, weight: 1.0}
+
+Colours and explanations stay with the pack's lexicon (see category_color()
+and category_explanation() in detection.py) and its rules with its engine,
+so find_bias_rules(text, lexicon=...) uses them. Nothing is written into
+the module-level HIGHLIGHT_COLORS, LABEL_EXPLANATIONS or RULES, and a reload
+that drops a category drops its colour too.
+
+The compiled match engine is saved as an index file named after a hash of
+the pack contents, so later starts load it instead of parsing every term
+again. LexiconPack re-reads the file when it changes on disk, so edits show
+up on the next Analyze without restarting Streamlit.
+"""
+import hashlib
+import json
+import logging
+import os
+import re as _re
+import threading
+import time
+
+from . import detection
+from .detection import DEFAULT_LEXICON, RULES, _MatchEngine
+from .paths import cache_dir
+
+try:
+    import yaml
+    _HAS_YAML = True
+except Exception:
+    _HAS_YAML = False
+
+# Bump when the index format or the engine's matching logic changes.
+# Version 2 added the token-stem trie for word variants; version 3 scoped rule hits to sentences;
+# version 4 stores the pack's rules in the index; version 5 stopped stemming "news" and "graders" to "new" and "grad".
+INDEX_VERSION = 5
+# Lexicon version of the built-in lexicon; follows INDEX_VERSION so hits cached by an older matcher are not reused.
+DEFAULT_VERSION = f"default-v{INDEX_VERSION}"
+# Top-level keys of a pack that are settings, not categories.
+_PACK_KEYS = {"name", "description", "version", "extends_default", "rules"}
+# Longest rule window a pack may set: the context stream.py and incremental.py keep around each hit.
+_MAX_RULE_WINDOW = max([40] + [int(r.get("window", 40)) for r in RULES])
+
+_LOG = logging.getLogger("biasdetector")
+
+
+def _parse(raw: bytes, path: str) -> dict:
+    if path.lower().endswith((".yaml", ".yml")):
+        if not _HAS_YAML:
+            raise ValueError(f"{path}: reading YAML packs needs PyYAML (pip install pyyaml).")
+        data = yaml.safe_load(raw.decode("utf-8"))
+    else:
+        data = json.loads(raw.decode("utf-8"))
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: a lexicon pack must be a mapping.")
+    return data
+
+
+def _str_list(value, where: str) -> list:
+    if value is None:
+        return []
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise ValueError(f"{where} must be a list of strings.")
+    return value
+
+
+def build_lexicon(packs: list) -> dict:
+    """
+    This function merges parsed packs, given as (path, data) pairs, into one lexicon dict.
+    - Categories already present get the pack's phrases/patterns added (duplicates skipped).
+    - Packs start from DEFAULT_LEXICON unless the first one says "extends_default: false".
+    Raises ValueError for a malformed pack.
+    """
+    lexicon = {}
+    if not packs or packs[0][1].get("extends_default", True):
+        lexicon = {cat: {**cfg, "phrases": list(cfg["phrases"]), "patterns": list(cfg["patterns"])}
+                   for cat, cfg in DEFAULT_LEXICON.items()}
+    for path, pack in packs:
+        if "categories" in pack:
+            categories = pack["categories"]
+        else:
+            # A bare mapping of categories, like DEFAULT_LEXICON itself.
+            categories = {k: v for k, v in pack.items() if k not in _PACK_KEYS}
+        if not isinstance(categories, dict):
+            raise ValueError(f"{path}: 'categories' must be a mapping of category name to settings.")
+        for cat, cfg in categories.items():
+            if not isinstance(cfg, dict):
+                raise ValueError(f"{path}: category {cat!r} must be a mapping.")
+            entry = lexicon.setdefault(cat, {"phrases": [], "patterns": []})
+            for key in ("phrases", "patterns"):
+                seen = set(entry[key])
+                for term in _str_list(cfg.get(key), f"{path}: {cat}.{key}"):
+                    if term and term not in seen:
+                        seen.add(term)
+                        entry[key].append(term)
+            for key in ("rewrite", "color", "explanation"):
+                if cfg.get(key):
+                    entry[key] = str(cfg[key])
+            # Check the regexes now, so a typo is reported when the pack loads, not mid-analysis.
+            for pat in entry["patterns"]:
+                try:
+                    _re.compile(pat)
+                except _re.error as e:
+                    raise ValueError(f"{path}: bad pattern {pat!r} in {cat!r}: {e}") from None
+    return lexicon
+
+
+def build_rules(packs: list) -> list:
+    """
+    This function collects the "rules" lists of parsed packs, given as (path, data) pairs.
+    - Packs start from RULES unless the first one says "extends_default: false".
+    - Each rule needs "regex" and "label"; "weight", "needs_context" and "window" are optional.
+    Raises ValueError for a malformed rule.
+    """
+    rules = []
+    if not packs or packs[0][1].get("extends_default", True):
+        rules = [dict(rule) for rule in RULES]
+    for path, pack in packs:
+        extra = pack.get("rules") or []
+        if not isinstance(extra, list):
+            raise ValueError(f"{path}: 'rules' must be a list.")
+        for n, rule in enumerate(extra):
+            where = f"{path}: rules[{n}]"
+            if not isinstance(rule, dict) or not isinstance(rule.get("regex"), str) \
+                    or not isinstance(rule.get("label"), str) or not rule["label"]:
+                raise ValueError(f"{where} must be a mapping with a 'regex' and a 'label'.")
+            try:
+                _re.compile(rule["regex"])
+            except _re.error as e:
+                raise ValueError(f"{where}: bad regex {rule['regex']!r}: {e}") from None
+            out = {"regex": rule["regex"], "label": rule["label"]}
+            try:
+                out["weight"] = float(rule.get("weight", 1.0))
+                if "window" in rule:
+                    out["window"] = int(rule["window"])
+            except (TypeError, ValueError):
+                raise ValueError(f"{where}: 'weight' and 'window' must be numbers.") from None
+            if not 0 < out.get("window", 1) <= _MAX_RULE_WINDOW:
+                raise ValueError(f"{where}: 'window' must be between 1 and {_MAX_RULE_WINDOW}.")
+            if rule.get("needs_context"):
+                out["needs_context"] = True
+            rules.append(out)
+    return rules
+
+
+def lexicon_digest(lexicon: dict, rules: list | None = None) -> str:
+    """Content hash of a lexicon (and its rules); names its index file and changes whenever matching would."""
+    blob = json.dumps([lexicon, rules or []], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(f"v{INDEX_VERSION}\x00{blob}".encode("utf-8")).hexdigest()[:32]
+
+
+def _index_path(digest: str) -> str:
+    return os.path.join(cache_dir(), "lexicon-index", f"{digest}.json")
+
+
+def compile_engine(lexicon: dict, digest: str, rules: list | None = None) -> _MatchEngine:
+    """
+    This function returns the match engine for a lexicon and its rules, using the on-disk index when present.
+    `digest` identifies the lexicon contents; a fresh index is written after compiling.
+    """
+    path = _index_path(digest)
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            return _MatchEngine.from_index(json.load(fh))
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    engine = _MatchEngine(rules or [], lexicon)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(engine.to_index(), fh)
+        os.replace(tmp, path)
+    except OSError:
+        pass  # Read-only cache folder: the engine still works, it is just rebuilt next time.
+    return engine
+
+
+class LexiconPack:
+    """
+    This class serves the lexicon from one or more pack files and reloads it when they change.
+    - current() is cheap: files are stat()ed at most once per `check_interval` seconds.
+    - A pack that fails to load after an edit keeps the last good lexicon (see last_error).
+    - Its rules, and the colours and explanations in its lexicon, belong to the pack; module-level
+      defaults are never changed.
+    """
+
+    def __init__(self, paths, check_interval: float = 1.0):
+        self.paths = [paths] if isinstance(paths, str) else list(paths)
+        self.check_interval = check_interval
+        self.lexicon = None
+        self.rules = []
+        self.version = None
+        self.last_error = None
+        self._stamp = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _stat(self):
+        stamp = []
+        for path in self.paths:
+            st = os.stat(path)
+            stamp.append((path, st.st_mtime_ns, st.st_size))
+        return tuple(stamp)
+
+    def _load(self):
+        packs = []
+        for path in self.paths:
+            with open(path, "rb") as fh:
+                packs.append((path, _parse(fh.read(), path)))
+        lexicon = build_lexicon(packs)
+        rules = build_rules(packs)
+        digest = lexicon_digest(lexicon, rules)
+        if digest == self.version:
+            return  # Saved again without changes.
+        engine = compile_engine(lexicon, digest, rules)
+
+        detection.register_engine(lexicon, engine)
+        if self.lexicon is not None:
+            detection.unregister_engine(self.lexicon)
+        self.lexicon, self.rules, self.version = lexicon, rules, digest
+
+    def current(self) -> dict:
+        """Returns the current lexicon dict, reloading it first if a pack file changed."""
+        now = time.monotonic()
+        if self.lexicon is not None and now - self._checked < self.check_interval:
+            return self.lexicon
+        with self._lock:
+            self._checked = now
+            try:
+                stamp = self._stat()
+                if stamp != self._stamp:
+                    self._load()
+                    self._stamp = stamp
+                    self.last_error = None
+            except (OSError, ValueError) as e:
+                if self.lexicon is None:
+                    raise ValueError(f"Could not load lexicon pack: {e}") from e
+                if str(e) != self.last_error:
+                    _LOG.warning("lexicon pack reload failed, keeping the previous version: %s", e)
+                self.last_error = str(e)
+            return self.lexicon
+
+
+_ACTIVE = None
+_ACTIVE_LOCK = threading.Lock()
+
+
+def active_lexicon():
+    """
+    Returns (lexicon, version) for this process.
+    Packs are listed in BIASDETECTOR_LEXICON (several separated by os.pathsep);
+    without it this is (DEFAULT_LEXICON, DEFAULT_VERSION).
+    """
+    global _ACTIVE
+    spec = os.getenv("BIASDETECTOR_LEXICON", "").strip()
+    if not spec:
+        return DEFAULT_LEXICON, DEFAULT_VERSION
+    paths = [p for p in spec.split(os.pathsep) if p]
+    with _ACTIVE_LOCK:
+        if _ACTIVE is None or _ACTIVE.paths != paths:
+            _ACTIVE = LexiconPack(paths)
+        pack = _ACTIVE
+    lexicon = pack.current()
+    return lexicon, pack.version
@@ -0,0 +1,503 @@
+"""
+Offline local scorer.
+
+A small linear model that rates every sentence of an ad per bias category,
+so the app still explains something when Gemini is not set up or fails,
+and the batch scanner gets a second opinion without any API calls.
+
+Each sentence is turned into hashed features (words, word pairs and the
+character 3- to 5-grams of every word, so "youthful" shares features with
+"youth" and "young"), and one logistic regression per category scores them.
+Training takes labelled sentences from a JSONL file:
+
+    {"text": "Join our youthful team.", "labels": ["age bias"]}
+    {"text": "We offer flexible hours.", "labels": []}
+
+The built-in training file is data/local_training.jsonl; none of its
+sentences come from the app's example ad, so the example and held-out
+checks (tests/test_localmodel.py) measure the model, not memory. With NumPy
+installed, all sentences and clauses of an ad are scored in one matrix
+step instead of one dict walk each. The trained model
+is saved in the cache folder under a hash of its training data, so it is
+trained once; BIASDETECTOR_LOCAL_MODEL may point at another model file
+(written by ``python -m biasdetector train-local``) or labelled file.
+"""
+import functools
+import hashlib
+import json
+import math
+import os
+import random
+import re as _re
+import threading
+import zlib
+
+from .detection import DEFAULT_LEXICON, NEGATION_RE, _normalize_hyphens, category_explanation
+from .paths import cache_dir
+from .structured import apply_rewrites, get_phrase_cache, phrase_key
+
+try:
+    import numpy as _np
+    _HAS_NUMPY = True
+except Exception:
+    _HAS_NUMPY = False
+
+MODEL_VERSION = 1
+# Number of hash buckets; collisions are rare at the size of these training sets.
+N_FEATURES = 1 << 20
+DEFAULT_THRESHOLD = 0.5
+BUILTIN_TRAINING = os.path.join(os.path.dirname(__file__), "data", "local_training.jsonl")
+
+_WORD_RE = _re.compile(r"[a-z0-9']+")
+_DIGITS_RE = _re.compile(r"\d")
+_SENTENCE_RE = _re.compile(r"[^.!?\n]+[.!?]*")
+_CLAUSE_RE = _re.compile(r"[,;:]\s+")
+# Words of a sentence, for finding the one a flag rests on (hyphenated words count as one).
+_HIT_WORD_RE = _re.compile(r"[\w'-]+")
+# Characters before a sentence's hit checked for no/not/without, as find_bias_rules() does.
+NEGATION_WINDOW = 40
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _word_buckets(word: str) -> tuple:
+    # The word itself and its character 3- to 5-grams; cached, since ads reuse the same words.
+    padded = f" {word} "
+    grams = {f"w:{word}"}
+    for n in (3, 4, 5):
+        grams.update(f"c:{padded[i:i + n]}" for i in range(len(padded) - n + 1))
+    return tuple(zlib.crc32(g.encode("utf-8")) % N_FEATURES for g in grams)
+
+
+def features(text: str) -> set:
+    """Returns the hashed feature buckets of one sentence (each one counts as present or not)."""
+    words = _WORD_RE.findall(_DIGITS_RE.sub("0", _normalize_hyphens(text).lower().replace("-", " ")))
+    buckets = set()
+    for w in words:
+        buckets.update(_word_buckets(w))
+    buckets.update(zlib.crc32(f"b:{a} {b}".encode("utf-8")) % N_FEATURES for a, b in zip(words, words[1:]))
+    return buckets
+
+
+def _sigmoid(z: float) -> float:
+    if z >= 0:
+        return 1.0 / (1.0 + math.exp(-z))
+    e = math.exp(z)
+    return e / (1.0 + e)
+
+
+def split_sentences(text: str) -> list:
+    """Returns (start, end) offsets of the sentences in `text`, without surrounding spaces."""
+    spans = []
+    for m in _SENTENCE_RE.finditer(text):
+        start, end = m.start(), m.end()
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if end > start:
+            spans.append((start, end))
+    return spans
+
+
+class LocalModel:
+    """
+    This class holds one logistic regression per bias category over hashed features.
+    - score() returns {category: probability} for one sentence.
+    - score_document() scores every sentence of an ad.
+    """
+
+    def __init__(self, categories: list, weights: dict, bias: list, threshold: float = DEFAULT_THRESHOLD):
+        self.categories = list(categories)
+        self.weights = weights  # bucket -> list of one weight per category
+        self.bias = list(bias)
+        self.threshold = threshold
+        self._arrays = None
+
+    def _matrix(self):
+        # Weights as one NumPy matrix with a bucket -> row lookup table; bucket N_FEATURES maps
+        # to a last row of zeros, which also stands in for features the model has no weight for.
+        if self._arrays is None:
+            buckets = _np.fromiter(self.weights, dtype=_np.int64, count=len(self.weights))
+            matrix = _np.zeros((len(buckets) + 1, len(self.categories)))
+            for row, bucket in enumerate(buckets.tolist()):
+                matrix[row] = self.weights[bucket]
+            lookup = _np.full(N_FEATURES + 1, len(buckets), dtype=_np.int32)
+            lookup[buckets] = _np.arange(len(buckets), dtype=_np.int32)
+            self._arrays = (matrix, lookup, _np.asarray(self.bias, dtype=float))
+        return self._arrays
+
+    def score_many(self, texts: list):
+        """
+        Returns a (len(texts), categories) NumPy array with the probabilities score() gives each text.
+        All feature weights are gathered and summed in one step (needs NumPy).
+        """
+        matrix, lookup, bias = self._matrix()
+        flat, starts, counts = [], [], []
+        for text in texts:
+            feats = features(text)
+            starts.append(len(flat))
+            counts.append(len(feats))
+            flat.extend(feats)
+            flat.append(N_FEATURES)  # Every text gets at least one (zero) row, so reduceat sums stay aligned.
+        if not texts:
+            return _np.zeros((0, len(self.categories)))
+        rows = lookup[_np.asarray(flat, dtype=_np.int64)]
+        z = _np.add.reduceat(matrix[rows], _np.asarray(starts), axis=0)
+        counts = _np.asarray(counts, dtype=float)
+        scale = _np.where(counts > 0, 1.0 / _np.sqrt(_np.maximum(counts, 1.0)), 0.0)
+        x = bias + scale[:, None] * z
+        # Numerically stable sigmoid: 1 / (1 + exp(-x)) without overflow for large |x|.
+        return _np.exp(-_np.logaddexp(0.0, -x))
+
+    def score(self, sentence: str) -> dict:
+        feats = features(sentence)
+        rows = [row for row in map(self.weights.get, feats) if row is not None]
+        if not rows:
+            return {cat: _sigmoid(b) for cat, b in zip(self.categories, self.bias)}
+        # Features are scaled to unit length: each present one is worth 1/sqrt(count).
+        scale = 1.0 / math.sqrt(len(feats))
+        return {cat: _sigmoid(b + scale * z) for cat, b, z in zip(self.categories, self.bias, map(sum, zip(*rows)))}
+
+    def score_sentence(self, sentence: str) -> dict:
+        """Scores a sentence and each of its clauses, keeping the highest probability per category."""
+        scores = self.score(sentence)
+        clauses = [c for c in _CLAUSE_RE.split(sentence) if c.strip()]
+        if len(clauses) > 1:
+            # A long sentence dilutes one biased clause; score the clauses on their own too.
+            for clause in clauses:
+                for cat, p in self.score(clause).items():
+                    if p > scores[cat]:
+                        scores[cat] = p
+        return scores
+
+    def score_spans(self, text: str):
+        """
+        Returns (sentence spans, probabilities) for `text`: row i of the (sentences, categories)
+        NumPy array is what score_sentence() gives sentence i. Every sentence and clause is
+        scored in one score_many() call (needs NumPy).
+        """
+        spans = split_sentences(text)
+        units, first = [], []
+        for s, e in spans:
+            sentence = text[s:e]
+            first.append(len(units))
+            units.append(sentence)
+            clauses = [c for c in _CLAUSE_RE.split(sentence) if c.strip()]
+            if len(clauses) > 1:
+                units.extend(clauses)
+        if not spans:
+            return spans, _np.zeros((0, len(self.categories)))
+        return spans, _np.maximum.reduceat(self.score_many(units), _np.asarray(first), axis=0)
+
+    def score_document(self, text: str) -> list:
+        """Returns (start, end, {category: probability}) for every sentence of `text`."""
+        if _HAS_NUMPY:
+            spans, probs = self.score_spans(text)
+            return [(s, e, dict(zip(self.categories, row))) for (s, e), row in zip(spans, probs.tolist())]
+        return [(s, e, self.score_sentence(text[s:e])) for s, e in split_sentences(text)]
+
+    def to_dict(self) -> dict:
+        return {
+            "version": MODEL_VERSION,
+            "n_features": N_FEATURES,
+            "categories": self.categories,
+            "bias": self.bias,
+            "threshold": self.threshold,
+            "weights": {str(k): [round(w, 5) for w in row] for k, row in self.weights.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LocalModel":
+        if data.get("version") != MODEL_VERSION or data.get("n_features") != N_FEATURES:
+            raise ValueError("Local model file was written by another version.")
+        weights = {int(k): row for k, row in data["weights"].items()}
+        return cls(data["categories"], weights, data["bias"], data.get("threshold", DEFAULT_THRESHOLD))
+
+
+def load_examples(path: str) -> list:
+    """
+    This function reads labelled sentences from a JSONL file as (text, labels) pairs.
+    Raises ValueError for a malformed line.
+    """
+    examples = []
+    with open(path, "r", encoding="utf-8") as fh:
+        for n, line in enumerate(fh, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+                text, labels = row["text"], row.get("labels") or []
+            except (ValueError, KeyError, TypeError):
+                raise ValueError(f"{path}:{n}: expected {{\"text\": ..., \"labels\": [...]}}.") from None
+            if not isinstance(text, str) or not isinstance(labels, list):
+                raise ValueError(f"{path}:{n}: 'text' must be a string and 'labels' a list.")
+            examples.append((text, [str(lb) for lb in labels]))
+    return examples
+
+
+def train(examples: list, categories: list | None = None, epochs: int = 40, learning_rate: float = 2.0,
+          l2: float = 1e-5, seed: int = 0) -> LocalModel:
+    """
+    This function trains a LocalModel on (text, labels) pairs with stochastic gradient descent.
+    - Categories default to those of DEFAULT_LEXICON plus any new labels in the examples.
+    - Positive examples are weighted up so each category's few positives balance its many negatives.
+    """
+    if categories is None:
+        categories = list(DEFAULT_LEXICON)
+        for _, labels in examples:
+            categories.extend(lb for lb in labels if lb not in categories)
+    index = {cat: k for k, cat in enumerate(categories)}
+    data = [(features(text), {index[lb] for lb in labels if lb in index}) for text, labels in examples]
+    data = [(feats, y) for feats, y in data if feats]
+    n_cats = len(categories)
+    positives = [sum(k in y for _, y in data) for k in range(n_cats)]
+    pos_weight = [min(10.0, (len(data) - p) / p) if p else 1.0 for p in positives]
+    weights, bias = {}, [0.0] * n_cats
+
+    rng = random.Random(seed)
+    order = list(range(len(data)))
+    for epoch in range(epochs):
+        rng.shuffle(order)
+        lr = learning_rate / (1 + epoch * 0.1)
+        decay = 1.0 - lr * l2
+        for i in order:
+            feats, y = data[i]
+            scale = 1.0 / math.sqrt(len(feats))
+            rows = [weights.setdefault(b, [0.0] * n_cats) for b in feats]
+            step = []
+            for k, z in enumerate(map(sum, zip(*rows))):
+                if k in y:
+                    grad = (_sigmoid(bias[k] + scale * z) - 1.0) * pos_weight[k]
+                else:
+                    grad = _sigmoid(bias[k] + scale * z)
+                bias[k] -= lr * grad * 0.1
+                step.append(lr * grad * scale)
+            for row in rows:
+                for k in range(n_cats):
+                    row[k] = row[k] * decay - step[k]
+    # Drop near-zero weights to keep the saved model small.
+    weights = {b: row for b, row in weights.items() if max(abs(w) for w in row) > 1e-4}
+    return LocalModel(categories, weights, bias)
+
+
+def _file_digest(path: str) -> str:
+    with open(path, "rb") as fh:
+        blob = fh.read()
+    return hashlib.sha256(f"v{MODEL_VERSION}\x00".encode("utf-8") + blob).hexdigest()[:32]
+
+
+def load_model(path: str) -> LocalModel:
+    """
+    This function loads a model file, or trains one from a labelled JSONL file.
+    Trained models are cached in the cache folder under a hash of the training data.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+    except ValueError:
+        data = None  # Several JSON lines: a labelled training file.
+    if isinstance(data, dict) and "weights" in data:
+        return LocalModel.from_dict(data)
+
+    cached = os.path.join(cache_dir(), "local-model", f"{_file_digest(path)}.json")
+    try:
+        with open(cached, "r", encoding="utf-8") as fh:
+            return LocalModel.from_dict(json.load(fh))
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    model = train(load_examples(path))
+    try:
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        tmp = f"{cached}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(model.to_dict(), fh)
+        os.replace(tmp, cached)
+    except OSError:
+        pass  # Read-only cache folder: the model is just trained again next time.
+    return model
+
+
+_MODEL = None
+_MODEL_PATH = None
+_MODEL_LOCK = threading.Lock()
+_WARM_UP_LOCK = threading.Lock()  # Not _MODEL_LOCK: that one is held for the whole training run.
+_WARM_UP_STARTED = False
+
+
+def get_local_model() -> LocalModel:
+    """Returns the process-wide local model (BIASDETECTOR_LOCAL_MODEL, or the built-in training file)."""
+    global _MODEL, _MODEL_PATH
+    path = os.getenv("BIASDETECTOR_LOCAL_MODEL", "").strip() or BUILTIN_TRAINING
+    with _MODEL_LOCK:
+        if _MODEL is None or _MODEL_PATH != path:
+            _MODEL, _MODEL_PATH = load_model(path), path
+        return _MODEL
+
+
+def warm_up():
+    """
+    This function loads (or trains) the local model in a daemon thread, once per process.
+    Call it after the page has been drawn, so the first offline explanation does not wait for training.
+    """
+    global _WARM_UP_STARTED
+    with _WARM_UP_LOCK:
+        if _WARM_UP_STARTED or _MODEL is not None:
+            return
+        _WARM_UP_STARTED = True
+    threading.Thread(target=get_local_model, name="biasdetector-localmodel-warmup", daemon=True).start()
+
+
+def unnegated_scores(model: LocalModel, sentence: str, scores: dict, window: int = NEGATION_WINDOW) -> dict:
+    """
+    This function down-weights flags that rest on a negated word ("Not young here.").
+    For each flagged category, the hit is the word whose removal lowers the score most; when
+    no/not/without ends within `window` characters before it, the category gets the score
+    of the sentence without that word. Flags with other evidence in the sentence stay.
+    """
+    negations = [m.end() for m in NEGATION_RE.finditer(sentence)]
+    flagged = [cat for cat, p in scores.items() if p >= model.threshold]
+    if not negations or not flagged:
+        return scores
+    words = [(m.start(), m.end()) for m in _HIT_WORD_RE.finditer(sentence)]
+    without = [model.score_sentence(sentence[:a] + sentence[b:]) for a, b in words]
+    out = dict(scores)
+    for cat in flagged:
+        i = max(range(len(words)), key=lambda i: scores[cat] - without[i][cat])
+        start = words[i][0]
+        if any(start - window <= n <= start for n in negations):
+            out[cat] = min(scores[cat], without[i][cat])
+    return out
+
+
+def local_scores(text: str, model: LocalModel | None = None, max_sentences: int = 3) -> dict:
+    """
+    This function scores an ad with the local model.
+    Flags that rest on a negated word are down-weighted first (see unnegated_scores()).
+    Returns {"categories": {category: highest sentence probability},
+             "sentences": [{"category", "score", "span"} for up to `max_sentences` sentences per flagged category]}.
+    """
+    model = model or get_local_model()
+    text = _normalize_hyphens(text or "")
+    if _HAS_NUMPY:
+        return _local_scores_np(text, model, max_sentences)
+    best = {}
+    flagged = {}
+    for start, end, scores in model.score_document(text):
+        scores = unnegated_scores(model, text[start:end], scores)
+        for cat, p in scores.items():
+            if p > best.get(cat, 0.0):
+                best[cat] = p
+            if p >= model.threshold:
+                flagged.setdefault(cat, []).append((p, start, end))
+    sentences = []
+    for cat, items in flagged.items():
+        for p, start, end in sorted(items, reverse=True)[:max_sentences]:
+            sentences.append({"category": cat, "score": round(p, 4), "span": [start, end]})
+    sentences.sort(key=lambda s: (s["span"][0], s["category"]))
+    return {"categories": {cat: round(p, 4) for cat, p in best.items()}, "sentences": sentences}
+
+
+def _local_scores_np(text: str, model: LocalModel, max_sentences: int) -> dict:
+    # local_scores() with the per-category maximum and threshold taken on the whole matrix at once.
+    spans, probs = model.score_spans(text)
+    if not spans:
+        return {"categories": {}, "sentences": []}
+    for i in _np.flatnonzero(probs.max(axis=1) >= model.threshold).tolist():
+        start, end = spans[i]
+        scores = unnegated_scores(model, text[start:end], dict(zip(model.categories, probs[i].tolist())))
+        probs[i] = [scores[cat] for cat in model.categories]
+    best = probs.max(axis=0).tolist()
+    sentences = []
+    for k in _np.flatnonzero(probs.max(axis=0) >= model.threshold).tolist():
+        rows = _np.flatnonzero(probs[:, k] >= model.threshold).tolist()
+        items = sorted(((probs[i, k], spans[i][0], spans[i][1]) for i in rows), reverse=True)
+        for p, start, end in items[:max_sentences]:
+            sentences.append({"category": model.categories[k], "score": round(float(p), 4), "span": [start, end]})
+    sentences.sort(key=lambda s: (s["span"][0], s["category"]))
+    return {"categories": {cat: round(p, 4) for cat, p in zip(model.categories, best) if p > 0.0},
+            "sentences": sentences}
+
+
+def _quote(text: str, limit: int = 160) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+def known_rewrites(text: str, grouped_hits: dict) -> list:
+    """
+    This function looks up replacements Gemini gave earlier for the flagged terms (the phrase
+    cache of short-answer mode). Returns {"category", "term", "rewrite", "spans"} items.
+    """
+    phrases = get_phrase_cache()
+    if phrases is None:
+        return []
+    items = []
+    for cat, terms in grouped_hits.items():
+        for term in sorted(set(terms or [])):
+            answer = phrases.get(phrase_key(cat, term))
+            if answer is None:
+                continue
+            pattern = _re.compile(r"(?<!\w)" + _re.escape(term) + r"(?!\w)", _re.IGNORECASE)
+            items.append({"category": cat, "term": term, "rewrite": json.loads(answer)["rewrite"],
+                          "spans": [[m.start(), m.end()] for m in pattern.finditer(text)]})
+    return items
+
+
+def explain_locally(text: str, grouped_hits: dict, lexicon: dict | None = None,
+                    model: LocalModel | None = None) -> str:
+    """
+    This function writes a Markdown explanation without Gemini.
+    It combines the rule/lexicon hits with the sentences the local model flags, and uses
+    each category's `rewrite` tip and explanation (see category_explanation()) for the advice.
+    Terms Gemini has replaced before get that replacement, and the ad is shown with them swapped in.
+    """
+    lexicon = lexicon if lexicon is not None else DEFAULT_LEXICON
+    text = _normalize_hyphens(text or "")
+    scored = local_scores(text, model)
+    by_cat = {}
+    for s in scored["sentences"]:
+        by_cat.setdefault(s["category"], []).append(s)
+    categories = [c for c, vs in grouped_hits.items() if vs]
+    categories += [c for c in by_cat if c not in categories]
+    rewrites = known_rewrites(text, grouped_hits)
+
+    out = ["### Offline explanation",
+           "_Written on this device from the phrase list and a small local model; "
+           "it can miss context that Gemini would catch._"]
+    if not categories:
+        out.append("\nNo likely bias found. Subtle or context-dependent wording may still be worth a second look.")
+        return "\n".join(out)
+    for cat in categories:
+        out.append(f"\n#### {cat[:1].upper() + cat[1:]}")
+        terms = sorted(set(grouped_hits.get(cat) or []))
+        if terms:
+            out.append("- **Matched terms:** " + ", ".join(f"“{t}”" for t in terms))
+        for s in by_cat.get(cat, []):
+            start, end = s["span"]
+            out.append(f"- **Sentence ({s['score']:.0%} likely):** “{_quote(text[start:end])}”")
+        reason = category_explanation(cat, lexicon)
+        if reason:
+            out.append(f"- **Why it matters:** {reason}")
+        tip = (lexicon.get(cat) or {}).get("rewrite")
+        if tip:
+            out.append(f"- **Rewrite tip:** {tip}")
+        swaps = [f"“{it['term']}” → “{it['rewrite']}”" for it in rewrites if it["category"] == cat]
+        if swaps:
+            out.append("- **Try instead:** " + ", ".join(swaps))
+    if any(it["spans"] for it in rewrites):
+        out.append("\n#### Suggested rewrite")
+        out.append("_Flagged terms swapped for replacements suggested for them before; other wording is unchanged._")
+        out.append(apply_rewrites(text, rewrites))
+    return "\n".join(out)
+
+
+def with_local_fallback(chunks, text: str, grouped_hits: dict, lexicon: dict | None = None):
+    """
+    This function passes streamed Gemini Markdown through unchanged.
+    When Gemini is not configured or the call fails, the offline explanation follows the warning.
+    """
+    for piece in chunks:
+        yield piece
+        if piece.lstrip().startswith("⚠️"):
+            yield "\n\n" + explain_locally(text, grouped_hits, lexicon)
+            return
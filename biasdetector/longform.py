@@ -0,0 +1,192 @@
+"""
+Token-budgeted long-ad mode for Gemini.
+
+Instead of embedding a whole long ad in the prompt, only the sentences that
+contain a hit are kept, plus a few neighbouring sentences for context. The
+sentences in between are replaced by a short "[… N sentences omitted …]"
+marker. If the kept text still does not fit the token budget, it is cut
+into sections that are explained concurrently and merged back in document
+order.
+
+Settings:
+- GEMINI_TOKEN_BUDGET       estimated tokens of ad text per request (default 1500)
+- GEMINI_CONTEXT_SENTENCES  neighbouring sentences kept on each side of a hit (default 1)
+- GEMINI_MAX_SECTIONS       above this, neighbours are dropped to save requests (default 8)
+"""
+import os
+import re as _re
+from bisect import bisect_right
+
+from .bulk import explain_many_sync
+from .detection import group_hits_by_label, sentence_spans
+from .gemini import NOT_CONFIGURED_MSG
+
+_PARAGRAPH_BREAK_RE = _re.compile(r"\n[ \t]*\n\s*")
+
+# Rough size of a token in English text; good enough for budgeting.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def token_budget() -> int:
+    return max(50, int(os.getenv("GEMINI_TOKEN_BUDGET", 1500)))
+
+
+def split_sentences(text: str) -> list:
+    """Returns (start, end) offsets of every non-empty sentence in `text` (split as in detection.sentence_spans)."""
+    spans = []
+    for para in _spans_between(text, _PARAGRAPH_BREAK_RE, 0, len(text)):
+        spans.extend(sentence_spans(text, *para))
+    return spans
+
+
+def _spans_between(text: str, sep, lo: int, hi: int) -> list:
+    spans = []
+    pos = lo
+    for m in sep.finditer(text, lo, hi):
+        if text[pos:m.start()].strip():
+            spans.append((pos, m.start()))
+        pos = m.end()
+    if text[pos:hi].strip():
+        spans.append((pos, hi))
+    return spans
+
+
+class Section:
+    """One request's worth of the ad: condensed text plus the hits inside it."""
+    __slots__ = ("text", "grouped", "kept", "total")
+
+    def __init__(self, text, grouped, kept, total):
+        self.text = text
+        self.grouped = grouped
+        self.kept = kept
+        self.total = total
+
+
+def _omitted(n: int) -> str:
+    return f"[… {n} sentence{'s' if n != 1 else ''} without flagged terms omitted …]"
+
+
+def _kept_indexes(sentences: list, hit_starts: list, neighbours: int, budget: int, text: str) -> list:
+    starts = [s for s, _ in sentences]
+    flagged = set()
+    for pos in hit_starts:
+        i = bisect_right(starts, pos) - 1
+        if i >= 0:
+            flagged.add(i)
+    if not flagged:
+        # Nothing was flagged: send the opening sentences so Gemini can still look for subtle bias.
+        kept, used = [], 0
+        for i, (s, e) in enumerate(sentences):
+            used += estimate_tokens(text[s:e])
+            if kept and used > budget:
+                break
+            kept.append(i)
+        return kept
+    keep = set()
+    for i in flagged:
+        keep.update(range(max(0, i - neighbours), min(len(sentences), i + neighbours + 1)))
+    return sorted(keep)
+
+
+# Tokens held back in every section for the marker after its last sentence.
+_TAIL_TOKENS = estimate_tokens("\n\n" + _omitted(10 ** 6))
+
+
+def _pack(text: str, sentences: list, kept: list, lex_hits: list, rule_hits: list, budget: int) -> list:
+    # Greedily fills sections with kept sentences, in order. Markers and spacing count against
+    # the budget too, so only a single sentence longer than the budget can make a section overflow.
+    sections = []
+    parts, used, count, prev = [], 0, 0, -1
+    sec_lo = sec_hi = None
+
+    def _lead(i):
+        # What goes before sentence i: a marker for skipped sentences, or the original spacing.
+        if not parts:
+            return _omitted(i - prev - 1) + "\n\n" if i > prev + 1 else ""
+        if i > prev + 1:
+            return "\n\n" + _omitted(i - prev - 1) + "\n\n"
+        return text[sentences[prev][1]:sentences[i][0]]
+
+    def _close(last: bool):
+        if not parts:
+            return
+        trailing = len(sentences) - prev - 1
+        if last and trailing > 0:
+            parts.append("\n\n" + _omitted(trailing))
+        grouped = group_hits_by_label([h for h in lex_hits if sec_lo <= h.start < sec_hi],
+                                      [h for h in rule_hits if sec_lo <= h.start < sec_hi])
+        sections.append(Section("".join(parts).strip(), grouped, count, len(sentences)))
+
+    for i in kept:
+        s, e = sentences[i]
+        piece = _lead(i) + text[s:e]
+        if parts and used + estimate_tokens(piece) + _TAIL_TOKENS > budget:
+            _close(False)
+            parts, used, count = [], 0, 0
+            piece = _lead(i) + text[s:e]
+        if not parts:
+            sec_lo = s
+        parts.append(piece)
+        used += estimate_tokens(piece)
+        count += 1
+        prev = i
+        sec_hi = e
+    _close(True)
+    return sections
+
+
+def plan_sections(text: str, lex_hits: list, rule_hits: list, budget: int | None = None,
+                  neighbours: int | None = None, max_sections: int | None = None) -> list:
+    """
+    This function decides what to send to Gemini for one ad.
+    - An ad that fits the token budget is sent whole, as one section.
+    - Otherwise only flagged sentences and `neighbours` sentences on each side are kept.
+    - Kept text above the budget is split into several sections, in document order.
+    Returns a list of Section objects.
+    """
+    budget = budget or token_budget()
+    if neighbours is None:
+        neighbours = max(0, int(os.getenv("GEMINI_CONTEXT_SENTENCES", 1)))
+    if max_sections is None:
+        max_sections = max(1, int(os.getenv("GEMINI_MAX_SECTIONS", 8)))
+
+    sentences = split_sentences(text)
+    if estimate_tokens(text) <= budget:
+        return [Section(text, group_hits_by_label(lex_hits, rule_hits), len(sentences), len(sentences))]
+
+    hit_starts = sorted(h.start for h in list(lex_hits) + list(rule_hits))
+    kept = _kept_indexes(sentences, hit_starts, neighbours, budget, text)
+    sections = _pack(text, sentences, kept, lex_hits, rule_hits, budget)
+    if len(sections) > max_sections and neighbours > 0:
+        kept = _kept_indexes(sentences, hit_starts, 0, budget, text)
+        sections = _pack(text, sentences, kept, lex_hits, rule_hits, budget)
+    return sections
+
+
+def merge_markdown(answers: list) -> str:
+    """Joins per-section Markdown in document order under "Part i of n" headings."""
+    if len(answers) == 1:
+        return answers[0]
+    n = len(answers)
+    return "\n\n---\n\n".join(f"#### Part {i} of {n}\n\n{md}" for i, md in enumerate(answers, 1))
+
+
+def explain_sections(sections: list, temperature: float = 0.3, use_cache: bool = True, concurrency: int = 4,
+                     session=None) -> str:
+    """
+    This function explains every section concurrently and merges the answers in order.
+    Failed sections show a warning in place of their explanation.
+    With a `session`, the requests wait their turn in the process-wide Gemini queue.
+    """
+    results = explain_many_sync([(s.text, s.grouped) for s in sections], concurrency=concurrency,
+                                temperature=temperature, use_cache=use_cache, session=session)
+    if results and all(r.error_type == "NotConfigured" for r in results):
+        return NOT_CONFIGURED_MSG
+    if results and all(r.error_type == "CircuitOpen" for r in results):
+        return f"⚠️ {results[0].error}"
+    answers = [r.text if r.ok else f"⚠️ Gemini call failed for this part: {r.error}" for r in results]
+    return merge_markdown(answers)
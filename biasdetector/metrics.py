@@ -0,0 +1,267 @@
+"""
+Lightweight stage metrics for the Bias Detector.
+
+Counters and latency/size histograms are kept in memory and exported in
+Prometheus text format from a small local HTTP endpoint (GET /metrics).
+Each timed stage can also write one structured JSON log line.
+
+Everything is off unless BIASDETECTOR_METRICS=1. When off, stage() returns
+a shared no-op context manager and the other helpers return immediately, so
+the instrumented code pays almost nothing.
+
+Settings:
+- BIASDETECTOR_METRICS=1       turn metrics on
+- BIASDETECTOR_METRICS_PORT    port for /metrics (default 9464, 0 = no endpoint)
+- BIASDETECTOR_METRICS_HOST    bind address (default 127.0.0.1)
+- BIASDETECTOR_JSON_LOGS=1     also log every stage as a JSON line (logger "biasdetector")
+"""
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENABLED = os.getenv("BIASDETECTOR_METRICS", "0") == "1"
+JSON_LOGS = ENABLED and os.getenv("BIASDETECTOR_JSON_LOGS", "0") == "1"
+
+_LOG = logging.getLogger("biasdetector")
+if JSON_LOGS and not _LOG.handlers:
+    # One JSON object per line on stderr, ready for a log shipper.
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    _LOG.addHandler(_handler)
+    _LOG.setLevel(logging.INFO)
+    _LOG.propagate = False
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# name -> (type, help, buckets)
+_METRICS = {
+    "biasdetector_stage_seconds": ("histogram", "Latency of each analysis stage.", LATENCY_BUCKETS),
+    "biasdetector_stage_errors_total": ("counter", "Stages that raised an exception.", None),
+    "biasdetector_input_bytes": ("histogram", "Size of analyzed text in UTF-8 bytes.", SIZE_BUCKETS),
+    "biasdetector_analyses_total": ("counter", "Analyze runs.", None),
+    "biasdetector_hits_total": ("counter", "Detected hits by layer.", None),
+    "biasdetector_cache_requests_total": ("counter", "Cache lookups by cache and result (hit/miss).", None),
+    "biasdetector_gemini_requests_total": ("counter", "Gemini calls by outcome.", None),
+    "biasdetector_gemini_errors_total": ("counter", "Gemini errors by exception class.", None),
+    "biasdetector_gemini_coalesced_total": ("counter", "Gemini calls that joined an identical request in flight.", None),
+    "biasdetector_gemini_breaker_opened_total": ("counter", "Times the Gemini circuit breaker opened.", None),
+    "biasdetector_gemini_hedges_total": ("counter", "Hedged Gemini requests by which one answered first.", None),
+    "biasdetector_http_requests_total": ("counter", "Requests to the analyze service by endpoint and status.", None),
+}
+
+
+class _Registry:
+    """Thread-safe store of counter values and histogram buckets, keyed by (name, labels)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name: str, labels: tuple, value: float):
+        with self._lock:
+            self._counters[(name, labels)] = self._counters.get((name, labels), 0.0) + value
+
+    def observe(self, name: str, labels: tuple, value: float):
+        buckets = _METRICS[name][2]
+        with self._lock:
+            h = self._histograms.get((name, labels))
+            if h is None:
+                h = self._histograms[(name, labels)] = [[0] * (len(buckets) + 1), 0.0, 0]
+            h[0][bisect_left(buckets, value)] += 1
+            h[1] += value
+            h[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: ([*v[0]], v[1], v[2]) for k, v in self._histograms.items()}
+        return counters, histograms
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+REGISTRY = _Registry()
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1.0, **labels):
+    """Adds `value` to a counter."""
+    if ENABLED:
+        REGISTRY.inc(name, _labels(labels), value)
+
+
+def observe(name: str, value: float, **labels):
+    """Records one histogram observation."""
+    if ENABLED:
+        REGISTRY.observe(name, _labels(labels), value)
+
+
+def observe_input(text: str, source: str):
+    """Records the UTF-8 size of one analyzed text."""
+    if ENABLED:
+        REGISTRY.observe("biasdetector_input_bytes", (("source", source),), len(text.encode("utf-8", "surrogatepass")))
+
+
+def cache_result(cache: str, hit: bool):
+    """Counts one cache lookup; the hit ratio is exported alongside the counters."""
+    if ENABLED:
+        REGISTRY.inc("biasdetector_cache_requests_total", (("cache", cache), ("result", "hit" if hit else "miss")), 1.0)
+
+
+def gemini_error(exc: BaseException):
+    """Counts a Gemini error under its exception class name."""
+    if ENABLED:
+        REGISTRY.inc("biasdetector_gemini_errors_total", (("error_class", type(exc).__name__),), 1.0)
+        REGISTRY.inc("biasdetector_gemini_requests_total", (("outcome", "error"),), 1.0)
+
+
+def log_event(event: str, **fields):
+    """Writes one JSON log line (only when BIASDETECTOR_JSON_LOGS=1)."""
+    if JSON_LOGS:
+        _LOG.info(json.dumps({"ts": round(time.time(), 3), "event": event, **fields}, default=str))
+
+
+class _Stage:
+    __slots__ = ("stage", "fields", "started")
+
+    def __init__(self, stage: str, fields: dict):
+        self.stage = stage
+        self.fields = fields
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        labels = (("stage", self.stage),)
+        REGISTRY.observe("biasdetector_stage_seconds", labels, elapsed)
+        if exc_type is not None:
+            REGISTRY.inc("biasdetector_stage_errors_total", labels + (("error_class", exc_type.__name__),), 1.0)
+        if JSON_LOGS:
+            log_event("stage", stage=self.stage, seconds=round(elapsed, 6),
+                      error=exc_type.__name__ if exc_type else None, **self.fields)
+        return False
+
+
+_NULL_STAGE = contextlib.nullcontext()
+
+
+def stage(name: str, **fields):
+    """
+    This function times one stage: `with stage("detect"): ...`.
+    Extra keyword fields only go into the JSON log line, not into metric labels.
+    """
+    if not ENABLED:
+        return _NULL_STAGE
+    return _Stage(name, fields)
+
+
+def _escape_label(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in pairs) + "}"
+
+
+def _fmt_value(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+def render() -> str:
+    """Returns all metrics in Prometheus text exposition format."""
+    counters, histograms = REGISTRY.snapshot()
+    lines = []
+    for name, (kind, help_text, buckets) in _METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for (n, labels), value in sorted(counters.items()):
+                if n == name:
+                    lines.append(f"{name}{_fmt_labels(labels)} {_fmt_value(value)}")
+        else:
+            for (n, labels), (counts, total, count) in sorted(histograms.items()):
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, c in zip(list(buckets) + ["+Inf"], counts):
+                    cumulative += c
+                    le = bound if bound == "+Inf" else _fmt_value(bound)
+                    lines.append(f"{name}_bucket{_fmt_labels(labels, (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_fmt_labels(labels)} {_fmt_value(total)}")
+                lines.append(f"{name}_count{_fmt_labels(labels)} {count}")
+
+    # Hit ratio per cache, derived from the lookup counters.
+    by_cache = {}
+    for (n, labels), value in counters.items():
+        if n == "biasdetector_cache_requests_total":
+            d = dict(labels)
+            by_cache.setdefault(d["cache"], {"hit": 0.0, "miss": 0.0})[d["result"]] += value
+    lines.append("# HELP biasdetector_cache_hit_ratio Share of cache lookups that were hits.")
+    lines.append("# TYPE biasdetector_cache_hit_ratio gauge")
+    for cache, d in sorted(by_cache.items()):
+        total = d["hit"] + d["miss"]
+        lines.append(f"biasdetector_cache_hit_ratio{_fmt_labels((('cache', cache),))} {_fmt_value(d['hit'] / total if total else 0.0)}")
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # Scrapes would otherwise flood stderr.
+
+
+_SERVER = None
+_SERVER_LOCK = threading.Lock()
+
+
+def start_http_server(port: int | None = None, host: str | None = None):
+    """
+    This function starts the /metrics endpoint in a daemon thread (once per process).
+    Streamlit re-runs the script on every interaction, so repeated calls are no-ops.
+    Returns the server, or None when metrics are off or the port is 0 or taken.
+    """
+    global _SERVER
+    if not ENABLED:
+        return None
+    port = int(os.getenv("BIASDETECTOR_METRICS_PORT", 9464)) if port is None else port
+    host = host or os.getenv("BIASDETECTOR_METRICS_HOST", "127.0.0.1")
+    if port == 0:
+        return None
+    with _SERVER_LOCK:
+        if _SERVER is None:
+            try:
+                _SERVER = ThreadingHTTPServer((host, port), _Handler)
+            except OSError as e:
+                _LOG.warning("metrics endpoint not started on %s:%s: %s", host, port, e)
+                return None
+            _SERVER.daemon_threads = True
+            threading.Thread(target=_SERVER.serve_forever, name="biasdetector-metrics", daemon=True).start()
+        return _SERVER
@@ -0,0 +1,357 @@
+"""
+Near-duplicate index for job ads.
+
+Agencies repost the same ad with a different city, salary or date. Every
+analysed ad is fingerprinted with a MinHash signature of its word 3-grams
+(digits folded, so "$80,000" and "$85,000" look the same), and what was
+learned about each paragraph (its hits and, in paragraph mode, its
+explanation) is stored under the paragraph's hash. The ad text itself and
+whole-ad explanations are never stored.
+
+Results are only reused for a paragraph with exactly the same wording (and
+context, see incremental.py), so a user only ever sees results for text
+they typed. An explanation for a whole ad is rebuilt from the explanations
+of its own paragraphs when every one of them was explained before.
+
+Lookups use locality-sensitive hashing: the signature is cut into bands and
+each band is one indexed row, so ads sharing any band are candidates. The
+best candidate is picked by the share of signature values it has in common,
+an estimate of the word 3-gram similarity. The file is capped at a maximum
+number of ads (and paragraphs), dropping the least recently used ones, so
+memory and disk stay bounded however many ads go through.
+
+The index is off unless BIASDETECTOR_NEARDUP=1 (or scan --near-dup).
+"""
+import hashlib
+import json
+import os
+import random
+import re as _re
+import sqlite3
+import threading
+import time
+import zlib
+
+from .detection import Hit, _normalize_hyphens
+from .paths import cache_dir
+from .incremental import _segment_key, split_segments
+
+try:
+    import numpy as _np
+    _HAS_NUMPY = True
+except Exception:
+    _HAS_NUMPY = False
+
+SHINGLE_WORDS = 3
+# 128 values estimate a similarity of 0.8 to within about 0.035; 16 bands of 8 rows make
+# ads at that similarity candidates about 95% of the time and ads at 0.5 about 6%.
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+DEFAULT_THRESHOLD = 0.8
+
+_PRIME = 4294967291  # Largest prime below 2**32; a * x + b stays below 2**64.
+_rng = random.Random(20240501)  # Fixed, so signatures stay comparable across runs.
+_PERM_A = [_rng.randrange(1, _PRIME) for _ in range(NUM_PERM)]
+_PERM_B = [_rng.randrange(0, _PRIME) for _ in range(NUM_PERM)]
+
+_WORD_RE = _re.compile(r"\w+")
+_DIGIT_RE = _re.compile(r"\d")
+
+
+def shingles(text: str) -> set:
+    """Returns the set of word 3-grams of `text`, ignoring case, hyphen variants and digits."""
+    tokens = _WORD_RE.findall(_DIGIT_RE.sub("0", _normalize_hyphens(text).lower()))
+    if len(tokens) < SHINGLE_WORDS:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + SHINGLE_WORDS]) for i in range(len(tokens) - SHINGLE_WORDS + 1)}
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def minhash(shingle_set: set) -> list:
+    """Returns the NUM_PERM-value MinHash signature of a shingle set."""
+    if not shingle_set:
+        return [_PRIME] * NUM_PERM
+    xs = [zlib.crc32(s.encode("utf-8")) for s in shingle_set]
+    if _HAS_NUMPY:
+        x = _np.array(xs, dtype=_np.uint64)
+        a = _np.array(_PERM_A, dtype=_np.uint64)[:, None]
+        b = _np.array(_PERM_B, dtype=_np.uint64)[:, None]
+        return ((a * x + b) % _np.uint64(_PRIME)).min(axis=1).tolist()
+    return [min((a * x + b) % _PRIME for x in xs) for a, b in zip(_PERM_A, _PERM_B)]
+
+
+def _band_keys(sig: list) -> list:
+    keys = []
+    for i in range(BANDS):
+        blob = i.to_bytes(1, "big") + b"".join(v.to_bytes(4, "big") for v in sig[i * ROWS:(i + 1) * ROWS])
+        keys.append(int.from_bytes(hashlib.blake2b(blob, digest_size=8).digest(), "big", signed=True))
+    return keys
+
+
+def pack_segments(cache: dict) -> dict:
+    """Turns an incremental segment cache into JSON-friendly data."""
+    def _hits(hits):
+        return [[h.category, h.type, h.term, h.start, h.end, h.weight] for h in hits]
+    return {key: [_hits(lex), _hits(rules), scores] for key, (lex, rules, scores) in cache.items()}
+
+
+def unpack_segments(data: dict) -> dict:
+    """Rebuilds a segment cache saved with pack_segments()."""
+    return {
+        key: ([Hit(*h) for h in lex], [Hit(*h) for h in rules], dict(scores))
+        for key, (lex, rules, scores) in (data or {}).items()
+    }
+
+
+class NearDupMatch:
+    """A previously analysed ad that is close to the one being looked up; only its ref is known."""
+    __slots__ = ("ref", "similarity")
+
+    def __init__(self, ref, similarity):
+        self.ref = ref
+        self.similarity = similarity
+
+
+class NearDupIndex:
+    """
+    This class stores MinHash signatures of analysed ads in SQLite and finds near-duplicates.
+    - lookup() returns the most similar stored ad at or above `threshold` (estimated from the signatures), or None.
+    - add() stores an ad's signature and optional ref; never its text.
+    - save_segment_hits()/segment_hits() and save_segment_explanations()/segment_explanations() keep
+      per-paragraph results, keyed by the paragraph hashes of incremental.segment_keys().
+    - At most `max_entries` ads and as many paragraphs of each kind are kept; the least recently used go first.
+    """
+
+    # Bump when the file layout changes; older files are emptied when opened.
+    SCHEMA_VERSION = 2
+
+    def __init__(self, path: str, max_entries: int = 1_000_000, threshold: float = DEFAULT_THRESHOLD,
+                 max_candidates: int = 64):
+        self.path = path
+        self.max_entries = int(max_entries)
+        self.threshold = float(threshold)
+        self.max_candidates = int(max_candidates)
+        self._adds = 0
+        self._touched = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # One connection shared by all threads; the lock serializes access.
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        if self._db.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION:
+            # Version 1 files kept the ad text and whole-ad explanations: drop them.
+            for table in ("bands", "ads", "segments"):
+                self._db.execute(f"DROP TABLE IF EXISTS {table}")
+            self._db.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            self._db.execute("VACUUM")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS ads ("
+            " id INTEGER PRIMARY KEY, doc_key TEXT UNIQUE NOT NULL, sig BLOB NOT NULL,"
+            " ref TEXT, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS bands (band INTEGER NOT NULL, ad INTEGER NOT NULL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS segments ("
+            " kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, accessed REAL NOT NULL,"
+            " PRIMARY KEY (kind, key))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS bands_band ON bands(band)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS bands_ad ON bands(ad)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS ads_accessed ON ads(accessed)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS segments_accessed ON segments(kind, accessed)")
+
+    @staticmethod
+    def _doc_key(text: str) -> str:
+        return hashlib.sha256(_normalize_hyphens(text).encode("utf-8", "surrogatepass")).hexdigest()
+
+    @staticmethod
+    def _pack_sig(sig: list) -> bytes:
+        return b"".join(v.to_bytes(4, "big") for v in sig)
+
+    @staticmethod
+    def _unpack_sig(blob: bytes) -> list:
+        return [int.from_bytes(blob[i:i + 4], "big") for i in range(0, len(blob), 4)]
+
+    def _match(self, ad_id: int, similarity: float) -> NearDupMatch:
+        ref = self._db.execute("SELECT ref FROM ads WHERE id = ?", (ad_id,)).fetchone()[0]
+        # Access times are written with the next add(), so lookups stay read-only.
+        self._touched[ad_id] = time.time()
+        return NearDupMatch(ref, similarity)
+
+    def lookup(self, text: str) -> NearDupMatch | None:
+        sig = minhash(shingles(text))
+        with self._lock:
+            row = self._db.execute("SELECT id FROM ads WHERE doc_key = ?", (self._doc_key(text),)).fetchone()
+            if row is not None:
+                return self._match(row[0], 1.0)
+            keys = _band_keys(sig)
+            rows = self._db.execute(
+                "SELECT DISTINCT ads.id, ads.sig FROM bands JOIN ads ON ads.id = bands.ad"
+                f" WHERE bands.band IN ({','.join('?' * len(keys))}) LIMIT ?",
+                (*keys, self.max_candidates),
+            ).fetchall()
+            best, best_id = 0.0, None
+            for ad_id, blob in rows:
+                other = self._unpack_sig(blob)
+                estimate = sum(x == y for x, y in zip(sig, other)) / NUM_PERM
+                if estimate > best:
+                    best, best_id = estimate, ad_id
+            if best_id is not None and best >= self.threshold:
+                return self._match(best_id, best)
+        return None
+
+    def add(self, text: str, ref=None):
+        key = self._doc_key(text)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT id FROM ads WHERE doc_key = ?", (key,)).fetchone()
+            if row is not None:
+                self._db.execute("UPDATE ads SET ref = COALESCE(ref, ?), accessed = ? WHERE id = ?",
+                                 (None if ref is None else str(ref), now, row[0]))
+                return
+            sig = minhash(shingles(text))
+            self._db.execute("BEGIN")
+            try:
+                if self._touched:
+                    self._db.executemany("UPDATE ads SET accessed = ? WHERE id = ?",
+                                         [(t, i) for i, t in self._touched.items()])
+                    self._touched.clear()
+                cur = self._db.execute(
+                    "INSERT INTO ads (doc_key, sig, ref, accessed) VALUES (?, ?, ?, ?)",
+                    (key, self._pack_sig(sig), None if ref is None else str(ref), now),
+                )
+                self._db.executemany("INSERT INTO bands (band, ad) VALUES (?, ?)",
+                                     [(band, cur.lastrowid) for band in _band_keys(sig)])
+                self._adds += 1
+                if self._adds % 1000 == 0:
+                    self._evict()
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _get(self, kind: str, keys) -> dict:
+        keys = list(dict.fromkeys(keys))
+        out = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                out.update(self._db.execute(
+                    f"SELECT key, value FROM segments WHERE kind = ? AND key IN ({','.join('?' * len(part))})",
+                    (kind, *part),
+                ).fetchall())
+            if out:
+                self._db.executemany("UPDATE segments SET accessed = ? WHERE kind = ? AND key = ?",
+                                     [(time.time(), kind, k) for k in out])
+        return {k: json.loads(v) for k, v in out.items()}
+
+    def _put(self, kind: str, values: dict):
+        if not values:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO segments (kind, key, value, accessed) VALUES (?, ?, ?, ?)",
+                    [(kind, k, json.dumps(v, ensure_ascii=False), now) for k, v in values.items()],
+                )
+                self._evict_segments(kind)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def segment_hits(self, keys, lexicon: str) -> dict:
+        """Returns the stored hits of the given segment keys (found with `lexicon`), as an incremental cache."""
+        found = self._get(f"hits:{lexicon}", keys)
+        return unpack_segments(found)
+
+    def save_segment_hits(self, cache: dict, lexicon: str):
+        """Stores an incremental segment cache (segment key -> hits) found with `lexicon`."""
+        self._put(f"hits:{lexicon}", pack_segments(cache))
+
+    def segment_explanations(self, keys, temperature: float) -> dict:
+        """Returns the stored paragraph explanations of the given segment keys."""
+        return self._get(f"explanation:{float(temperature):g}", keys)
+
+    def save_segment_explanations(self, explanations: dict, temperature: float):
+        """Stores paragraph explanations (segment key -> Markdown)."""
+        self._put(f"explanation:{float(temperature):g}", explanations)
+
+    def explanation(self, text: str, temperature: float) -> str | None:
+        """
+        Returns an explanation of `text` joined from the stored explanations of its own paragraphs,
+        in document order, or None unless every non-blank paragraph has one.
+        """
+        keys = [_segment_key(text, s, e) for s, e in split_segments(text) if text[s:e].strip()]
+        if not keys:
+            return None
+        found = self.segment_explanations(keys, temperature)
+        if any(k not in found for k in keys):
+            return None
+        return "\n\n---\n\n".join(found[k] for k in keys)
+
+    def _evict(self):
+        count = self._db.execute("SELECT COUNT(*) FROM ads").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        doomed = [r[0] for r in self._db.execute(
+            "SELECT id FROM ads ORDER BY accessed LIMIT ?", (count - self.max_entries,)
+        )]
+        self._db.executemany("DELETE FROM bands WHERE ad = ?", [(i,) for i in doomed])
+        self._db.executemany("DELETE FROM ads WHERE id = ?", [(i,) for i in doomed])
+
+    def _evict_segments(self, kind: str):
+        count = self._db.execute("SELECT COUNT(*) FROM segments WHERE kind = ?", (kind,)).fetchone()[0]
+        if count > self.max_entries:
+            self._db.execute(
+                "DELETE FROM segments WHERE rowid IN"
+                " (SELECT rowid FROM segments WHERE kind = ? ORDER BY accessed LIMIT ?)",
+                (kind, count - self.max_entries),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM ads").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM bands")
+            self._db.execute("DELETE FROM ads")
+            self._db.execute("DELETE FROM segments")
+
+
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_neardup_index(enabled: bool | None = None) -> NearDupIndex | None:
+    """
+    Returns the process-wide near-duplicate index, or None when it is off.
+    It is off unless BIASDETECTOR_NEARDUP=1; `enabled` overrides that (scan --near-dup passes True).
+    The file lives in the cache folder; NEARDUP_MAX_ENTRIES (default 1,000,000) caps its size
+    and NEARDUP_THRESHOLD (default 0.8) is the word 3-gram similarity that counts as a duplicate.
+    """
+    global _INDEX
+    if enabled is None:
+        enabled = os.getenv("BIASDETECTOR_NEARDUP", "0") == "1"
+    if not enabled:
+        return None
+    with _INDEX_LOCK:
+        if _INDEX is None:
+            try:
+                _INDEX = NearDupIndex(
+                    os.path.join(cache_dir(), "neardup.sqlite3"),
+                    max_entries=int(os.getenv("NEARDUP_MAX_ENTRIES", 1_000_000)),
+                    threshold=float(os.getenv("NEARDUP_THRESHOLD", DEFAULT_THRESHOLD)),
+                )
+            except Exception:
+                return None
+        return _INDEX
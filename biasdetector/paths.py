@@ -0,0 +1,13 @@
+"""
+Where the Bias Detector keeps its local files.
+
+The model name, response and phrase caches, lexicon indexes, near-duplicate
+index and trained local model all live in one folder, shared by the app,
+the batch scanner and the HTTP service.
+"""
+import os
+
+
+def cache_dir() -> str:
+    # Local folder for small state files (override with BIASDETECTOR_CACHE_DIR).
+    return os.getenv("BIASDETECTOR_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "biasdetector")
@@ -0,0 +1,185 @@
+"""
+Opt-in profiling of single analyses.
+
+A Profile wraps one run of the analysis flow in cProfile (where the time
+goes) and tracemalloc (what was allocated), and turns the result into a
+top-N table of hot functions, an allocation summary by source line and a
+raw .prof file for pstats, snakeviz and similar tools.
+
+cProfile only sees the thread that started it, so time spent waiting for
+Gemini's worker threads shows up under the call that waits on them.
+tracemalloc traces every thread while it runs and slows the whole process
+down, which is why profiling is opt-in. Profiles running at the same time
+(e.g. two app sessions) share one tracemalloc session, which stops when the
+last of them stops; their peaks may then include each other's allocations.
+
+- BIASDETECTOR_PROFILE=1       profile every Analyze run in the app
+- BIASDETECTOR_PROFILE=query   profile only runs whose URL has ?profile=1
+- BIASDETECTOR_PROFILE_TOP     rows in each table (default 25)
+- scan --profile FRACTION      profile that share of the ads in a batch scan
+"""
+import cProfile
+import marshal
+import os
+import threading
+import time
+import tracemalloc
+
+TOP_N = int(os.getenv("BIASDETECTOR_PROFILE_TOP", 25))
+
+# Allocations made by the profiler itself or by the import machinery are not the analysis.
+_ALLOC_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+_RUNNING = threading.local()
+
+# Profiles currently using tracemalloc, and whether it was started by them (not by e.g. python -X tracemalloc).
+_TRACING_LOCK = threading.Lock()
+_TRACING_USERS = 0
+_OWN_TRACING = False
+
+
+def _acquire_tracing(frames: int):
+    global _TRACING_USERS, _OWN_TRACING
+    with _TRACING_LOCK:
+        if _TRACING_USERS == 0:
+            _OWN_TRACING = not tracemalloc.is_tracing()
+            if _OWN_TRACING:
+                tracemalloc.start(frames)
+        _TRACING_USERS += 1
+
+
+def _release_tracing():
+    global _TRACING_USERS, _OWN_TRACING
+    with _TRACING_LOCK:
+        _TRACING_USERS = max(0, _TRACING_USERS - 1)
+        if _TRACING_USERS == 0 and _OWN_TRACING:
+            _OWN_TRACING = False
+            tracemalloc.stop()
+
+
+def profiling_requested(query_value=None) -> bool:
+    """
+    This function tells whether this run should be profiled.
+    `query_value` is the page's ?profile= parameter; it only counts with BIASDETECTOR_PROFILE=query.
+    """
+    mode = os.getenv("BIASDETECTOR_PROFILE", "0").strip().lower()
+    if mode == "1":
+        return True
+    if mode == "query":
+        return str(query_value or "").strip().lower() in ("1", "true", "yes")
+    return False
+
+
+def _short_path(path: str) -> str:
+    # The last two path parts are enough to tell modules apart ("biasdetector/detection.py").
+    parts = path.replace("\\", "/").split("/")
+    return "/".join(parts[-2:])
+
+
+class Profile:
+    """
+    This class profiles one piece of work with cProfile and tracemalloc.
+    - start()/stop(), or use it as a context manager; `seconds` and `peak_kb` are set by stop().
+    - hot_functions(n) and allocations(n) return table rows as dicts.
+    - prof_bytes() returns the raw cProfile data; save() writes it plus a text report.
+    """
+
+    def __init__(self, frames: int = 1):
+        self.frames = max(1, int(frames))
+        self.profiler = cProfile.Profile()
+        self.seconds = 0.0
+        self.peak_kb = 0.0
+        self._running = False
+        self._base = 0
+        self._before = self._after = None
+
+    def start(self):
+        # A run that raised never reached stop(); end its profile so it does not keep tracing.
+        previous = getattr(_RUNNING, "profile", None)
+        if previous is not None and previous._running:
+            previous.stop()
+        _acquire_tracing(self.frames)
+        tracemalloc.reset_peak()
+        self._base = tracemalloc.get_traced_memory()[0]
+        self._before = tracemalloc.take_snapshot()
+        self._running = True
+        _RUNNING.profile = self
+        self._started = time.perf_counter()
+        self.profiler.enable()
+        return self
+
+    def stop(self):
+        if not self._running:
+            return self
+        self.profiler.disable()
+        self.seconds = time.perf_counter() - self._started
+        self._running = False
+        _RUNNING.profile = None
+        self.peak_kb = max(0, tracemalloc.get_traced_memory()[1] - self._base) / 1024
+        self._after = tracemalloc.take_snapshot()
+        _release_tracing()
+        self.profiler.create_stats()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def hot_functions(self, n: int = TOP_N, sort: str = "own") -> list:
+        """Returns the `n` functions with the most own time (or total time with sort="total")."""
+        rows = []
+        for (path, line, name), (_, calls, own, total, _) in getattr(self.profiler, "stats", {}).items():
+            where = name if path == "~" else f"{name} ({_short_path(path)}:{line})"
+            rows.append({"function": where, "calls": calls,
+                         "own_ms": round(own * 1000, 3), "total_ms": round(total * 1000, 3)})
+        rows.sort(key=lambda r: r["own_ms" if sort == "own" else "total_ms"], reverse=True)
+        return rows[:n]
+
+    def allocations(self, n: int = TOP_N) -> list:
+        """Returns the `n` source lines whose allocations grew the most during the run (still alive at the end)."""
+        if self._before is None or self._after is None:
+            return []
+        before = self._before.filter_traces(_ALLOC_FILTERS)
+        after = self._after.filter_traces(_ALLOC_FILTERS)
+        rows = []
+        for stat in after.compare_to(before, "lineno"):
+            if stat.size_diff <= 0:
+                continue
+            frame = stat.traceback[0]
+            rows.append({"line": f"{_short_path(frame.filename)}:{frame.lineno}",
+                         "kb": round(stat.size_diff / 1024, 1), "blocks": stat.count_diff})
+            if len(rows) >= n:
+                break
+        return rows
+
+    def prof_bytes(self) -> bytes:
+        """Returns the profile in the .prof format that pstats.Stats(path) reads."""
+        return marshal.dumps(getattr(self.profiler, "stats", {}))
+
+    def report(self, n: int = TOP_N) -> str:
+        """Returns the two tables as plain text."""
+        lines = [f"{self.seconds:.3f} s, peak {self.peak_kb:,.0f} KB allocated", "",
+                 f"{'own ms':>10} {'total ms':>10} {'calls':>8}  function"]
+        for r in self.hot_functions(n):
+            lines.append(f"{r['own_ms']:>10.3f} {r['total_ms']:>10.3f} {r['calls']:>8}  {r['function']}")
+        lines += ["", f"{'KB':>10} {'blocks':>8}  line"]
+        for r in self.allocations(n):
+            lines.append(f"{r['kb']:>10.1f} {r['blocks']:>8}  {r['line']}")
+        return "\n".join(lines) + "\n"
+
+    def save(self, stem: str, n: int = TOP_N) -> dict:
+        """Writes `stem`.prof and `stem`.txt; returns a short summary naming the .prof file."""
+        os.makedirs(os.path.dirname(stem) or ".", exist_ok=True)
+        with open(stem + ".prof", "wb") as fh:
+            fh.write(self.prof_bytes())
+        with open(stem + ".txt", "w", encoding="utf-8") as fh:
+            fh.write(self.report(n))
+        return {"seconds": round(self.seconds, 6), "peak_kb": round(self.peak_kb, 1), "file": stem + ".prof"}
@@ -0,0 +1,278 @@
+"""
+Headless batch scanner for job-ad corpora.
+
+Reads ads from JSONL or CSV, runs the same detection steps as the app's
+Analyze button across a process pool and writes one JSON line per ad.
+Progress is checkpointed after every chunk, so an interrupted run can pick
+up where it stopped with ``--resume``.
+"""
+import collections
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import re as _re
+import sys
+import time
+import zlib
+
+from .detection import (
+    _normalize_hyphens,
+    build_highlighted_html,
+    find_bias_lexicon,
+    find_bias_rules,
+    group_hits_by_label,
+    sentence_risk,
+)
+from .incremental import detect_incremental, segment_keys
+from .lexicon import active_lexicon
+from .localmodel import explain_locally, local_scores
+from .neardup import get_neardup_index
+from .profiling import Profile
+
+# Large scraped ads can exceed the csv module's default 128 KB field limit.
+csv.field_size_limit(2**31 - 1)
+
+
+def analyze_document(text: str, lexicon: dict | None = None, html: bool = False) -> dict:
+    """
+    This function runs the local detection pipeline on one ad.
+    It mirrors the app: normalize hyphens, run the lexicon and the rules, then group by label.
+    Without a `lexicon`, the packs in BIASDETECTOR_LEXICON (or DEFAULT_LEXICON) are used.
+    With `html`, the result also has the app's Quick Highlights markup under "html".
+    "sentence_risk" lists the sentences with rule hits, riskiest first (see sentence_risk()).
+    """
+    text = _normalize_hyphens(text or "")
+    lexicon = lexicon if lexicon is not None else active_lexicon()[0]
+    lex_hits = find_bias_lexicon(text, lexicon)
+    rule_hits, scores = find_bias_rules(text, lexicon=lexicon)
+    hits = [h.to_dict() for h in lex_hits + rule_hits]
+    result = {
+        "grouped": group_hits_by_label(lex_hits, rule_hits),
+        "scores": scores,
+        "hits": hits,
+        "sentence_risk": sentence_risk(text, rule_hits),
+    }
+    if html:
+        result["html"] = build_highlighted_html(text, lex_hits, rule_hits, lexicon)
+    return result
+
+
+def analyze_with_neardup(text: str, index, ref=None) -> dict:
+    """
+    This function works like analyze_document, but reuses paragraph results kept in a near-duplicate index.
+    - Paragraphs already in the index (same wording and context) reuse their hits; only the others are scanned.
+    - The result names the most similar earlier ad in "near_duplicate_of" (with its estimated "similarity").
+    - The ad's signature and paragraph hits are then added to the index for later ones; its text is not.
+    """
+    text = _normalize_hyphens(text or "")
+    lexicon, version = active_lexicon()
+    match = index.lookup(text)
+    seed = index.segment_hits(segment_keys(text), version)
+    _, lex_hits, rule_hits, scores, segments = detect_incremental(text, seed, lexicon)
+    index.save_segment_hits(segments, version)
+    index.add(text, ref=ref)
+    grouped = group_hits_by_label(lex_hits, rule_hits)
+    result = {
+        "grouped": grouped,
+        "scores": scores,
+        "hits": [h.to_dict() for h in lex_hits + rule_hits],
+        "sentence_risk": sentence_risk(text, rule_hits),
+    }
+    if match is not None:
+        result["near_duplicate_of"] = match.ref
+        result["similarity"] = round(match.similarity, 4)
+    return result
+
+
+def _detect_format(path: str, fmt: str | None) -> str:
+    if fmt:
+        return fmt
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def read_records(path: str, fmt: str | None = None, text_field: str = "text",
+                 id_field: str = "id", keep: tuple = ()):
+    """
+    This function streams (doc_id, text, extra_fields) tuples from a JSONL or CSV file.
+    - Use "-" to read from stdin.
+    - Records without an id get their 0-based position in the file.
+    - Only the fields named in `keep` are carried through to the output.
+    """
+    fmt = _detect_format(path, fmt)
+    fh = sys.stdin if path == "-" else open(path, "r", encoding="utf-8", newline="")
+    try:
+        if fmt == "csv":
+            rows = csv.DictReader(fh)
+        else:
+            rows = (json.loads(line) for line in fh if line.strip())
+        for n, row in enumerate(rows):
+            doc_id = row.get(id_field)
+            extra = {k: row.get(k) for k in keep}
+            yield (n if doc_id in (None, "") else doc_id), (row.get(text_field) or ""), extra
+    finally:
+        if fh is not sys.stdin:
+            fh.close()
+
+
+def _chunked(iterable, size: int):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def profile_sampled(doc_id, fraction: float) -> bool:
+    """
+    This function picks the ads that `scan --profile` profiles.
+    The choice hashes the document id, so a resumed or repeated run profiles the same ads.
+    """
+    if fraction <= 0:
+        return False
+    return fraction >= 1 or zlib.crc32(str(doc_id).encode("utf-8")) < fraction * 2**32
+
+
+def _profile_stem(profile_dir: str, doc_id) -> str:
+    return os.path.join(profile_dir, _re.sub(r"[^\w.-]", "_", str(doc_id))[:100] or "_")
+
+
+def _scan_chunk(chunk: list, near_dup: bool = False, local: bool = True, explain: bool = False,
+                profile: float = 0.0, profile_dir: str | None = None):
+    # Runs in a worker process; results are serialized here to keep the parent light.
+    index = get_neardup_index(enabled=True) if near_dup else None
+    lines = []
+    for doc_id, text, extra in chunk:
+        record = {"id": doc_id}
+        record.update(extra)
+        prof = Profile().start() if profile_sampled(doc_id, profile) else None
+        if index is not None:
+            record.update(analyze_with_neardup(text, index, ref=doc_id))
+        else:
+            record.update(analyze_document(text))
+        if local:
+            record["local"] = local_scores(text)
+        if explain:
+            record["explanation"] = explain_locally(text, record["grouped"], active_lexicon()[0])
+        if prof is not None:
+            record["profile"] = prof.stop().save(_profile_stem(profile_dir, doc_id))
+        lines.append(json.dumps(record, ensure_ascii=False))
+    return len(chunk), ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _load_checkpoint(path: str) -> dict | None:
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_checkpoint(path: str, state: dict):
+    # Write to a temp file first so a crash never leaves a half-written checkpoint.
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(state, fh)
+    os.replace(tmp, path)
+
+
+class _Progress:
+    """Prints a docs/sec readout to stderr at most once per `interval` seconds."""
+
+    def __init__(self, enabled: bool, interval: float = 1.0):
+        self.enabled = enabled
+        self.interval = interval
+        self.started = time.perf_counter()
+        self.last = 0.0
+        self.count = 0
+
+    def update(self, n: int, total_done: int, force: bool = False):
+        self.count += n
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if not force and now - self.last < self.interval:
+            return
+        self.last = now
+        elapsed = max(now - self.started, 1e-9)
+        sys.stderr.write(f"\rscanned {total_done} docs | {self.count / elapsed:,.1f} docs/s")
+        sys.stderr.flush()
+
+    def close(self):
+        if self.enabled:
+            sys.stderr.write("\n")
+
+
+def run_scan(input_path: str, output_path: str, fmt: str | None = None, text_field: str = "text",
+             id_field: str = "id", keep: tuple = (), workers: int | None = None,
+             chunk_size: int = 200, resume: bool = False, checkpoint_path: str | None = None,
+             progress: bool = True, near_dup: bool = False, local: bool = True, explain: bool = False,
+             profile: float = 0.0, profile_dir: str | None = None) -> int:
+    """
+    This function scans a whole corpus and writes results incrementally as JSONL.
+    - Work is sent to a multiprocessing pool in chunks of `chunk_size` ads.
+    - Only a few chunks are in flight at once, so memory stays flat on huge inputs.
+    - Output is written in input order; a checkpoint records how far we got.
+    - `near_dup` reuses paragraph hits of earlier ads and names near-identical ones (see neardup.py).
+    - `local` adds the offline model's sentence scores; `explain` adds its Markdown explanation.
+    - `profile` is the share of ads (0-1) run under cProfile and tracemalloc; each one gets a .prof file
+      and a text report in `profile_dir` (default: <output>.profile/), named in its "profile" field.
+    Returns the total number of documents written.
+    """
+    if not 0 <= profile <= 1:
+        raise ValueError(f"--profile must be a fraction between 0 and 1, not {profile:g}.")
+    profile_dir = profile_dir or output_path + ".profile"
+    checkpoint_path = checkpoint_path or output_path + ".ckpt"
+    workers = workers or os.cpu_count() or 1
+
+    done, offset = 0, 0
+    state = _load_checkpoint(checkpoint_path) if resume else None
+    if state is not None:
+        if state.get("input") != input_path or state.get("text_field") != text_field:
+            raise ValueError(f"Checkpoint {checkpoint_path} belongs to a different input; remove it or drop --resume.")
+        done, offset = int(state["done"]), int(state["output_bytes"])
+        if not os.path.exists(output_path) or os.path.getsize(output_path) < offset:
+            raise ValueError(f"Output {output_path} is shorter than its checkpoint; cannot resume.")
+
+    records = itertools.islice(read_records(input_path, fmt, text_field, id_field, tuple(keep)), done, None)
+    chunks = _chunked(records, max(1, chunk_size))
+    meter = _Progress(progress)
+
+    with open(output_path, "r+b" if state is not None else "wb") as out:
+        # Drop anything written after the last checkpoint (e.g. a chunk cut off by a crash).
+        out.truncate(offset)
+        out.seek(offset)
+
+        def _write(result):
+            nonlocal done
+            n, blob = result
+            out.write(blob)
+            out.flush()
+            done += n
+            _save_checkpoint(checkpoint_path, {
+                "input": input_path,
+                "text_field": text_field,
+                "done": done,
+                "output_bytes": out.tell(),
+            })
+            meter.update(n, done)
+
+        if workers == 1:
+            for chunk in chunks:
+                _write(_scan_chunk(chunk, near_dup, local, explain, profile, profile_dir))
+        else:
+            max_pending = workers * 2
+            with multiprocessing.Pool(processes=workers) as pool:
+                pending = collections.deque()
+                for chunk in chunks:
+                    pending.append(pool.apply_async(_scan_chunk, (chunk, near_dup, local, explain, profile, profile_dir)))
+                    if len(pending) >= max_pending:
+                        _write(pending.popleft().get())
+                while pending:
+                    _write(pending.popleft().get())
+
+    meter.update(0, done, force=True)
+    meter.close()
+    return done
@@ -0,0 +1,243 @@
+"""
+Local HTTP service for the detection core.
+
+    python -m biasdetector serve --port 8080 --workers 4
+
+Endpoints (JSON in, JSON out):
+
+    POST /analyze        {"text": "...", "id": "optional"}
+    POST /analyze/batch  {"ads": [{"id": "...", "text": "..."}, "or a plain string", ...]}
+    GET  /health
+
+Both analyze endpoints take optional flags next to the text: "html" (the
+app's Quick Highlights markup), "local" (the offline model's sentence
+scores) and "explain" (its Markdown explanation). A result has the same
+fields as a line written by the batch scanner; a batch answers
+{"results": [...]} in input order. Gemini is never called, so answers take
+milliseconds and cost nothing.
+
+Connections are kept alive (HTTP/1.1), so a client such as an ATS can send
+many ads over one socket. Detection is CPU-bound, so with --workers N the
+listening socket is opened once and N forked worker processes accept from
+it; each serves its connections on threads. A worker that dies is replaced.
+
+Settings:
+- BIASDETECTOR_SERVE_MAX_BODY_MB   largest request body (default 16)
+- BIASDETECTOR_SERVE_MAX_BATCH     most ads in one batch (default 1000)
+"""
+import json
+import os
+import signal
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import metrics
+from .lexicon import active_lexicon
+from .localmodel import explain_locally, get_local_model, local_scores
+from .scan import analyze_document
+
+MAX_BODY_BYTES = int(float(os.getenv("BIASDETECTOR_SERVE_MAX_BODY_MB", 16)) * 1024 * 1024)
+MAX_BATCH = int(os.getenv("BIASDETECTOR_SERVE_MAX_BATCH", 1000))
+
+
+class HTTPError(ValueError):
+    """A request the service rejects; `status` is the HTTP status to answer with."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _flag(payload: dict, name: str) -> bool:
+    value = payload.get(name, False)
+    if not isinstance(value, bool):
+        raise HTTPError(400, f'"{name}" must be true or false.')
+    return value
+
+
+def analyze_payload(payload: dict, defaults: dict | None = None) -> dict:
+    """
+    This function analyzes one ad given as a request object: {"text", "id"?, "html"?, "local"?, "explain"?}.
+    Flags missing from `payload` are taken from `defaults` (the batch's own flags).
+    Raises HTTPError(400) when the object is malformed.
+    """
+    if not isinstance(payload, dict):
+        raise HTTPError(400, "Each ad must be an object with a \"text\" string, or a string.")
+    text = payload.get("text")
+    if not isinstance(text, str):
+        raise HTTPError(400, '"text" must be a string.')
+    opts = {**(defaults or {}), **payload}
+    lexicon = active_lexicon()[0]
+    with metrics.stage("http_analyze"):
+        result = analyze_document(text, lexicon, html=_flag(opts, "html"))
+        if _flag(opts, "local"):
+            result["local"] = local_scores(text)
+        if _flag(opts, "explain"):
+            result["explanation"] = explain_locally(text, result["grouped"], lexicon)
+    if "id" in payload:
+        result = {"id": payload["id"], **result}
+    return result
+
+
+def analyze_batch(payload: dict) -> dict:
+    """
+    This function analyzes every ad of a batch request: {"ads": [...], "html"?, "local"?, "explain"?}.
+    Ads may be objects (their own flags win) or plain strings. Returns {"results": [...]} in order.
+    """
+    if not isinstance(payload, dict) or not isinstance(payload.get("ads"), list):
+        raise HTTPError(400, 'Expected an object with an "ads" list.')
+    ads = payload["ads"]
+    if len(ads) > MAX_BATCH:
+        raise HTTPError(413, f"Too many ads in one batch ({len(ads)}; the limit is {MAX_BATCH}).")
+    defaults = {k: payload[k] for k in ("html", "local", "explain") if k in payload}
+    results = []
+    for ad in ads:
+        results.append(analyze_payload({"text": ad} if isinstance(ad, str) else ad, defaults))
+    return {"results": results}
+
+
+_ROUTES = {
+    "/analyze": analyze_payload,
+    "/analyze/batch": analyze_batch,
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive: one connection serves many requests.
+    disable_nagle_algorithm = True  # Small JSON answers go out at once instead of waiting for an ACK.
+    server_version = "biasdetector"
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        if self.headers.get("Transfer-Encoding"):
+            self.close_connection = True
+            raise HTTPError(411, "Send the body with a Content-Length header.")
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            self.close_connection = True
+            raise HTTPError(411, "Send the body with a Content-Length header.") from None
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True  # The unread body would be taken for the next request.
+            raise HTTPError(413, f"Request body is too large (limit {MAX_BODY_BYTES // (1024 * 1024)} MB).")
+        raw = self.rfile.read(length)
+        try:
+            return json.loads(raw)
+        except ValueError as e:
+            raise HTTPError(400, f"Body is not valid JSON: {e}") from None
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        route = _ROUTES.get(path)
+        try:
+            if route is None:
+                self.close_connection = True
+                raise HTTPError(404, f"No such endpoint: {path}")
+            status, body = 200, route(self._read_json())
+        except HTTPError as e:
+            status, body = e.status, {"error": str(e)}
+        except Exception as e:
+            status, body = 500, {"error": f"Analysis failed: {type(e).__name__}: {e}"}
+        metrics.inc("biasdetector_http_requests_total", endpoint=path if route else "other", status=status)
+        self._send_json(status, body)
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/health":
+            self._send_json(200, {"status": "ok", "lexicon": active_lexicon()[1]})
+        elif path in _ROUTES:
+            self._send_json(405, {"error": f"Use POST for {path}."})
+        else:
+            self._send_json(404, {"error": f"No such endpoint: {path}"})
+
+    def log_message(self, *args):
+        pass  # Hundreds of requests per second would otherwise flood stderr.
+
+
+class AnalyzeServer(ThreadingHTTPServer):
+    """The HTTP server; each connection is served on its own thread."""
+
+    daemon_threads = True
+    request_queue_size = 128  # Listen backlog shared by every worker.
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8080) -> AnalyzeServer:
+    """This function binds the service to (host, port); port 0 picks a free port (see server_address)."""
+    return AnalyzeServer((host, port), _Handler)
+
+
+def _run_worker(server: AnalyzeServer):
+    # Forked worker: stop cleanly on SIGTERM from the parent, never return into the parent's code.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    code = 0
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    except BaseException:
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def serve(server: AnalyzeServer, workers: int = 1, local: bool = True):
+    """
+    This function serves requests until interrupted.
+    - The lexicon (and with `local`, the offline model) is loaded before forking, so workers share it.
+    - With `workers` > 1 on a system with fork(), that many processes accept from the same socket.
+    """
+    active_lexicon()
+    if local:
+        get_local_model()
+    if workers <= 1 or not hasattr(os, "fork"):
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return
+
+    def _spawn():
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(server)
+        return pid
+
+    children = {_spawn() for _ in range(workers)}
+    stopping = False
+
+    def _stop(*_):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    previous = signal.signal(signal.SIGTERM, _stop)
+    try:
+        while children:
+            try:
+                pid, _ = os.wait()
+            except KeyboardInterrupt:
+                _stop()
+                continue
+            except ChildProcessError:
+                break
+            children.discard(pid)
+            if not stopping:
+                children.add(_spawn())  # A worker crashed: keep the pool at full size.
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        server.server_close()
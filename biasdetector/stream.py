@@ -0,0 +1,189 @@
+"""
+Streaming scanner for inputs too large to hold in memory.
+
+A multi-GB export of concatenated ads is read through mmap in fixed-size
+byte chunks, decoded incrementally, and scanned window by window. Each
+window overlaps its neighbours by a margin on both sides:
+
+    |<- margin ->|<------- hits reported here ------->|<- margin ->|
+                 ^ previous window's report region ended here
+
+A hit is reported only by the window whose middle region contains its
+start, so every hit is reported exactly once, with its full text, the
+negation window before it and the role-noun window after it all inside the
+scanned window. Memory stays at a few windows' worth of text whatever the
+size of the input.
+
+Ads may be separated by a regex (e.g. a form feed or a "----" line). Ads
+are then scanned as if each had been passed to the detectors on its own.
+As in find_bias_rules, an EOE statement drops the rule hits of its own
+sentence only, so rule hits are held back until their sentence ends.
+"""
+import codecs
+import mmap
+import re as _re
+import sys
+
+from .detection import (
+    DEFAULT_LEXICON,
+    RULES,
+    _eoe_matches,
+    _normalize_hyphens,
+    _sentences_for,
+    find_bias_lexicon,
+    find_bias_rules,
+)
+
+# Characters scanned before/after a hit: every rule's negation/role-noun window.
+CONTEXT_CHARS = max([40] + [int(r.get("window", 40)) for r in RULES])
+# Longest match (or separator) that is guaranteed to be found across a window edge.
+MAX_MATCH_CHARS = 256
+DEFAULT_WINDOW_CHARS = 1 << 20
+DEFAULT_CHUNK_BYTES = 1 << 20
+
+
+def read_chunks(path: str, chunk_bytes: int = DEFAULT_CHUNK_BYTES, encoding: str = "utf-8"):
+    """
+    This function yields a file's text in pieces of about `chunk_bytes`, through mmap when possible.
+    Multi-byte characters split across pieces are decoded correctly; invalid bytes become U+FFFD.
+    Use "-" to read stdin.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    if path == "-":
+        while True:
+            block = sys.stdin.buffer.read(chunk_bytes)
+            if not block:
+                break
+            yield decoder.decode(block)
+        yield decoder.decode(b"", final=True)
+        return
+    with open(path, "rb") as fh:
+        try:
+            view = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return  # Empty file: mmap cannot map zero bytes.
+        with view:
+            release = getattr(mmap, "MADV_DONTNEED", None)
+            for pos in range(0, len(view), chunk_bytes):
+                piece = decoder.decode(view[pos:pos + chunk_bytes])
+                if release is not None and pos:
+                    # Drop pages already decoded, so the mapping does not grow the resident set.
+                    done = (pos // mmap.PAGESIZE) * mmap.PAGESIZE
+                    view.madvise(release, 0, done)
+                yield piece
+    yield decoder.decode(b"", final=True)
+
+
+def iter_windows(pieces, window_chars: int = DEFAULT_WINDOW_CHARS, margin: int | None = None):
+    """
+    This function regroups text pieces into overlapping windows.
+    Yields (base, text, lo, hi): `text` starts at stream offset `base`, and hits starting
+    in text[lo:hi] belong to this window. The report regions of consecutive windows tile the stream.
+    """
+    margin = CONTEXT_CHARS + MAX_MATCH_CHARS if margin is None else margin
+    buf, base, first = "", 0, True
+    pieces = iter(pieces)
+    done = False
+    while not done:
+        parts = [buf]
+        size = len(buf)
+        while size < window_chars + 2 * margin:
+            piece = next(pieces, None)
+            if piece is None:
+                done = True
+                break
+            parts.append(piece)
+            size += len(piece)
+        buf = "".join(parts)
+        lo = 0 if first else margin
+        hi = len(buf) if done else len(buf) - margin
+        if hi > lo or (done and buf):
+            yield base, buf, lo, max(lo, hi)
+        first = False
+        # Keep the right margin plus the context the next window needs before its report region.
+        keep = max(0, hi - margin)
+        buf, base = buf[keep:], base + keep
+
+
+def _scan_piece(text: str, lexicon: dict):
+    text = _normalize_hyphens(text)
+    rule_hits, _ = find_bias_rules(text, whitelist=False, lexicon=lexicon)
+    return find_bias_lexicon(text, lexicon), rule_hits, text
+
+
+def iter_hits(pieces, lexicon: dict | None = None, separator: str | None = None,
+              whitelist: bool = True, window_chars: int = DEFAULT_WINDOW_CHARS):
+    """
+    This function streams (ad_index, Hit) pairs over text pieces, e.g. from read_chunks().
+    - Hit offsets are character offsets into the whole stream.
+    - `separator` is a regex between ads; without it the stream is one ad.
+    - `whitelist` drops the rule hits of sentences with an EOE statement.
+    - Lexicon hits are yielded as they are found; rule hits follow when their sentence ends,
+      so only one sentence's rule hits are ever held in memory.
+    """
+    lexicon = lexicon if lexicon is not None else DEFAULT_LEXICON
+    sep_re = _re.compile(separator) if separator else None
+    doc = 0
+    held, eoe = [], False
+
+    def _end_sentence():
+        nonlocal held, eoe
+        out = [] if eoe else held
+        held, eoe = [], False
+        return out
+
+    def _end_doc():
+        nonlocal doc
+        out = _end_sentence()
+        doc += 1
+        return out
+
+    for base, text, lo, hi in iter_windows(pieces, window_chars):
+        # Separators split the window into pieces that are scanned as separate ads.
+        cuts = [(m.start(), m.end()) for m in sep_re.finditer(text)] if sep_re is not None else []
+        edges = [(0, 0)] + cuts + [(len(text), len(text))]
+        for k in range(len(edges) - 1):
+            start, end = edges[k][1], edges[k + 1][0]
+            emit_lo, emit_hi = max(lo, start), min(hi, end)
+            if emit_lo < emit_hi:
+                lex_hits, rule_hits, piece = _scan_piece(text[start:end], lexicon)
+                for h in lex_hits:
+                    if emit_lo <= start + h.start < emit_hi:
+                        yield doc, h.shifted(base + start)
+                rule_hits = [h for h in rule_hits if emit_lo <= start + h.start < emit_hi]
+                if not whitelist:
+                    for h in rule_hits:
+                        yield doc, h.shifted(base + start)
+                elif rule_hits or held or not (lo <= end < hi if k + 1 < len(edges) - 1 else hi == len(text)):
+                    # Walk sentence starts, EOE statements and rule hits in text order. Only an ad that
+                    # ends in this region with no rule hits can skip it: otherwise its last sentence
+                    # may go on into the next window, and an EOE statement here would still count there.
+                    lo_p, hi_p = emit_lo - start, emit_hi - start
+                    events = [(p, 0, None) for p in _sentences_for(piece).starts if lo_p <= p < hi_p]
+                    for m in _eoe_matches(piece, lo_p, min(len(piece), hi_p + MAX_MATCH_CHARS)):
+                        if m.start() >= hi_p:
+                            break
+                        events.append((m.start(), 1, None))
+                    events.extend((h.start, 2, h) for h in rule_hits)
+                    events.sort(key=lambda ev: ev[:2])
+                    for _, kind, h in events:
+                        if kind == 0:
+                            for done in _end_sentence():
+                                yield doc, done
+                        elif kind == 1:
+                            eoe = True
+                        else:
+                            held.append(h.shifted(base + start))
+            if k + 1 < len(edges) - 1 and lo <= end < hi:
+                # A separator starting in this window's report region closes the current ad.
+                for h in _end_doc():
+                    yield doc - 1, h
+    for h in _end_doc() if whitelist else []:
+        yield doc - 1, h
+
+
+def scan_file(path: str, lexicon: dict | None = None, separator: str | None = None,
+              whitelist: bool = True, window_chars: int = DEFAULT_WINDOW_CHARS,
+              chunk_bytes: int = DEFAULT_CHUNK_BYTES, encoding: str = "utf-8"):
+    """Streams (ad_index, Hit) pairs for a file of any size; see iter_hits()."""
+    return iter_hits(read_chunks(path, chunk_bytes, encoding), lexicon, separator, whitelist, window_chars)
@@ -0,0 +1,330 @@
+"""
+Structured (JSON) explanations with a per-phrase rewrite cache.
+
+Instead of ~300 words of Markdown, Gemini is asked for a JSON list of
+{category, term, reason, rewrite} items plus one neutral rewrite of the
+ad, constrained by a response schema whose categories are those of the
+active lexicon and its rules. Each item is saved in a phrase cache
+keyed on (category, term), so a term explained once is answered from the
+cache afterwards, and Gemini is only asked about terms it has not seen.
+When every flagged term is cached no request is made at all, and the
+neutral rewrite is built by swapping each flagged term for its rewrite.
+"""
+import json
+import os
+import re as _re
+import threading
+from dataclasses import dataclass, field
+
+from . import metrics
+from .admission import FLIGHTS, GeminiBusy, get_gemini_queue
+from .breaker import CircuitOpen, get_breaker
+from .cache import ResponseCache, make_key
+from .detection import DEFAULT_LEXICON, _normalize_hyphens, _rules_engine, category_explanation
+from .gemini import (
+    NOT_CONFIGURED_MSG,
+    _RESOLVER,
+    _call_gemini,
+    _failure_message,
+    get_response_cache,
+    is_model_not_found,
+)
+from .paths import cache_dir
+from .prompts import STRUCTURED_SYSTEM_PROMPT
+
+def response_schema(categories) -> dict:
+    """
+    This function builds the schema passed to Gemini as response_schema (an OpenAPI subset).
+    "category" is limited to the given categories, so every item can be coloured and explained.
+    """
+    return {
+        "type": "object",
+        "properties": {
+            "items": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "category": {"type": "string", "enum": sorted(categories)},
+                        "term": {"type": "string"},
+                        "reason": {"type": "string"},
+                        "rewrite": {"type": "string"},
+                    },
+                    "required": ["category", "term", "reason", "rewrite"],
+                },
+            },
+            "neutral_rewrite": {"type": "string"},
+        },
+        "required": ["items", "neutral_rewrite"],
+    }
+
+
+def lexicon_categories(lexicon: dict | None = None) -> list:
+    """Returns the sorted categories of a lexicon together with its rule labels."""
+    lexicon = lexicon if lexicon is not None else DEFAULT_LEXICON
+    return sorted(set(lexicon) | {rule["label"] for rule in _rules_engine(lexicon).rules})
+
+
+@dataclass
+class StructuredExplanation:
+    """
+    Parsed structured answer for one ad.
+    - items: {"category", "term", "reason", "rewrite", "spans", "cached"} dicts, one per (category, term).
+    - neutral_rewrite: the whole ad reworded; built locally when no request was needed.
+    - error: a readable warning instead of an answer (then items may be empty).
+    """
+    items: list = field(default_factory=list)
+    neutral_rewrite: str = ""
+    error: str | None = None
+    requested_terms: int = 0
+
+    @property
+    def cached_terms(self) -> int:
+        return sum(1 for it in self.items if it.get("cached"))
+
+    def to_dict(self) -> dict:
+        return {"items": self.items, "neutral_rewrite": self.neutral_rewrite, "error": self.error}
+
+    def to_markdown(self, lexicon: dict | None = None) -> str:
+        """
+        Renders the answer as Markdown in the same layout as the free-form explanations.
+        Category explanations come from `lexicon` when it has its own (see category_explanation()).
+        """
+        if self.error:
+            return self.error
+        if not self.items:
+            return "No biased wording found.\n\n#### Neutral rewrite\n" + self.neutral_rewrite
+        out = []
+        by_cat = {}
+        for it in self.items:
+            by_cat.setdefault(it["category"], []).append(it)
+        for cat, items in by_cat.items():
+            out.append(f"#### {cat[:1].upper() + cat[1:]}")
+            reason = category_explanation(cat, lexicon)
+            if reason:
+                out.append(f"_{reason}_")
+            for it in items:
+                out.append(f"- **“{it['term']}”** — {it['reason']} Try: “{it['rewrite']}”.")
+            out.append("")
+        out.append("#### Neutral rewrite")
+        out.append(self.neutral_rewrite)
+        return "\n".join(out)
+
+
+def _phrase(term: str) -> str:
+    return " ".join(_normalize_hyphens(term).lower().split())
+
+
+_PHRASE_CACHE = None
+_PHRASE_CACHE_LOCK = threading.Lock()
+
+
+def get_phrase_cache() -> ResponseCache | None:
+    """
+    Returns the process-wide (category, term) rewrite cache, or None when GEMINI_CACHE=0.
+    It uses the same size and TTL settings as the response cache, in its own file.
+    """
+    global _PHRASE_CACHE
+    if os.getenv("GEMINI_CACHE", "1") == "0":
+        return None
+    with _PHRASE_CACHE_LOCK:
+        if _PHRASE_CACHE is None:
+            try:
+                _PHRASE_CACHE = ResponseCache(
+                    os.path.join(cache_dir(), "phrases.sqlite3"),
+                    max_bytes=float(os.getenv("GEMINI_CACHE_MAX_MB", 64)) * 1024 * 1024,
+                    ttl=float(os.getenv("GEMINI_CACHE_TTL_HOURS", 168)) * 3600,
+                )
+            except Exception:
+                return None
+        return _PHRASE_CACHE
+
+
+def phrase_key(category: str, term: str) -> str:
+    # The prompt is part of the key, so changing it retires old answers.
+    return make_key("phrase", category, _phrase(term), STRUCTURED_SYSTEM_PROMPT)
+
+
+def build_structured_prompt(text: str, terms: list) -> str:
+    """Builds the user prompt listing only the (category, term) pairs that still need an answer."""
+    listed = "\n".join(f"- {cat}: {term}" for cat, term in terms) or "- None from heuristics/lexicon"
+    return f"""## Input text
+{text}
+
+## Terms to explain
+{listed}
+
+## Task
+Return JSON matching the schema: one item per term above (and per other biased phrase you find),
+and "neutral_rewrite" with the whole text reworded without biased language.
+Keep each reason to one sentence and each rewrite to a few words.
+"""
+
+
+def parse_structured(raw: str) -> tuple:
+    """
+    This function parses Gemini's JSON answer into (items, neutral_rewrite).
+    Items missing a field are dropped; raises ValueError when the answer is not the expected JSON.
+    """
+    data = json.loads(raw)
+    if not isinstance(data, dict) or not isinstance(data.get("items", []), list):
+        raise ValueError("expected an object with an 'items' list")
+    items = []
+    for it in data.get("items", []):
+        if not isinstance(it, dict):
+            continue
+        values = {k: it.get(k) for k in ("category", "term", "reason", "rewrite")}
+        if all(isinstance(v, str) and v.strip() for v in values.values()):
+            items.append({k: v.strip() for k, v in values.items()})
+    rewrite = data.get("neutral_rewrite")
+    return items, rewrite.strip() if isinstance(rewrite, str) else ""
+
+
+def _find_spans(text: str, term: str) -> list:
+    # Case-insensitive positions of a term Gemini found on its own (no detector hit to take spans from),
+    # as whole words of the original text: "fit" is not found inside "benefits".
+    if not term:
+        return []
+    pattern = _re.compile(r"(?<!\w)" + _re.escape(term) + r"(?!\w)", _re.IGNORECASE)
+    return [[m.start(), m.end()] for m in pattern.finditer(text)]
+
+
+def apply_rewrites(text: str, items: list) -> str:
+    """
+    This function replaces every span of every item with that item's rewrite.
+    Overlapping spans keep the earliest (then longest) one; a capital first letter is kept.
+    """
+    spans = []
+    for it in items:
+        for start, end in it.get("spans", []):
+            spans.append((start, -end, it["rewrite"]))
+    out, pos = [], 0
+    for start, neg_end, rewrite in sorted(spans):
+        end = -neg_end
+        if start < pos:
+            continue
+        if text[start:start + 1].isupper():
+            rewrite = rewrite[:1].upper() + rewrite[1:]
+        out.append(text[pos:start])
+        out.append(rewrite)
+        pos = end
+    out.append(text[pos:])
+    return "".join(out)
+
+
+def explain_structured(text: str, hits: list, temperature: float = 0.3, use_cache: bool = True,
+                       session=None, on_wait=None, lexicon: dict | None = None) -> StructuredExplanation:
+    """
+    This function explains an ad's flagged terms as structured items.
+    - `hits` are the Hit objects from the lexicon and rules; their spans are attached to the items.
+    - Cached (category, term) answers are reused; Gemini is asked only about the others.
+    - With every term cached, no request is made and the neutral rewrite is built locally.
+    - An ad with no hits is sent whole, so Gemini can still point out subtle wording.
+    - `session` and `on_wait` are passed to the process-wide Gemini queue.
+    - Gemini may only answer with categories of `lexicon` (default: the built-in one) and its rules.
+    """
+    text = _normalize_hyphens(text or "")
+    pairs = {}
+    for h in hits:
+        spans = pairs.setdefault((h.category, _phrase(h.term)), {"term": h.term, "spans": []})["spans"]
+        if [h.start, h.end] not in spans:  # The lexicon and the rules often flag the same span.
+            spans.append([h.start, h.end])
+
+    phrases = get_phrase_cache()
+    known, missing = {}, []
+    for (cat, phrase), info in pairs.items():
+        hit = None
+        if phrases is not None and use_cache:
+            hit = phrases.get(phrase_key(cat, phrase))
+            metrics.cache_result("phrase", hit is not None)
+        if hit is not None:
+            known[(cat, phrase)] = json.loads(hit)
+        else:
+            missing.append((cat, info["term"]))
+
+    result = StructuredExplanation(requested_terms=len(missing))
+    fresh, neutral = {}, ""
+    if missing or not pairs:
+        categories = sorted(set(lexicon_categories(lexicon)) | {cat for cat, _ in pairs})
+        answer = _request(text, missing, categories, temperature, use_cache, session, on_wait)
+        if isinstance(answer, str):
+            return StructuredExplanation(error=answer, requested_terms=len(missing))
+        items, neutral = answer
+        for it in items:
+            fresh[(it["category"], _phrase(it["term"]))] = it
+            if phrases is not None:
+                phrases.put(phrase_key(it["category"], it["term"]),
+                            json.dumps({"reason": it["reason"], "rewrite": it["rewrite"]}, ensure_ascii=False))
+
+    for (cat, phrase), info in pairs.items():
+        answer = known.get((cat, phrase)) or fresh.pop((cat, phrase), None)
+        if answer is None:
+            continue  # Gemini skipped this term; it still shows in Quick Highlights.
+        result.items.append({"category": cat, "term": info["term"], "reason": answer["reason"],
+                             "rewrite": answer["rewrite"], "spans": info["spans"],
+                             "cached": (cat, phrase) in known})
+    # Anything else Gemini pointed out, located in the text.
+    for it in fresh.values():
+        result.items.append({**it, "spans": _find_spans(text, it["term"]), "cached": False})
+    result.neutral_rewrite = neutral or apply_rewrites(text, result.items)
+    return result
+
+
+def _request(text: str, terms: list, categories: list, temperature: float, use_cache: bool,
+             session=None, on_wait=None):
+    # Returns (items, neutral_rewrite), or a warning string.
+    with metrics.stage("gemini_resolve"):
+        name, model = _RESOLVER.get_model()
+    if model is None:
+        metrics.inc("biasdetector_gemini_requests_total", outcome="not_configured")
+        return NOT_CONFIGURED_MSG
+
+    def _key(model_name):
+        return make_key("structured", text, sorted(terms), categories, round(float(temperature), 3), model_name,
+                        STRUCTURED_SYSTEM_PROMPT)
+
+    cache = get_response_cache()
+    if cache is not None and use_cache:
+        cached = cache.get(_key(name))
+        metrics.cache_result("gemini_response", cached is not None)
+        if cached is not None:
+            return parse_structured(cached)
+
+    contents = [{"role": "user", "parts": [{"text": STRUCTURED_SYSTEM_PROMPT},
+                                           {"text": build_structured_prompt(text, terms)}]}]
+    config = {
+        "temperature": float(temperature),
+        "response_mime_type": "application/json",
+        "response_schema": response_schema(categories),
+    }
+
+    def _generate(waiting):
+        name_, model_ = name, model
+        try:
+            get_breaker().check()
+            with get_gemini_queue().slot(session, waiting):
+                while True:
+                    try:
+                        with metrics.stage("gemini_structured", model=name_):
+                            raw = "".join(_call_gemini(name_, model_, contents, config))
+                        parsed = parse_structured(raw)
+                    except CircuitOpen:
+                        raise
+                    except Exception as e:
+                        metrics.gemini_error(e)
+                        if is_model_not_found(e):
+                            name_, model_ = _RESOLVER.mark_not_found(name_)
+                            if model_ is not None:
+                                continue
+                        return _failure_message(e)
+                    break
+        except (GeminiBusy, CircuitOpen) as e:
+            return _failure_message(e)
+        metrics.inc("biasdetector_gemini_requests_total", outcome="ok")
+        _RESOLVER.mark_success(name_)
+        if cache is not None:
+            cache.put(_key(name_), raw)
+        return parsed
+
+    # Sessions asking about the same terms at the same time share one request.
+    return FLIGHTS.call(_key(name), _generate, on_wait)
@@ -0,0 +1,238 @@
+"""Admission: the fair Gemini queue serves sessions in turn, and concurrent callers share one request."""
+import threading
+import time
+
+import pytest
+
+from biasdetector import admission
+from biasdetector.admission import FairQueue, GeminiBusy, SingleFlight
+
+
+def _wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def _start(target, *args) -> threading.Thread:
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_waiting_sessions_are_served_round_robin():
+    queue = FairQueue(max_active=1)
+    queue.acquire()
+    served = []
+
+    def _call(session):
+        queue.acquire(session)
+        served.append(session)
+        queue.release()
+
+    threads = []
+    for n, session in enumerate(["busy", "busy", "busy", "other", "third"]):
+        threads.append(_start(_call, session))
+        _wait_for(lambda: queue.waiting == n + 1)
+    queue.release()
+    for t in threads:
+        t.join(5)
+    # One busy session cannot hold back the others, although it queued first.
+    assert served == ["busy", "other", "third", "busy", "busy"]
+    assert queue.active == 0 and queue.waiting == 0
+
+
+def test_place_in_line_and_wait_are_reported():
+    queue = FairQueue(max_active=1)
+    queue.acquire()
+    updates = {"first": [], "second": []}
+    hold = threading.Event()
+
+    def _call(session):
+        queue.acquire(session, on_wait=lambda position, eta: updates[session].append((position, eta)))
+        hold.wait(5)
+        queue.release()
+
+    first = _start(_call, "first")
+    _wait_for(lambda: updates["first"] == [(1, 10.0)])
+    second = _start(_call, "second")
+    _wait_for(lambda: updates["second"] == [(2, 20.0)])
+    queue.release()
+    _wait_for(lambda: updates["second"] == [(2, 20.0), (1, 10.0)])
+    hold.set()
+    first.join(5)
+    second.join(5)
+    assert updates == {"first": [(1, 10.0), (0, 0.0)], "second": [(2, 20.0), (1, 10.0), (0, 0.0)]}
+
+
+def test_full_queue_fails_fast():
+    queue = FairQueue(max_active=1, max_waiting=1)
+    queue.acquire()
+    waiter = _start(lambda: (queue.acquire("a"), queue.release()))
+    _wait_for(lambda: queue.waiting == 1)
+    with pytest.raises(GeminiBusy, match="queue is full"):
+        queue.acquire("b")
+    queue.release()
+    waiter.join(5)
+    assert queue.active == 0 and queue.waiting == 0
+
+
+def test_waiting_too_long_fails_and_leaves_the_line():
+    queue = FairQueue(max_active=1, timeout=0.2)
+    queue.acquire()
+    with pytest.raises(GeminiBusy, match="waited"):
+        queue.acquire("a")
+    assert queue.waiting == 0
+    queue.release()
+    assert queue.active == 0 and queue.try_acquire()
+
+
+def test_try_acquire_then_release():
+    queue = FairQueue(max_active=1)
+    assert queue.try_acquire()
+    assert not queue.try_acquire()
+    got = threading.Event()
+    waiter = _start(lambda: (queue.acquire("a"), got.set()))
+    _wait_for(lambda: queue.waiting == 1)
+    queue.release()  # Hands the slot to the waiting caller.
+    assert got.wait(5)
+    waiter.join(5)
+    assert queue.active == 1 and not queue.try_acquire()
+    queue.release()
+    assert queue.active == 0 and queue.try_acquire()
+
+
+@pytest.fixture
+def joined(monkeypatch):
+    # Counts callers that attached to a running request instead of starting their own.
+    count = []
+    real = admission.metrics.inc
+
+    def _inc(name, value=1, **labels):
+        if name == "biasdetector_gemini_coalesced_total":
+            count.append(1)
+        real(name, value, **labels)
+
+    monkeypatch.setattr(admission.metrics, "inc", _inc)
+    return count
+
+
+def _collect(flights, key, produce, out, on_wait=None):
+    def _run():
+        try:
+            for chunk in flights.stream(key, produce, on_wait):
+                out.append(chunk)
+        except Exception as e:
+            out.append(e)
+
+    return _start(_run)
+
+
+def test_followers_get_the_leaders_chunks_and_queue_updates(joined):
+    flights = SingleFlight()
+    gate = threading.Event()
+    calls = []
+
+    def _produce(waiting):
+        calls.append(1)
+        waiting(2, 20.0)
+        gate.wait(5)
+        yield from ["Young ", "excludes ", "older people."]
+
+    leader, updates = [], []
+    threads = [_collect(flights, "key", _produce, leader)]
+    _wait_for(lambda: len(flights) == 1)
+    followers = [[], []]
+    for out in followers:
+        threads.append(_collect(flights, "key", _produce, out, lambda *status: updates.append(status)))
+    _wait_for(lambda: len(joined) == 2)
+    gate.set()
+    for t in threads:
+        t.join(5)
+    assert leader == followers[0] == followers[1] == ["Young ", "excludes ", "older people."]
+    assert updates == [(2, 20.0), (2, 20.0)]
+    assert calls == [1] and len(flights) == 0
+
+
+def test_leader_error_reaches_every_follower(joined):
+    flights = SingleFlight()
+    gate = threading.Event()
+    calls = []
+
+    def _produce(waiting):
+        calls.append(1)
+        gate.wait(5)
+        yield "⚠️ Gemini call failed: quota exceeded."
+
+    outs = [[], [], []]
+    threads = [_collect(flights, "key", _produce, outs[0])]
+    _wait_for(lambda: len(flights) == 1)
+    threads += [_collect(flights, "key", _produce, out) for out in outs[1:]]
+    _wait_for(lambda: len(joined) == 2)
+    gate.set()
+    for t in threads:
+        t.join(5)
+    assert outs == [["⚠️ Gemini call failed: quota exceeded."]] * 3
+    assert calls == [1]
+    # The key is forgotten once the request ends: the next caller asks again.
+    assert list(flights.stream("key", _produce)) == ["⚠️ Gemini call failed: quota exceeded."]
+    assert calls == [1, 1]
+
+
+def test_leader_that_fails_before_any_chunk_hands_off(joined):
+    flights = SingleFlight()
+    gate = threading.Event()
+    calls = []
+
+    def _produce(waiting):
+        calls.append(1)
+        if len(calls) == 1:
+            gate.wait(5)
+            raise ConnectionError("page closed")
+        yield "Answer."
+
+    leader, follower = [], []
+    threads = [_collect(flights, "key", _produce, leader)]
+    _wait_for(lambda: len(flights) == 1)
+    threads.append(_collect(flights, "key", _produce, follower))
+    _wait_for(lambda: len(joined) == 1)
+    gate.set()
+    for t in threads:
+        t.join(5)
+    assert isinstance(leader[0], ConnectionError)
+    # Nothing was shown yet, so the follower started the request itself.
+    assert follower == ["Answer."] and calls == [1, 1]
+
+
+def test_leader_abandoned_mid_stream_warns_followers(joined):
+    flights = SingleFlight()
+    stream = flights.stream("key", lambda waiting: iter(["Young ", "excludes "]))
+    assert next(stream) == "Young "
+    follower = []
+    thread = _collect(flights, "key", lambda waiting: iter(["never used"]), follower)
+    _wait_for(lambda: follower == ["Young "])
+    stream.close()  # The leader's page went away.
+    thread.join(5)
+    assert follower == ["Young ", "\n\n⚠️ Gemini call failed: the request this answer was shared from was cancelled."]
+    assert len(flights) == 0
+
+
+def test_call_shares_one_value(joined):
+    flights = SingleFlight()
+    gate = threading.Event()
+    calls, results = [], []
+
+    def _fn(waiting):
+        calls.append(1)
+        gate.wait(5)
+        return {"items": []}
+
+    threads = [_start(lambda: results.append(flights.call("key", _fn)))]
+    _wait_for(lambda: len(flights) == 1)
+    threads.append(_start(lambda: results.append(flights.call("key", _fn))))
+    _wait_for(lambda: len(joined) == 1)
+    gate.set()
+    for t in threads:
+        t.join(5)
+    assert len(results) == 2 and results[0] is results[1] and calls == [1]
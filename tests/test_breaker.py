@@ -0,0 +1,159 @@
+"""Circuit breaker: closed -> open -> half-open -> closed/open, and Gemini calls going through it."""
+import threading
+import time
+import types
+
+import pytest
+
+from biasdetector import breaker as breaker_mod
+from biasdetector import gemini
+from biasdetector.breaker import CircuitBreaker, CircuitOpen
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(breaker_mod, "time", types.SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+def test_opens_after_consecutive_failures(clock):
+    b = CircuitBreaker(failures=3, reset_seconds=30)
+    for _ in range(2):
+        assert b.allow()
+        b.record_failure()
+    b.record_success(0.1)  # A success resets the streak.
+    for _ in range(2):
+        b.record_failure()
+    assert b.state == "closed"
+    b.record_failure()
+    assert b.state == "open" and not b.allow()
+    assert b.retry_in() == 30
+    with pytest.raises(CircuitOpen, match="30 s"):
+        b.check()
+    with pytest.raises(CircuitOpen):
+        b.guard()
+
+
+def test_slow_answers_count_as_failures(clock):
+    b = CircuitBreaker(failures=2, slow_seconds=5)
+    b.record_success(6)
+    b.record_success(4)
+    b.record_success(6)
+    assert b.state == "closed"
+    b.record_success(7)
+    assert b.state == "open"
+
+
+def test_half_open_lets_probes_through_and_a_good_probe_closes(clock):
+    b = CircuitBreaker(failures=1, reset_seconds=30, probes=2)
+    b.record_failure()
+    clock.now += 29.9
+    assert b.state == "open"
+    clock.now += 0.1
+    assert b.state == "half_open" and b.retry_in() == 0
+    assert b.allow() and b.allow()
+    assert not b.allow()
+    with pytest.raises(CircuitOpen):
+        b.check()
+    b.release()  # A probe that ended without an answer gives its turn back.
+    b.check()
+    assert b.allow()
+    b.record_success(0.2)
+    assert b.state == "closed" and b.allow()
+
+
+def test_failed_or_slow_probe_reopens_for_another_period(clock):
+    b = CircuitBreaker(failures=5, slow_seconds=5, reset_seconds=10)
+    for _ in range(5):
+        b.record_failure()
+    clock.now += 10
+    assert b.allow()
+    b.record_failure()  # One failed probe is enough; the streak limit applies only when closed.
+    assert b.state == "open" and b.retry_in() == 10
+    clock.now += 10
+    assert b.allow()
+    b.record_success(6)
+    assert b.state == "open"
+
+
+class FakeModel:
+    def __init__(self, behaviour):
+        self.behaviour = behaviour
+        self.calls = 0
+
+    def generate_content(self, contents, generation_config=None, request_options=None, stream=False):
+        self.calls += 1
+        return self.behaviour()
+
+
+def _answer(text):
+    return lambda: types.SimpleNamespace(text=text)
+
+
+def _fail():
+    raise ConnectionError("reset by peer")
+
+
+@pytest.fixture
+def fresh_breaker(monkeypatch):
+    b = CircuitBreaker(failures=2, slow_seconds=5, reset_seconds=60)
+    monkeypatch.setattr(gemini, "get_breaker", lambda: b)
+    return b
+
+
+def _call(model):
+    return "".join(gemini._call_gemini("fake", model, [], {}))
+
+
+def test_failing_calls_open_the_breaker_and_later_calls_fail_fast(fresh_breaker):
+    model = FakeModel(_fail)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            _call(model)
+    assert fresh_breaker.state == "open"
+    with pytest.raises(CircuitOpen):
+        _call(model)
+    assert model.calls == 2
+
+
+def test_deadline_counts_as_a_failure(fresh_breaker, monkeypatch):
+    monkeypatch.setenv("GEMINI_TIMEOUT", "0.05")
+    release = threading.Event()
+    model = FakeModel(lambda: release.wait(5) and _answer("late")())
+    try:
+        with pytest.raises(TimeoutError):
+            _call(model)
+        assert fresh_breaker._streak == 1
+        assert _call(FakeModel(_answer("ok"))) == "ok"
+        assert fresh_breaker.state == "closed" and fresh_breaker._streak == 0
+    finally:
+        release.set()
+
+
+class NotFound(Exception):
+    pass
+
+
+def test_unknown_model_gives_its_probe_back(fresh_breaker):
+    fresh_breaker.record_failure()
+    fresh_breaker.record_failure()
+    fresh_breaker._opened = time.monotonic() - 61
+    assert fresh_breaker.state == "half_open"
+
+    def _missing():
+        raise NotFound("404 models/fake is not found")
+
+    with pytest.raises(NotFound):
+        _call(FakeModel(_missing))
+    assert fresh_breaker.state == "half_open"  # Says nothing about Gemini's health.
+    assert _call(FakeModel(_answer("ok"))) == "ok"
+    assert fresh_breaker.state == "closed"
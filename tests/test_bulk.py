@@ -0,0 +1,122 @@
+"""explain_many against a scripted fake client: retries, rate limit, concurrency and deadlines."""
+import asyncio
+import time
+
+from biasdetector.bulk import TokenBucket, explain_many_sync, is_retryable, status_code
+
+
+class APIError(Exception):
+    """Stands in for a google.api_core error: the HTTP status is in `code`."""
+
+    def __init__(self, code: int, message: str = ""):
+        super().__init__(message or f"HTTP {code}")
+        self.code = code
+
+
+class ScriptedClient:
+    """
+    Fake Gemini client. Each ad text has a script of steps, used one per call:
+    a string is the answer, an int raises APIError with that status, "hang" never answers
+    in time and an exception instance is raised as is. An ad whose script ran out answers "ok".
+    """
+    model_name = "fake-model"
+
+    def __init__(self, scripts: dict | None = None, latency: float = 0.0):
+        self.scripts = {text: list(steps) for text, steps in (scripts or {}).items()}
+        self.latency = latency
+        self.calls = []  # (ad text, monotonic start time)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def generate(self, system_prompt: str, user_prompt: str, temperature: float) -> str:
+        text = user_prompt.split("\n")[1]  # The prompt starts with "## Input text" and the ad.
+        self.calls.append((text, time.monotonic()))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            steps = self.scripts.get(text)
+            step = steps.pop(0) if steps else "ok"
+            await asyncio.sleep(self.latency)
+            if step == "hang":
+                await asyncio.sleep(3600)
+            if isinstance(step, int):
+                raise APIError(step)
+            if isinstance(step, BaseException):
+                raise step
+            return step
+        finally:
+            self.in_flight -= 1
+
+
+def _run(client, texts, **kwargs):
+    kwargs = {"use_cache": False, "base_delay": 0.0, **kwargs}
+    return explain_many_sync([(t, {"age bias": ["young"]}) for t in texts], client=client, **kwargs)
+
+
+def test_rate_limits_and_server_errors_are_retried():
+    client = ScriptedClient({"ad-a": [429, 503, 500, "explained"]})
+    [result] = _run(client, ["ad-a"])
+    assert result.ok and result.text == "explained"
+    assert result.attempts == 4
+
+
+def test_gives_up_after_max_retries():
+    client = ScriptedClient({"ad-a": [503] * 10})
+    [result] = _run(client, ["ad-a"], max_retries=2)
+    assert not result.ok
+    assert result.attempts == 3
+    assert result.error_type == "APIError"
+
+
+def test_client_errors_are_not_retried():
+    client = ScriptedClient({"ad-a": [400], "ad-b": [ValueError("prompt uses 5000 tokens")]})
+    a, b = _run(client, ["ad-a", "ad-b"])
+    assert (a.ok, a.attempts) == (False, 1)
+    assert (b.ok, b.attempts) == (False, 1)
+
+
+def test_deadline_covers_all_attempts():
+    client = ScriptedClient({"ad-a": ["hang"]})
+    started = time.monotonic()
+    [result] = _run(client, ["ad-a"], deadline=0.2)
+    assert not result.ok and result.error_type == "DeadlineExceeded"
+    assert time.monotonic() - started < 2
+
+
+def test_results_keep_input_order_and_concurrency_is_capped():
+    texts = [f"ad-{i}" for i in range(12)]
+    client = ScriptedClient({t: [f"answer {t}"] for t in texts}, latency=0.02)
+    results = _run(client, texts, concurrency=3)
+    assert [r.text for r in results] == [f"answer {t}" for t in texts]
+    assert [r.index for r in results] == list(range(12))
+    assert client.max_in_flight == 3
+
+
+def test_token_bucket_spaces_request_starts():
+    client = ScriptedClient()
+    _run(client, [f"ad-{i}" for i in range(6)], rate_per_sec=4)
+    starts = sorted(t for _, t in client.calls)
+    # The bucket holds 4 tokens: four requests start at once, the last two wait 1/4 s each.
+    assert starts[3] - starts[0] < 0.1
+    assert starts[5] - starts[0] >= 2 / 4 * 0.9
+
+
+def test_token_bucket_allows_bursts_up_to_capacity():
+    async def _burst():
+        bucket = TokenBucket(rate=1, capacity=3)
+        started = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(_burst()) < 0.1
+
+
+def test_is_retryable_uses_type_and_status_not_message():
+    assert is_retryable(asyncio.TimeoutError())
+    assert is_retryable(ConnectionResetError())
+    assert is_retryable(APIError(429)) and is_retryable(APIError(503))
+    assert not is_retryable(APIError(400, "quota is 500 requests"))
+    assert not is_retryable(RuntimeError("prompt has 5000 tokens, model returned 502 words"))
+    assert is_retryable(type("ResourceExhausted", (Exception,), {})("429 quota"))
+    assert status_code(APIError(504)) == 504 and status_code(RuntimeError("504")) is None
@@ -0,0 +1,61 @@
+"""Response cache: TTL expiry, LRU eviction under a size budget, hit/miss counts."""
+import pytest
+
+from biasdetector import cache as cache_mod
+from biasdetector.cache import ResponseCache, make_key
+
+
+class _Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = _Clock()
+    monkeypatch.setattr(cache_mod.time, "time", c)
+    return c
+
+
+def test_make_key_is_stable_and_order_sensitive():
+    assert make_key("model", "prompt", {"b": 1, "a": 2}) == make_key("model", "prompt", {"a": 2, "b": 1})
+    assert make_key("a", "b") != make_key("b", "a")
+
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "c.sqlite3"), ttl=60)
+    cache.put("k", "v")
+    clock.now += 59
+    assert cache.get("k") == "v"
+    clock.now += 2
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_is_evicted_first(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "c.sqlite3"), max_bytes=30)
+    for key in ("a", "b", "c"):
+        cache.put(key, "x" * 10)
+        clock.now += 1
+    assert cache.get("a") == "x" * 10  # "a" is now the most recently used.
+    clock.now += 1
+    cache.put("d", "y" * 10)
+    assert cache.get("b") is None
+    assert [cache.get(k) is not None for k in ("a", "c", "d")] == [True, True, True]
+    assert cache.stats()["bytes"] <= 30
+
+
+def test_values_larger_than_budget_are_not_stored(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "c.sqlite3"), max_bytes=5)
+    cache.put("big", "too large")
+    assert cache.get("big") is None
+
+
+def test_cache_survives_reopen(tmp_path, clock):
+    path = str(tmp_path / "c.sqlite3")
+    ResponseCache(path).put("k", "kept")
+    assert ResponseCache(path).get("k") == "kept"
@@ -0,0 +1,66 @@
+"""Columnar store: reports, per-hit offsets, and no meta.json for a store that failed part-way."""
+import json
+
+import pytest
+
+from biasdetector.columnar import ColumnarStore, ColumnarWriter, build_store
+from biasdetector.scan import analyze_document
+
+ADS = [
+    {"employer": "Acme", "date": "2024-03-02", "text": "We want a young salesman. Young people only."},
+    {"employer": "Acme", "date": "2024-04-10", "text": "Must be a culture fit."},
+    {"employer": "Globex", "date": "2024-03-15", "text": "A friendly team."},
+]
+
+
+def _records():
+    return [{**analyze_document(ad["text"]), "employer": ad["employer"], "date": ad["date"]} for ad in ADS]
+
+
+def _write(path, records):
+    with ColumnarWriter(str(path)) as writer:
+        for record in records:
+            writer.add(record)
+
+
+def test_reports_and_offsets(tmp_path):
+    records = _records()
+    _write(tmp_path / "store", records)
+    store = ColumnarStore(str(tmp_path / "store"))
+    assert store.n_docs == 3
+    report = store.category_rates(by="employer")
+    rows = {(g, c): n for g, c, n, _, _ in report.rows()}
+    assert rows[("Acme", "age bias")] == 1 and rows[("Acme", "cultural fit exclusion")] == 1
+    assert ("age bias", "young", 1) in store.top_terms()
+
+    for doc, (ad, record) in enumerate(zip(ADS, records)):
+        spans = store.spans(doc)
+        got = sorted((store.categories[c], store.terms[t], s, e) for c, t, s, e in
+                     zip(spans["category"], spans["term"], spans["start"], spans["end"]))
+        want = sorted((h["category"], h["term"], *h["span"]) for h in record["hits"])
+        assert got == want
+        assert all(ad["text"][s:e].lower() == term.lower() for _, term, s, e in got)
+    assert store.spans(2)["start"].size == 0
+
+
+def test_failed_write_leaves_no_meta_json(tmp_path):
+    path = tmp_path / "store"
+    _write(path, _records())
+    with pytest.raises(RuntimeError):
+        with ColumnarWriter(str(path)) as writer:
+            writer.add(_records()[0])
+            raise RuntimeError("scan crashed")
+    assert not (path / "meta.json").exists()
+    with pytest.raises(ValueError, match="not a finished"):
+        ColumnarStore(str(path))
+
+
+def test_build_store_from_results_file(tmp_path):
+    results = tmp_path / "results.jsonl"
+    results.write_text("".join(json.dumps(r) + "\n" for r in _records()) + "not json\n", encoding="utf-8")
+    with pytest.raises(ValueError):
+        build_store(str(results), str(tmp_path / "store"))
+    assert not (tmp_path / "store" / "meta.json").exists()
+    results.write_text("".join(json.dumps(r) + "\n" for r in _records()), encoding="utf-8")
+    assert build_store(str(results), str(tmp_path / "store")) == 3
+    assert ColumnarStore(str(tmp_path / "store")).n_spans == sum(len(r["hits"]) for r in _records())
@@ -0,0 +1,43 @@
+"""The compiled matching engine finds exactly what per-pattern re.finditer finds."""
+import random
+import re
+
+from benchmarks.corpus import bias_terms, generate_ad
+from biasdetector.detection import DEFAULT_LEXICON, RULES, _MatchEngine, _normalize_hyphens
+
+# Characters where re.IGNORECASE and str.lower() disagree, plus dashes for _normalize_hyphens.
+ODD_CHARS = ["İ", "ı", "ſ", "K", "ẞ", "‐", "—", " ", "\n"]
+
+
+def _reference(engine: _MatchEngine, text: str) -> list:
+    return [[(m.start(), m.end(), m.group(0)) for m in re.finditer(p, text, re.IGNORECASE)]
+            for p in engine.patterns]
+
+
+def _random_texts(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    words = bias_terms(rng) + ["not", "no", "without", "team", "candidate", "the", ".", ","] + ODD_CHARS
+    for _ in range(count):
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(0, 60)))
+        if rng.random() < 0.3:
+            text = text.upper()
+        yield text
+
+
+def test_engine_matches_per_pattern_finditer():
+    engine = _MatchEngine(RULES, DEFAULT_LEXICON)
+    for text in _random_texts(1500):
+        assert engine.pattern_matches(text) == _reference(engine, text), text
+
+
+def test_engine_matches_on_generated_ads():
+    engine = _MatchEngine(RULES, DEFAULT_LEXICON)
+    for seed in range(5):
+        text = _normalize_hyphens(generate_ad(20_000, density=0.5, negation_rate=0.3, seed=seed))
+        assert engine.pattern_matches(text) == _reference(engine, text)
+
+
+def test_normalize_hyphens():
+    assert _normalize_hyphens("well‐groomed – self—starter") == "well-groomed - self-starter"
+    text = "nothing to replace"
+    assert _normalize_hyphens(text) is text
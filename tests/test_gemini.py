@@ -0,0 +1,175 @@
+"""Gemini client: one model resolved per process, and streamed answers with their cache and failures."""
+import threading
+import types
+
+import pytest
+
+from biasdetector import gemini
+from biasdetector.breaker import CircuitBreaker
+from biasdetector.gemini import ModelResolver
+
+
+class FakeGenAI:
+    """Stands in for google.generativeai; `known` are the model names this key may use."""
+
+    def __init__(self, known):
+        self.known = set(known)
+        self.made = []
+        self.listed = 0
+        self.keys = []
+
+    def configure(self, api_key):
+        self.keys.append(api_key)
+
+    def GenerativeModel(self, name):
+        if not name.startswith("models/"):
+            raise ValueError("expected a models/ name")
+        self.made.append(name)
+        return types.SimpleNamespace(name=name)
+
+    def list_models(self):
+        self.listed += 1
+        return [types.SimpleNamespace(name=n, supported_generation_methods=["generateContent"]) for n in self.known]
+
+
+@pytest.fixture
+def genai(monkeypatch):
+    fake = FakeGenAI(["models/b", "models/c"])
+    monkeypatch.setattr(gemini, "genai", fake)
+    monkeypatch.setattr(gemini, "_HAS_GEMINI", True)
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    return fake
+
+
+def _resolver(tmp_path):
+    return ModelResolver(["models/a", "models/b", "models/c"], state_path=str(tmp_path / "gemini_model.json"))
+
+
+def test_resolves_once_per_process(genai, tmp_path):
+    resolver = _resolver(tmp_path)
+    names = []
+    threads = [threading.Thread(target=lambda: names.append(resolver.get_model()[0])) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert names == ["models/a"] * 8
+    assert genai.made == ["models/a"] and genai.keys == ["test-key"]
+
+
+def test_success_is_saved_and_read_back(genai, tmp_path):
+    resolver = _resolver(tmp_path)
+    resolver.get_model()
+    resolver.mark_success("models/b")
+    assert (tmp_path / "gemini_model.json").exists()
+    assert "test-key" not in (tmp_path / "gemini_model.json").read_text()
+    assert _resolver(tmp_path).get_model()[0] == "models/b"
+
+
+def test_saved_name_is_ignored_for_another_key(genai, tmp_path, monkeypatch):
+    _resolver(tmp_path).get_model()
+    _resolver(tmp_path).mark_success("models/b")
+    monkeypatch.setenv("GOOGLE_API_KEY", "other-key")
+    assert _resolver(tmp_path).get_model()[0] == "models/a"
+
+
+def test_not_found_moves_to_the_next_usable_candidate(genai, tmp_path):
+    resolver = _resolver(tmp_path)
+    assert resolver.get_model()[0] == "models/a"
+    # "models/a" is not in this key's listing, so the listing narrows the candidates to b and c.
+    assert resolver.mark_not_found("models/a")[0] == "models/b"
+    assert resolver.get_model()[0] == "models/b"
+    assert resolver.mark_not_found("models/b")[0] == "models/c"
+    assert resolver.mark_not_found("models/c") == (None, None)
+
+
+def test_model_listing_is_fetched_at_most_once(genai, tmp_path):
+    resolver = _resolver(tmp_path)
+    resolver.get_model()
+    assert genai.listed == 0  # Resolving alone never lists models.
+    resolver.mark_not_found("models/a")
+    resolver.mark_not_found("models/b")
+    assert sorted(resolver.available_models()) == ["models/b", "models/c"]
+    resolver.available_models()
+    assert genai.listed == 1
+
+
+def test_not_configured_without_a_key(genai, tmp_path, monkeypatch):
+    monkeypatch.delenv("GOOGLE_API_KEY")
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    assert _resolver(tmp_path).get_model() == (None, None)
+    assert genai.made == []
+
+
+class StreamingModel:
+    """A model whose streamed answer is `pieces`, optionally followed by `error`."""
+
+    def __init__(self, pieces, error=None):
+        self.pieces, self.error = pieces, error
+        self.calls = 0
+
+    def generate_content(self, contents, generation_config=None, stream=False, request_options=None):
+        self.calls += 1
+        for piece in self.pieces:
+            yield types.SimpleNamespace(text=piece)
+        if self.error is not None:
+            raise self.error
+
+
+class StaticResolver:
+    def __init__(self, model):
+        self.model = model
+
+    def get_model(self, model_name=None):
+        return "models/fake", self.model
+
+    def mark_success(self, name):
+        pass
+
+    def available_models(self):
+        return []
+
+
+@pytest.fixture
+def streaming(tmp_path, monkeypatch):
+    # Installs a model for stream_with_gemini() with a fresh response cache and breaker.
+    monkeypatch.setenv("BIASDETECTOR_CACHE_DIR", str(tmp_path))
+    monkeypatch.delenv("GEMINI_CACHE", raising=False)
+    monkeypatch.setattr(gemini, "_RESPONSE_CACHE", None)
+    monkeypatch.setattr(gemini, "get_breaker", lambda: CircuitBreaker())
+
+    def _install(model):
+        monkeypatch.setattr(gemini, "_RESOLVER", StaticResolver(model))
+        return model
+
+    return _install
+
+
+GROUPED = {"age bias": ["young"]}
+
+
+def test_streamed_answer_is_cached_and_replayed_in_one_piece(streaming):
+    model = streaming(StreamingModel(["Young ", "excludes ", "older people."]))
+    assert list(gemini.stream_with_gemini("A young team.", GROUPED)) == ["Young ", "excludes ", "older people."]
+    assert list(gemini.stream_with_gemini("A young team.", GROUPED)) == ["Young excludes older people."]
+    assert model.calls == 1
+
+
+def test_partial_answer_then_error_ends_with_a_readable_message(streaming):
+    model = streaming(StreamingModel(["Young ", "excl"], ConnectionError("connection reset")))
+    chunks = list(gemini.stream_with_gemini("A young team.", GROUPED))
+    assert chunks[:2] == ["Young ", "excl"]
+    assert chunks[2] == "\n\n⚠️ Gemini call failed: connection reset."
+    # The cut-off answer was not cached, so the next request asks again.
+    streaming(StreamingModel(["Complete answer."]))
+    assert list(gemini.stream_with_gemini("A young team.", GROUPED)) == ["Complete answer."]
+    assert model.calls == 1
+    assert gemini.get_response_cache().get(
+        gemini.response_cache_key("A young team.", GROUPED, 0.3, "models/fake")) == "Complete answer."
+
+
+def test_cache_can_be_bypassed(streaming):
+    model = streaming(StreamingModel(["Answer."]))
+    list(gemini.stream_with_gemini("A young team.", GROUPED))
+    assert list(gemini.stream_with_gemini("A young team.", GROUPED, use_cache=False)) == ["Answer."]
+    assert model.calls == 2
@@ -0,0 +1,67 @@
+"""Incremental re-analysis returns exactly the hits of a full scan and reuses unchanged segments."""
+import random
+
+from benchmarks.corpus import bias_terms
+from biasdetector.detection import DEFAULT_LEXICON, find_bias_lexicon, find_bias_rules
+from biasdetector.incremental import LONG_PARAGRAPH, detect_incremental, split_segments
+
+WORDS = ["equal opportunity", "not", "without", "team", "candidate", "the", "and", ".", "!", ",", "\n"]
+
+
+def _key(h):
+    return (h.start, h.end, h.category, h.type, h.term)
+
+
+def _random_ad(rng: random.Random, terms: list) -> str:
+    paragraphs = []
+    for _ in range(rng.randint(1, 6)):
+        words = [rng.choice(terms + WORDS) for _ in range(rng.randint(0, 160))]
+        paragraphs.append(" ".join(words))
+    return rng.choice(["\n\n", "\n \n", "\n\n\n"]).join(paragraphs)
+
+
+def _assert_same_as_full_scan(text, lex_hits, rule_hits, scores):
+    full_rules, full_scores = find_bias_rules(text)
+    assert sorted(map(_key, lex_hits)) == sorted(map(_key, find_bias_lexicon(text, DEFAULT_LEXICON)))
+    assert sorted(map(_key, rule_hits)) == sorted(map(_key, full_rules))
+    assert scores.keys() == full_scores.keys()
+    for label, value in scores.items():
+        assert abs(value - full_scores[label]) < 1e-9
+
+
+def test_matches_full_scan_on_random_ads():
+    rng = random.Random(7)
+    terms = bias_terms(rng)
+    cache = {}
+    for _ in range(300):
+        text = _random_ad(rng, terms)
+        _, lex_hits, rule_hits, scores, cache = detect_incremental(text, cache)
+        _assert_same_as_full_scan(text, lex_hits, rule_hits, scores)
+
+
+def test_editing_one_paragraph_rescans_only_its_segments():
+    paragraphs = [
+        "We are a friendly team in the city centre.",
+        "The ideal candidate is a young digital native and a recent graduate.",
+        ("You will report to the regional sales director and own the quarterly pipeline. {} "
+         "Travel to client sites within the state is occasional and always planned well ahead."),
+        "We are an equal opportunity employer.",
+    ]
+    text = "\n\n".join(paragraphs).format("The team meets every Monday.")
+    segments, *_, cache = detect_incremental(text, None)
+    assert not any(seg.reused for seg in segments)
+
+    # The edit is further than CONTEXT_CHARS from both neighbours, so their keys do not change.
+    edited = "\n\n".join(paragraphs).format("You will work with the chairman and his salesmen.")
+    segments, lex_hits, rule_hits, scores, _ = detect_incremental(edited, cache)
+    assert lex_hits
+    assert [seg.reused for seg in segments] == [True, True, False, True]
+    _assert_same_as_full_scan(edited, lex_hits, rule_hits, scores)
+
+
+def test_long_paragraphs_are_split_at_sentence_ends():
+    sentence = "This sentence is part of a very long paragraph about the role. "
+    text = sentence * (LONG_PARAGRAPH // len(sentence) + 2)
+    spans = split_segments(text)
+    assert len(spans) > 1
+    assert all(text[s:e].endswith(".") for s, e in spans)
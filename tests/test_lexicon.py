@@ -0,0 +1,110 @@
+"""Lexicon packs keep their own colours, explanations and rules; module defaults never change."""
+import json
+import os
+
+import pytest
+
+from biasdetector.detection import (
+    HIGHLIGHT_COLORS,
+    LABEL_EXPLANATIONS,
+    RULES,
+    build_highlighted_html,
+    category_color,
+    category_explanation,
+    find_bias_lexicon,
+    find_bias_rules,
+)
+from biasdetector.lexicon import LexiconPack
+from biasdetector.scan import analyze_document
+
+PACK = {
+    "name": "test pack",
+    "categories": {
+        "caregiver bias": {
+            "phrases": ["no family commitments"],
+            "color": "#123456",
+            "explanation": "Excludes parents and carers.",
+        },
+    },
+    "rules": [{"regex": r"\bchildless\b", "label": "caregiver bias", "weight": 2}],
+}
+
+
+@pytest.fixture(autouse=True)
+def _cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("BIASDETECTOR_CACHE_DIR", str(tmp_path / "cache"))
+
+
+def _write(path, data):
+    path.write_text(json.dumps(data), encoding="utf-8")
+    # Make the change visible to the stat() check even within one mtime tick.
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def _load(path) -> LexiconPack:
+    pack = LexiconPack(str(path), check_interval=0)
+    pack.current()
+    return pack
+
+
+def test_pack_settings_stay_on_the_pack(tmp_path):
+    colors, explanations, rules = dict(HIGHLIGHT_COLORS), dict(LABEL_EXPLANATIONS), list(RULES)
+    path = tmp_path / "pack.json"
+    _write(path, PACK)
+    pack = _load(path)
+    assert pack.rules[-1]["label"] == "caregiver bias" and len(pack.rules) == len(RULES) + 1
+    assert (HIGHLIGHT_COLORS, LABEL_EXPLANATIONS, RULES) == (colors, explanations, rules)
+
+    lexicon = pack.lexicon
+    assert category_color("caregiver bias", lexicon) == "#123456"
+    assert category_color("caregiver bias") == "#e5e7eb"
+    assert category_explanation("caregiver bias", lexicon) == "Excludes parents and carers."
+    assert category_explanation("caregiver bias") is None
+    assert category_color("age bias", lexicon) == HIGHLIGHT_COLORS["age bias"]
+    text = "No family commitments."
+    assert "#123456" in build_highlighted_html(text, find_bias_lexicon(text, lexicon), [], lexicon)
+
+
+def test_pack_rules_are_used_only_with_the_pack(tmp_path):
+    path = tmp_path / "pack.json"
+    _write(path, PACK)
+    lexicon = _load(path).lexicon
+    text = "We want a young, childless candidate."
+    hits, scores = find_bias_rules(text, lexicon=lexicon)
+    assert sorted(h.term for h in hits) == ["childless", "young"]
+    assert scores == {"age bias": 1.0, "caregiver bias": 2.0}
+    assert [h.term for h in find_bias_rules(text)[0]] == ["young"]
+    assert analyze_document(text, lexicon)["grouped"]["caregiver bias"] == ["childless"]
+
+
+def test_reload_drops_removed_categories_and_rules(tmp_path):
+    path = tmp_path / "pack.json"
+    _write(path, PACK)
+    pack = _load(path)
+    _write(path, {"categories": {"other bias": {"phrases": ["rockstar"]}}})
+    lexicon = pack.current()
+    assert "caregiver bias" not in lexicon
+    assert category_color("caregiver bias", lexicon) == "#e5e7eb"
+    assert [h.term for h in find_bias_rules("A childless candidate.", lexicon=lexicon)[0]] == []
+
+
+def test_replacing_the_default_drops_built_in_rules(tmp_path):
+    path = tmp_path / "pack.json"
+    _write(path, {**PACK, "extends_default": False})
+    pack = _load(path)
+    assert [r["label"] for r in pack.rules] == ["caregiver bias"]
+    assert [h.term for h in find_bias_rules("A young, childless candidate.", lexicon=pack.lexicon)[0]] == ["childless"]
+
+
+@pytest.mark.parametrize("rule", [
+    {"regex": "(", "label": "x"},
+    {"regex": "x"},
+    {"regex": "x", "label": "x", "window": 10_000},
+    {"regex": "x", "label": "x", "weight": "heavy"},
+])
+def test_malformed_rules_are_rejected(tmp_path, rule):
+    path = tmp_path / "pack.json"
+    _write(path, {**PACK, "rules": [rule]})
+    with pytest.raises(ValueError):
+        _load(path)
@@ -0,0 +1,109 @@
+"""Local model: no training row is copied from the example ad, held-out sentences score right, NumPy path agrees."""
+import ast
+import os
+import re
+import threading
+
+import pytest
+
+from biasdetector import localmodel
+from biasdetector.localmodel import BUILTIN_TRAINING, explain_locally, load_examples, local_scores, train
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+# Sentences written for this test; none of them (or anything close) is in the training file.
+HELD_OUT = [
+    ("Seeking mature, seasoned professionals only.", ["age bias"]),
+    ("We want energetic twenty-five year olds for the launch team.", ["age bias"]),
+    ("The new hire will be a salesman in the northern region.", ["gender bias"]),
+    ("English must be your native language.", ["language/ESL bias"]),
+    ("You must love our Friday drinks and weekend parties.", ["cultural fit exclusion"]),
+    ("Citizens of this country only.", ["nationality/visa bias"]),
+    ("We do not sponsor visas.", ["nationality/visa bias"]),
+    ("Applicants must be slim and attractive.", ["appearance bias"]),
+    ("Seeking a data analyst to join our finance team.", []),
+    ("Only complete applications will be reviewed.", []),
+    ("You will manage supplier relationships and budgets.", []),
+    ("We offer a generous pension and four weeks of leave.", []),
+    ("Our professionals work across three continents.", []),
+    ("The successful applicant will lead weekly planning meetings.", []),
+]
+
+# A negation before the word a flag rests on drops the flag, unless the sentence has other evidence.
+NEGATED = [
+    ("Not young here.", []),
+    ("You do not need to be young.", []),
+    ("We are not looking for a salesman, but a sales lead.", []),
+    ("Not a culture fit thing.", []),
+    ("We do not sponsor visas.", ["nationality/visa bias"]),
+    ("Strong accents are not suitable for this role.", ["language/ESL bias"]),
+]
+
+
+@pytest.fixture(scope="module")
+def model():
+    return train(load_examples(BUILTIN_TRAINING))
+
+
+def _example_ad() -> str:
+    tree = ast.parse(open(APP, encoding="utf-8").read())
+    fn = next(n for n in ast.walk(tree) if isinstance(n, ast.FunctionDef) and n.name == "_insert_example")
+    return ast.literal_eval(fn.body[0].value)
+
+
+def _ngrams(text: str, n: int = 5) -> set:
+    words = re.findall(r"[a-z0-9']+", text.lower().replace("-", " "))
+    return {tuple(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def test_training_rows_are_not_taken_from_the_example_ad():
+    example = _ngrams(_example_ad())
+    assert example
+    copied = [text for text, _ in load_examples(BUILTIN_TRAINING) if _ngrams(text) & example]
+    assert copied == []
+
+
+def test_held_out_sentences(model):
+    for text, expected in HELD_OUT:
+        scores = local_scores(text, model)["categories"]
+        flagged = {cat for cat, p in scores.items() if p >= model.threshold}
+        assert flagged <= set(expected), (text, scores)
+        if expected:
+            assert max(scores, key=scores.get) in expected, (text, scores)
+
+
+def test_numpy_path_matches_pure_python(model, monkeypatch):
+    if not localmodel._HAS_NUMPY:
+        pytest.skip("NumPy is not installed")
+    texts = [_example_ad()] + [text for text, _ in HELD_OUT + NEGATED] + [" ".join(text for text, _ in HELD_OUT), "", "..."]
+    fast = [local_scores(text, model) for text in texts]
+    monkeypatch.setattr(localmodel, "_HAS_NUMPY", False)
+    assert [local_scores(text, model) for text in texts] == fast
+
+
+def test_negated_hits_are_not_flagged(model):
+    for text, expected in NEGATED:
+        scores = local_scores(text, model)["categories"]
+        assert {cat for cat, p in scores.items() if p >= model.threshold} == set(expected), (text, scores)
+    assert "No likely bias found." in explain_locally("Not young here.", {}, model=model)
+
+
+def test_warm_up_loads_the_model_in_the_background(model, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    loads = []
+
+    def _slow_load(path):
+        loads.append(path)
+        started.set()
+        release.wait(5)
+        return model
+
+    monkeypatch.setattr(localmodel, "load_model", _slow_load)
+    monkeypatch.setattr(localmodel, "_MODEL", None)
+    monkeypatch.setattr(localmodel, "_WARM_UP_STARTED", False)
+    localmodel.warm_up()  # Returns while the model is still loading.
+    localmodel.warm_up()
+    assert started.wait(5) and localmodel._MODEL is None
+    release.set()
+    assert localmodel.get_local_model() is model
+    assert loads == [BUILTIN_TRAINING]
@@ -0,0 +1,107 @@
+"""Long-ad mode: sections within the token budget, flagged sentences in context, answers merged in order."""
+import asyncio
+
+import pytest
+
+from biasdetector import longform
+from biasdetector.bulk import explain_many_sync
+from biasdetector.detection import DEFAULT_LEXICON, find_bias_lexicon, find_bias_rules
+from biasdetector.gemini import is_error_message
+from biasdetector.longform import estimate_tokens, explain_sections, plan_sections, split_sentences
+
+FILLER = "Sentence {} describes the daily duties of the role in plain words."
+FLAGGED = {10: "We want a young team.", 20: "The ideal hire is a salesman.", 21: "Must be well-groomed."}
+
+
+def _ad(n: int = 40) -> str:
+    return " ".join(FLAGGED.get(i, FILLER.format(i)) for i in range(n))
+
+
+def _plan(text, **kwargs):
+    lex = find_bias_lexicon(text, DEFAULT_LEXICON)
+    rules = find_bias_rules(text)[0]
+    return plan_sections(text, lex, rules, **kwargs)
+
+
+def test_short_ad_is_sent_whole():
+    text = _ad(5)
+    [section] = _plan(text, budget=1000)
+    assert section.text == text and section.kept == section.total == 5
+
+
+def test_flagged_sentences_and_their_neighbours_are_kept():
+    text = _ad()
+    [section] = _plan(text, budget=400, neighbours=1)
+    assert section.text == (
+        "[… 9 sentences without flagged terms omitted …]\n\n"
+        f"{FILLER.format(9)} {FLAGGED[10]} {FILLER.format(11)}\n\n"
+        "[… 7 sentences without flagged terms omitted …]\n\n"
+        f"{FILLER.format(19)} {FLAGGED[20]} {FLAGGED[21]} {FILLER.format(22)}\n\n"
+        "[… 17 sentences without flagged terms omitted …]"
+    )
+    assert (section.kept, section.total) == (7, 40)
+    assert section.grouped == {"age bias": ["young"], "gender bias": ["salesman"],
+                               "appearance bias": ["well-groomed"]}
+
+    [section] = _plan(text, budget=400, neighbours=0)
+    assert FILLER.format(9) not in section.text and section.kept == 3
+
+
+@pytest.mark.parametrize("budget", [60, 90, 150])
+def test_sections_stay_within_the_budget(budget):
+    text = _ad(120).replace("Sentence 5", "We want a young Sentence 5").replace("Sentence 77", "PR only. Sentence 77")
+    sections = _plan(text, budget=budget, neighbours=3, max_sections=100)
+    assert len(sections) > 1
+    assert all(estimate_tokens(s.text) <= budget for s in sections)
+    # Every kept sentence is in exactly one section, in document order.
+    kept = [sent for s in sections for sent in s.text.split("\n\n") if not sent.startswith("[…")]
+    joined = " ".join(kept)
+    assert joined.index(FLAGGED[10]) < joined.index(FLAGGED[20]) < joined.index("PR only.")
+    assert sum(s.kept for s in sections) == len(split_sentences(joined))
+
+
+def test_too_many_sections_drop_the_neighbours():
+    text = _ad(120)
+    wide = _plan(text, budget=60, neighbours=3, max_sections=100)
+    narrow = _plan(text, budget=60, neighbours=3, max_sections=1)
+    assert sum(s.kept for s in narrow) == 3 < sum(s.kept for s in wide)
+
+
+class SlowFirstClient:
+    """Answers each section with its own text; earlier sections take longer, so they finish last."""
+    model_name = "fake-model"
+
+    def __init__(self, fail=()):
+        self.fail = fail
+
+    async def generate(self, system_prompt, user_prompt, temperature):
+        text = user_prompt.split("## Input text\n", 1)[1]
+        part = int(text.split("Part ", 1)[1].split(".", 1)[0])
+        await asyncio.sleep(0.05 * (4 - part))
+        if part in self.fail:
+            raise ValueError("bad request")
+        return f"answer {part}"
+
+
+def _sections(n):
+    return [longform.Section(f"Part {i}.", {"age bias": ["young"]}, 1, n) for i in range(1, n + 1)]
+
+
+def _explain(monkeypatch, client, sections):
+    monkeypatch.setattr(longform, "explain_many_sync",
+                        lambda items, **kw: explain_many_sync(items, client=client, **kw))
+    return explain_sections(sections, use_cache=False)
+
+
+def test_answers_are_merged_in_document_order(monkeypatch):
+    md = _explain(monkeypatch, SlowFirstClient(), _sections(3))
+    assert md == "\n\n---\n\n".join(f"#### Part {i} of 3\n\nanswer {i}" for i in (1, 2, 3))
+    assert not is_error_message(md)
+
+
+def test_a_failed_section_triggers_the_local_fallback(monkeypatch):
+    md = _explain(monkeypatch, SlowFirstClient(fail=(2,)), _sections(3))
+    assert "answer 1" in md and "answer 3" in md
+    assert "#### Part 2 of 3\n\n⚠️ Gemini call failed for this part: bad request" in md
+    assert is_error_message(md)
+    assert is_error_message(_explain(monkeypatch, SlowFirstClient(fail=(1,)), _sections(1)))
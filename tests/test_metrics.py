@@ -0,0 +1,100 @@
+"""Metrics: Prometheus text output, the derived cache hit ratio, and staying out of the way when off."""
+import socket
+import urllib.request
+
+import pytest
+
+from biasdetector import metrics
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    monkeypatch.setattr(metrics, "REGISTRY", metrics._Registry())
+    return metrics
+
+
+def _lines(prefix: str) -> list:
+    return [line for line in metrics.render().splitlines() if line.startswith(prefix)]
+
+
+def test_counters_and_label_escaping(enabled):
+    metrics.inc("biasdetector_analyses_total")
+    metrics.inc("biasdetector_analyses_total", 2)
+    metrics.inc("biasdetector_gemini_errors_total", error_class='Bad "quote"\\path\nline')
+    text = metrics.render()
+    assert "# HELP biasdetector_analyses_total Analyze runs.\n# TYPE biasdetector_analyses_total counter\n" in text
+    assert "biasdetector_analyses_total 3\n" in text
+    assert 'biasdetector_gemini_errors_total{error_class="Bad \\"quote\\"\\\\path\\nline"} 1\n' in text
+    # Every metric is declared, even before it has a value.
+    assert "# TYPE biasdetector_http_requests_total counter" in text
+
+
+def test_histogram_buckets_are_cumulative(enabled):
+    for seconds in (0.0005, 0.003, 0.003, 0.7, 120.0):
+        metrics.REGISTRY.observe("biasdetector_stage_seconds", (("stage", "detect"),), seconds)
+    buckets = _lines('biasdetector_stage_seconds_bucket{stage="detect"')
+    counts = [int(line.rsplit(" ", 1)[1]) for line in buckets]
+    assert len(buckets) == len(metrics.LATENCY_BUCKETS) + 1
+    assert counts == sorted(counts)
+    assert buckets[0] == 'biasdetector_stage_seconds_bucket{stage="detect",le="0.001"} 1'
+    assert buckets[1] == 'biasdetector_stage_seconds_bucket{stage="detect",le="0.005"} 3'
+    assert buckets[-1] == 'biasdetector_stage_seconds_bucket{stage="detect",le="+Inf"} 5'
+    assert _lines('biasdetector_stage_seconds_count{stage="detect"}') == ['biasdetector_stage_seconds_count{stage="detect"} 5']
+    assert float(_lines("biasdetector_stage_seconds_sum")[0].rsplit(" ", 1)[1]) == pytest.approx(120.7065)
+
+
+def test_stage_records_latency_and_errors(enabled):
+    with metrics.stage("normalize"):
+        pass
+    with pytest.raises(KeyError):
+        with metrics.stage("normalize"):
+            raise KeyError("x")
+    assert _lines('biasdetector_stage_seconds_count{stage="normalize"}')[0].endswith(" 2")
+    assert _lines("biasdetector_stage_errors_total") == [
+        'biasdetector_stage_errors_total{stage="normalize",error_class="KeyError"} 1']
+
+
+def test_cache_hit_ratio(enabled):
+    for hit in (True, True, True, False):
+        metrics.cache_result("gemini_response", hit)
+    metrics.cache_result("phrase", False)
+    assert _lines("biasdetector_cache_hit_ratio{") == [
+        'biasdetector_cache_hit_ratio{cache="gemini_response"} 0.75',
+        'biasdetector_cache_hit_ratio{cache="phrase"} 0',
+    ]
+    assert "# TYPE biasdetector_cache_hit_ratio gauge" in metrics.render()
+
+
+def test_off_by_default(monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", False)
+    monkeypatch.setattr(metrics, "REGISTRY", metrics._Registry())
+    assert metrics.stage("detect") is metrics.stage("other", size=3) is metrics._NULL_STAGE
+    metrics.inc("biasdetector_analyses_total")
+    metrics.cache_result("phrase", True)
+    assert metrics.REGISTRY.snapshot() == ({}, {})
+    assert metrics.start_http_server(port=0) is None
+    assert metrics.start_http_server() is None
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_http_server_starts_once(enabled, monkeypatch):
+    monkeypatch.setattr(metrics, "_SERVER", None)
+    assert metrics.start_http_server(port=0) is None
+    port = _free_port()
+    server = metrics.start_http_server(port=port)
+    try:
+        assert server is not None
+        assert metrics.start_http_server(port=port) is server
+        assert metrics.start_http_server(port=_free_port()) is server
+        metrics.inc("biasdetector_analyses_total")
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as resp:
+            assert "biasdetector_analyses_total 1" in resp.read().decode("utf-8")
+    finally:
+        server.shutdown()
+        server.server_close()
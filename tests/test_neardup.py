@@ -0,0 +1,103 @@
+"""Near-duplicate index: opt-in, no ad text on disk, and results reused only for identical paragraphs."""
+import sqlite3
+
+import pytest
+
+from biasdetector import neardup as neardup_mod
+from biasdetector.incremental import detect_incremental, segment_keys
+from biasdetector.neardup import NearDupIndex, get_neardup_index, jaccard, shingles
+from biasdetector.scan import analyze_document, analyze_with_neardup
+
+AD = "\n\n".join([
+    "Northwind Traders is hiring a sales lead in Springfield, paying $80,000 a year.",
+    "The ideal candidate is a young digital native who thrives in a fast team.",
+    "You will own the quarterly pipeline, report to the regional director and travel now and then.",
+    "We are an equal opportunity employer and welcome applicants of every background.",
+])
+REPOST = AD.replace("Springfield", "Shelbyville").replace("$80,000", "$85,000")
+OTHER = "\n\n".join([
+    "Contoso Bakery needs a pastry chef for early shifts in the old town.",
+    "Experience with sourdough and laminated doughs is a plus for this kitchen role.",
+])
+
+
+@pytest.fixture
+def index(tmp_path):
+    return NearDupIndex(str(tmp_path / "neardup.sqlite3"))
+
+
+def _dump(path) -> str:
+    db = sqlite3.connect(path)
+    return "\n".join(line for line in db.iterdump())
+
+
+def test_off_unless_enabled(tmp_path, monkeypatch):
+    monkeypatch.setenv("BIASDETECTOR_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(neardup_mod, "_INDEX", None)
+    monkeypatch.delenv("BIASDETECTOR_NEARDUP", raising=False)
+    assert get_neardup_index() is None
+    assert not (tmp_path / "neardup.sqlite3").exists()
+    assert get_neardup_index(enabled=True) is not None
+    monkeypatch.setattr(neardup_mod, "_INDEX", None)
+    monkeypatch.setenv("BIASDETECTOR_NEARDUP", "1")
+    assert get_neardup_index() is not None
+
+
+def test_reposted_ad_is_found_without_storing_its_text(index):
+    index.add(AD, ref="ad-1")
+    _, *_, cache = detect_incremental(AD, None)
+    index.save_segment_hits(cache, "v")
+    index.save_segment_explanations({segment_keys(AD)[1]: "Avoid age-coded words."}, 0.3)
+
+    match = index.lookup(REPOST)
+    assert match is not None and match.ref == "ad-1"
+    assert abs(match.similarity - jaccard(shingles(AD), shingles(REPOST))) < 0.15
+    assert index.lookup(OTHER) is None
+    dump = _dump(index.path)
+    for word in ("Northwind", "Springfield", "80,000", "pipeline", "ideal candidate"):
+        assert word not in dump
+
+
+def test_paragraph_results_are_reused_only_for_identical_paragraphs(index):
+    _, *_, cache = detect_incremental(AD, None)
+    index.save_segment_hits(cache, "v")
+    stored = index.segment_hits(segment_keys(REPOST), "v")
+    # Only the first paragraph changed; the second keeps its key while the first one's context differs.
+    assert set(stored) == set(segment_keys(AD)) & set(segment_keys(REPOST))
+    assert len(stored) >= 2
+    assert index.segment_hits(segment_keys(REPOST), "other lexicon") == {}
+    assert index.segment_hits(segment_keys(OTHER), "v") == {}
+
+
+def test_explanation_is_built_from_the_ads_own_paragraphs(index):
+    keys = segment_keys(AD)
+    index.save_segment_explanations({k: f"part {i}" for i, k in enumerate(keys[:-1])}, 0.3)
+    assert index.explanation(AD, 0.3) is None  # The last paragraph was never explained.
+    index.save_segment_explanations({keys[-1]: "part 3"}, 0.3)
+    assert index.explanation(AD, 0.3) == "\n\n---\n\n".join(f"part {i}" for i in range(4))
+    assert index.explanation(AD, 0.7) is None
+    assert index.explanation(REPOST, 0.3) is None
+
+
+def test_analyze_with_neardup_matches_a_full_scan(index, monkeypatch):
+    monkeypatch.delenv("BIASDETECTOR_LEXICON", raising=False)
+    first = analyze_with_neardup(AD, index, ref="ad-1")
+    second = analyze_with_neardup(REPOST, index, ref="ad-2")
+    assert "near_duplicate_of" not in first
+    assert second["near_duplicate_of"] == "ad-1" and second["similarity"] >= index.threshold
+    full = analyze_document(REPOST)
+    assert sorted(map(str, second["hits"])) == sorted(map(str, full["hits"]))
+    assert second["grouped"] == full["grouped"]
+
+
+def test_old_files_with_ad_text_are_emptied(tmp_path):
+    path = str(tmp_path / "old.sqlite3")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE ads (id INTEGER PRIMARY KEY, doc_key TEXT, sig BLOB, ref TEXT,"
+               " text BLOB, payload TEXT, accessed REAL)")
+    db.execute("INSERT INTO ads VALUES (1, 'k', x'00', 'r', 'Northwind Traders', '{}', 0)")
+    db.commit()
+    db.close()
+    index = NearDupIndex(path)
+    assert len(index) == 0
+    assert "Northwind" not in _dump(path)
@@ -0,0 +1,72 @@
+"""Profiles: overlapping runs share tracemalloc, which stops with the last of them."""
+import threading
+import tracemalloc
+
+import pytest
+
+from biasdetector.profiling import Profile, profiling_requested
+from biasdetector.scan import analyze_document
+
+AD = "We want a young, energetic salesman. " * 50
+
+
+@pytest.fixture(autouse=True)
+def _not_tracing():
+    if tracemalloc.is_tracing():
+        pytest.skip("tracemalloc was started outside the test")
+    yield
+    assert not tracemalloc.is_tracing()
+
+
+def test_overlapping_profiles_on_two_threads():
+    first_started, second_started, first_stopped = threading.Event(), threading.Event(), threading.Event()
+    profiles, errors = {}, []
+
+    def _first():
+        with Profile() as profiles["first"]:
+            first_started.set()
+            second_started.wait(5)
+            analyze_document(AD)
+        first_stopped.set()
+
+    def _second():
+        first_started.wait(5)
+        with Profile() as profiles["second"]:
+            second_started.set()
+            first_stopped.wait(5)
+            if not tracemalloc.is_tracing():
+                errors.append("tracing stopped while the second profile was running")
+            analyze_document(AD)
+
+    threads = [threading.Thread(target=_first), threading.Thread(target=_second)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert errors == []
+    for profile in profiles.values():
+        assert profile.seconds > 0 and profile.hot_functions() and profile.allocations()
+
+
+def test_leftover_profile_is_stopped_by_the_next_one():
+    Profile().start()  # A run that raised before stop().
+    profile = Profile().start()
+    assert tracemalloc.is_tracing()
+    profile.stop()
+
+
+def test_tracing_started_elsewhere_is_left_on():
+    tracemalloc.start()
+    try:
+        with Profile():
+            analyze_document(AD)
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_profiling_requested(monkeypatch):
+    monkeypatch.setenv("BIASDETECTOR_PROFILE", "query")
+    assert profiling_requested("1") and not profiling_requested(None)
+    monkeypatch.setenv("BIASDETECTOR_PROFILE", "0")
+    assert not profiling_requested("1")
@@ -0,0 +1,75 @@
+"""Batch scanner: a resumed run writes exactly what an uninterrupted run writes."""
+import json
+
+import pytest
+
+from biasdetector import scan as scan_mod
+from biasdetector.scan import run_scan
+
+ADS = [
+    "We want a young, energetic salesman.",
+    "A friendly team in the city centre.",
+    "Must be a native English speaker with no accent.",
+    "Recent graduates welcome; we work hard, play hard.",
+    "Well-groomed staff only. PR only.",
+]
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    path = tmp_path / "ads.jsonl"
+    path.write_text("".join(json.dumps({"id": f"ad-{n}", "text": ADS[n % len(ADS)] + f" Ref {n}.", "employer": "Acme"})
+                            + "\n" for n in range(37)), encoding="utf-8")
+    return str(path)
+
+
+def _scan(corpus, out, **kwargs):
+    return run_scan(corpus, str(out), workers=1, chunk_size=5, progress=False, local=False,
+                    keep=("employer",), **kwargs)
+
+
+def test_resume_after_a_crash_gives_identical_output(corpus, tmp_path, monkeypatch):
+    assert _scan(corpus, tmp_path / "full.jsonl") == 37
+    expected = (tmp_path / "full.jsonl").read_bytes()
+    lines = expected.decode("utf-8").splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [f"ad-{n}" for n in range(37)]
+    assert json.loads(lines[0])["employer"] == "Acme" and json.loads(lines[0])["grouped"]
+
+    real = scan_mod._scan_chunk
+    calls = []
+
+    def _crash_on_fourth_chunk(*args):
+        calls.append(1)
+        if len(calls) == 4:
+            raise KeyboardInterrupt
+        return real(*args)
+
+    out = tmp_path / "out.jsonl"
+    monkeypatch.setattr(scan_mod, "_scan_chunk", _crash_on_fourth_chunk)
+    with pytest.raises(KeyboardInterrupt):
+        _scan(corpus, out)
+    monkeypatch.setattr(scan_mod, "_scan_chunk", real)
+    assert json.loads((tmp_path / "out.jsonl.ckpt").read_text())["done"] == 15
+    # A chunk cut off half-way by the crash, after the last checkpoint.
+    with open(out, "ab") as fh:
+        fh.write(b'{"id": "ad-15", "hits": [{"categ')
+
+    assert _scan(corpus, out, resume=True) == 37
+    assert out.read_bytes() == expected
+
+
+def test_resume_refuses_a_mismatched_checkpoint(corpus, tmp_path):
+    out = tmp_path / "out.jsonl"
+    _scan(corpus, out)
+    with pytest.raises(ValueError, match="different input"):
+        run_scan(corpus, str(out), text_field="body", workers=1, progress=False, local=False, resume=True)
+    out.write_bytes(out.read_bytes()[:100])
+    with pytest.raises(ValueError, match="shorter than its checkpoint"):
+        _scan(corpus, out, resume=True)
+
+
+def test_worker_pool_keeps_input_order(corpus, tmp_path):
+    _scan(corpus, tmp_path / "one.jsonl")
+    run_scan(corpus, str(tmp_path / "two.jsonl"), workers=2, chunk_size=3, progress=False, local=False,
+             keep=("employer",))
+    assert (tmp_path / "two.jsonl").read_bytes() == (tmp_path / "one.jsonl").read_bytes()
@@ -0,0 +1,107 @@
+"""HTTP service: answers, and a JSON error with the right 4xx status for every malformed request."""
+import http.client
+import json
+import socket
+import threading
+
+import pytest
+
+from biasdetector import server as server_mod
+from biasdetector.server import make_server
+
+AD = "We want a young, energetic salesman."
+
+
+@pytest.fixture
+def port(monkeypatch):
+    monkeypatch.delenv("BIASDETECTOR_LEXICON", raising=False)
+    srv = make_server(port=0)
+    thread = threading.Thread(target=srv.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield srv.server_address[1]
+    srv.shutdown()
+    srv.server_close()
+
+
+def _request(conn, method, path, body=None):
+    data = body if body is None or isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+    conn.request(method, path, body=data, headers={"Content-Type": "application/json"})
+    resp = conn.getresponse()
+    return resp.status, resp.getheader("Connection"), json.loads(resp.read())
+
+
+def test_analyze_and_batch(port):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    status, _, body = _request(conn, "GET", "/health")
+    assert status == 200 and body["status"] == "ok"
+    status, _, body = _request(conn, "POST", "/analyze", {"text": AD, "id": 7, "html": True})
+    assert status == 200 and body["id"] == 7 and "<mark" in body["html"]
+    assert sorted(body["grouped"]) == ["age bias", "gender bias"]
+    status, _, body = _request(conn, "POST", "/analyze/batch",
+                               {"ads": [AD, {"id": "b", "text": "A kind team.", "html": False}], "html": True})
+    assert status == 200
+    first, second = body["results"]
+    assert "html" in first and "id" not in first
+    assert second["id"] == "b" and "html" not in second and second["hits"] == []
+
+
+@pytest.mark.parametrize("method, path, body, status", [
+    ("POST", "/analyze", b"{bad", 400),
+    ("POST", "/analyze", {"text": 5}, 400),
+    ("POST", "/analyze", ["not", "an", "object"], 400),
+    ("POST", "/analyze", {"text": "x", "html": "yes"}, 400),
+    ("POST", "/analyze/batch", {"ads": "one ad"}, 400),
+    ("POST", "/analyze/batch", {"ads": [AD, 3]}, 400),
+    ("POST", "/analyze/batch", {"ads": [AD], "local": 1}, 400),
+    ("GET", "/analyze", None, 405),
+    ("GET", "/nope", None, 404),
+])
+def test_bad_requests_keep_the_connection(port, method, path, body, status):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    got, connection, answer = _request(conn, method, path, body)
+    assert got == status and answer["error"]
+    assert connection != "close"
+    assert _request(conn, "POST", "/analyze", {"text": AD})[0] == 200
+
+
+def test_unknown_endpoint_closes_the_connection(port):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    status, connection, answer = _request(conn, "POST", "/nope", {"text": AD})
+    assert (status, connection) == (404, "close") and "/nope" in answer["error"]
+
+
+def _raw(port, head: bytes) -> tuple:
+    # Sends a bare request head and returns the answer's (head, body) once the server closes.
+    with socket.create_connection(("127.0.0.1", port), timeout=10) as sock:
+        sock.sendall(head)
+        chunks = []
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                head, _, body = b"".join(chunks).partition(b"\r\n\r\n")
+                return head, body
+            chunks.append(data)
+
+
+def test_too_large_requests(port, monkeypatch):
+    monkeypatch.setattr(server_mod, "MAX_BATCH", 2)
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    status, connection, answer = _request(conn, "POST", "/analyze/batch", {"ads": [AD] * 3})
+    assert status == 413 and "limit is 2" in answer["error"] and connection != "close"
+
+    # Refused from the headers alone, before any of the body is read.
+    monkeypatch.setattr(server_mod, "MAX_BODY_BYTES", 1024 * 1024)
+    head, body = _raw(port, b"POST /analyze HTTP/1.1\r\nHost: x\r\nContent-Length: 1048577\r\n\r\n")
+    assert head.startswith(b"HTTP/1.1 413") and b"Connection: close" in head
+    assert "1 MB" in json.loads(body)["error"]
+
+
+@pytest.mark.parametrize("headers", [
+    b"",
+    b"Content-Length: many\r\n",
+    b"Transfer-Encoding: chunked\r\n",
+])
+def test_body_without_a_length_is_refused(port, headers):
+    head, body = _raw(port, b"POST /analyze HTTP/1.1\r\nHost: x\r\n" + headers + b"\r\n")
+    assert head.startswith(b"HTTP/1.1 411") and b"Connection: close" in head
+    assert "Content-Length" in json.loads(body)["error"]
@@ -0,0 +1,76 @@
+"""Streaming scanner: every window size and piece size reports exactly the hits of a whole-text scan."""
+import collections
+import random
+
+import pytest
+
+from benchmarks.corpus import generate_ad
+from biasdetector.detection import DEFAULT_LEXICON, _normalize_hyphens, find_bias_lexicon, find_bias_rules
+from biasdetector.stream import iter_hits, scan_file
+
+SEPARATOR = "\n----\n"
+
+
+def _ads() -> list:
+    rng = random.Random(3)
+    ads = [generate_ad(rng.choice([80, 300, 1500, 5000]), eoe=(i % 4 == 0), seed=i) for i in range(60)]
+    # Hits right at ad edges, and an EOE sentence far longer than a small window.
+    ads[5] = "not\n" + ads[5]
+    ads[7] = ads[7] + " young"
+    ads[8] = "young " + ads[8]
+    ads[9] = (ads[9] + " We are an equal opportunity employer of young and old salesman staff alike, "
+              + "x " * 400 + "young.\nYoung team")
+    return ads
+
+
+def _pieces(text: str, longest: int, seed: int = 0):
+    rng = random.Random(seed)
+    i = 0
+    while i < len(text):
+        k = rng.randint(1, longest)
+        yield text[i:i + k]
+        i += k
+
+
+def _key(h):
+    return (h.category, h.type, h.term, h.start, h.end)
+
+
+def _expected_per_ad(ads) -> collections.Counter:
+    expected, start = collections.Counter(), 0
+    for n, ad in enumerate(ads):
+        text = _normalize_hyphens(ad)
+        for h in find_bias_lexicon(text, DEFAULT_LEXICON) + find_bias_rules(text)[0]:
+            expected[(n,) + _key(h.shifted(start))] += 1
+        start += len(ad) + len(SEPARATOR)
+    return expected
+
+
+@pytest.mark.parametrize("window", [1, 50, 700, 1 << 20])
+@pytest.mark.parametrize("longest_piece", [40, 100_000])
+def test_separated_ads_match_scanning_each_ad(window, longest_piece):
+    ads = _ads()
+    stream = iter_hits(_pieces(SEPARATOR.join(ads), longest_piece), separator=r"\n-{4}\n", window_chars=window)
+    assert collections.Counter((n,) + _key(h) for n, h in stream) == _expected_per_ad(ads)
+
+
+@pytest.mark.parametrize("whitelist", [True, False])
+@pytest.mark.parametrize("window", [1, 333, 1 << 20])
+def test_one_stream_matches_a_whole_text_scan(whitelist, window):
+    whole = SEPARATOR.join(_ads())
+    text = _normalize_hyphens(whole)
+    expected = collections.Counter(
+        (0,) + _key(h) for h in find_bias_lexicon(text, DEFAULT_LEXICON) + find_bias_rules(text, whitelist=whitelist)[0]
+    )
+    got = collections.Counter((n,) + _key(h) for n, h in
+                              iter_hits(_pieces(whole, 500), window_chars=window, whitelist=whitelist))
+    assert got == expected
+
+
+def test_scan_file_decodes_across_chunk_edges(tmp_path):
+    ads = [ad.replace("team", "équipe ✓ team") for ad in _ads()[:20]]
+    path = tmp_path / "ads.txt"
+    path.write_text(SEPARATOR.join(ads), encoding="utf-8")
+    got = collections.Counter((n,) + _key(h) for n, h in
+                              scan_file(str(path), separator=r"\n-{4}\n", window_chars=200, chunk_bytes=61))
+    assert got == _expected_per_ad(ads)
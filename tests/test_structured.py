@@ -0,0 +1,82 @@
+"""Structured answers: categories limited to the active lexicon, phrase-cache metrics only with a cache."""
+import json
+
+import pytest
+
+from biasdetector import structured
+from biasdetector.detection import DEFAULT_LEXICON, find_bias_lexicon, find_bias_rules
+from biasdetector.structured import explain_structured, lexicon_categories, response_schema
+
+TEXT = "We want a young salesman with no family commitments."
+LEXICON = {"caregiver bias": {"phrases": ["no family commitments"]}, "age bias": {"phrases": ["young"]}}
+
+
+class FakeResolver:
+    def get_model(self):
+        return "fake-model", object()
+
+    def mark_success(self, name):
+        pass
+
+
+@pytest.fixture
+def gemini(tmp_path, monkeypatch):
+    # Records the config of every request and answers with one item per listed term.
+    monkeypatch.setenv("BIASDETECTOR_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(structured, "_PHRASE_CACHE", None)
+    monkeypatch.setattr(structured, "_RESOLVER", FakeResolver())
+    configs = []
+
+    def _call(name, model, contents, config):
+        configs.append(config)
+        listed = contents[0]["parts"][1]["text"].split("## Terms to explain\n")[1].split("\n\n")[0]
+        items = [{"category": line[2:].split(": ")[0], "term": line[2:].split(": ")[1],
+                  "reason": "Excludes people.", "rewrite": "motivated"} for line in listed.splitlines()]
+        yield json.dumps({"items": items, "neutral_rewrite": ""})
+
+    monkeypatch.setattr(structured, "_call_gemini", _call)
+    return configs
+
+
+def _hits(text, lexicon=DEFAULT_LEXICON):
+    return find_bias_lexicon(text, lexicon) + find_bias_rules(text, lexicon=lexicon)[0]
+
+
+def _categories(config):
+    return config["response_schema"]["properties"]["items"]["items"]["properties"]["category"]["enum"]
+
+
+def test_schema_categories_come_from_the_lexicon(gemini):
+    assert _categories({"response_schema": response_schema(lexicon_categories())}) == lexicon_categories()
+    explain_structured(TEXT, _hits(TEXT))
+    assert _categories(gemini[-1]) == lexicon_categories()
+    assert "caregiver bias" not in lexicon_categories()
+
+    result = explain_structured(TEXT, _hits(TEXT, LEXICON), lexicon=LEXICON)
+    enum = _categories(gemini[-1])
+    assert "caregiver bias" in enum and enum == sorted(enum)
+    assert {it["category"] for it in result.items} <= set(enum)
+
+
+def test_phrase_metric_is_skipped_without_a_phrase_cache(gemini, monkeypatch):
+    counted = []
+    monkeypatch.setattr(structured.metrics, "cache_result", lambda cache, hit: counted.append((cache, hit)))
+    explain_structured(TEXT, _hits(TEXT))
+    assert ("phrase", False) in counted
+    counted.clear()
+    explain_structured(TEXT, _hits(TEXT))
+    assert ("phrase", True) in counted and ("phrase", False) not in counted
+
+    counted.clear()
+    explain_structured(TEXT, _hits(TEXT), use_cache=False)
+    monkeypatch.setenv("GEMINI_CACHE", "0")
+    explain_structured(TEXT, _hits(TEXT))
+    assert not [c for c in counted if c[0] == "phrase"]
+
+
+def test_terms_found_by_gemini_are_replaced_as_whole_words():
+    text = "Great benefits for a fit team. İstanbul office, fit people."
+    spans = structured._find_spans(text, "fit")
+    assert [text[s:e] for s, e in spans] == ["fit", "fit"]
+    assert structured.apply_rewrites(text, [{"rewrite": "capable", "spans": spans}]) == (
+        "Great benefits for a capable team. İstanbul office, capable people.")
@@ -0,0 +1,109 @@
+"""Word variants of lexicon phrases: what they match, what they leave alone, and the one-pass walk."""
+import random
+
+import pytest
+
+from benchmarks.corpus import bias_terms
+from biasdetector.detection import (
+    _GAP_RE,
+    _TOKEN_RE,
+    DEFAULT_LEXICON,
+    RULES,
+    _MatchEngine,
+    _stem,
+    find_bias_lexicon,
+)
+
+VARIANTS = ["Salesmen", "salesmen's", "recent grads", "Recent Graduates", "new grads", "well groomed",
+            "WellGroomed", "well-presented", "Youthful", "youngsters", "work hard, play hard",
+            "Work-hard/play-hard", "culture-fit", "digital natives"]
+
+
+def _variants(text, lexicon=DEFAULT_LEXICON):
+    return [(h.category, h.term) for h in find_bias_lexicon(text, lexicon) if h.type == "variant"]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Salesmen wanted.", [("gender bias", "Salesmen")]),
+    ("Recent grads welcome", [("age bias", "Recent grads")]),
+    ("A well groomed host.", [("appearance bias", "well groomed")]),
+    ("A WellGroomed host.", [("appearance bias", "WellGroomed")]),
+    ("We work hard, play hard!", [("cultural fit exclusion", "work hard, play hard")]),
+    ("Youthful team", [("age bias", "Youthful")]),
+])
+def test_variants_are_reported_as_written(text, expected):
+    assert _variants(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "A young salesman.",  # Exact matches only.
+    "Ideal for new graduates.",  # The exact "new grad" inside it is reported instead.
+    "The chairmen met.",
+    "Sales managers wanted.",
+    "A well-known brand.",
+    "Work hard. Play hard.",  # A full stop is not a gap inside a phrase.
+    "Recent, relevant graduate experience.",
+    "Recent graders wanted.",  # Not "recent grads".
+    "Read the news grad program.",  # Not "new grad".
+    "News, grads and more.",
+    "A recent grading change.",
+])
+def test_no_variant_hit(text):
+    assert _variants(text) == []
+
+
+def test_stems_keep_unrelated_words_apart():
+    assert {_stem(w) for w in ["grads", "graduates", "graduated"]} == {"grad"}
+    assert _stem("graders") != "grad" and _stem("grading") != "grad"
+    assert _stem("news") == "news" and _stem("grads") == "grad"
+    assert _stem("younger") == _stem("youngsters") == "young"
+
+
+def test_exact_hit_of_the_same_category_wins():
+    hits = find_bias_lexicon("We want a young, well-groomed salesman.", DEFAULT_LEXICON)
+    assert sorted(h.type for h in hits) == ["phrase", "phrase", "phrase"]
+    assert not [h for h in find_bias_lexicon("Salesmen.", DEFAULT_LEXICON, variants=False)]
+
+
+def test_pack_phrases_get_variants_too():
+    lexicon = {"caregiver bias": {"phrases": ["live-in nanny"]}}
+    assert _variants("Live in nannies wanted.", lexicon) == [("caregiver bias", "Live in nannies")]
+
+
+def test_index_keeps_the_token_trie():
+    engine = _MatchEngine.from_index(_MatchEngine(RULES, DEFAULT_LEXICON).to_index())
+    text = "Salesmen and recent grads who are well groomed."
+    assert engine.token_matches(text) == _MatchEngine(RULES, DEFAULT_LEXICON).token_matches(text)
+
+
+def _reference(engine: _MatchEngine, text: str) -> list:
+    # Walks the trie from every word of the text, with no prefix scan.
+    out = []
+    for tok in _TOKEN_RE.finditer(text):
+        p, word = tok.start(), tok.group().lower()
+        node = engine.token_trie.get(_stem(word))
+        if node is None or (len(node) == 1 and "" in node and all(ph.lower() == word for _, ph in node[""])):
+            continue
+        while node is not None:
+            for cat, phrase in node.get("", []):
+                out.append((p, tok.end(), cat, phrase))
+            if node.get("") and len(node) == 1:
+                break
+            nxt = _TOKEN_RE.search(text, tok.end())
+            if nxt is None or not _GAP_RE.fullmatch(text, tok.end(), nxt.start()):
+                break
+            tok = nxt
+            node = node.get(_stem(tok.group().lower()))
+    return out
+
+
+def test_one_pass_walk_matches_walking_from_every_word():
+    rng = random.Random(5)
+    engine = _MatchEngine(RULES, DEFAULT_LEXICON)
+    words = bias_terms(rng) + VARIANTS + ["the", "team", "and", ",", ".", "-", "/", "_", "İ", "x", "un"]
+    for _ in range(1500):
+        joiner = rng.choice([" ", " ", "", ", "])
+        text = joiner.join(rng.choice(words) for _ in range(rng.randint(0, 30)))
+        if rng.random() < 0.3:
+            text = text.upper()
+        assert engine.token_matches(text) == _reference(engine, text), text